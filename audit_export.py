@@ -0,0 +1,66 @@
+# audit_export.py
+"""Query and export the admin audit log.
+
+Streams matching admin_audit_log rows, oldest first, as JSON lines or CSV to
+stdout or a file (gzip-compressed when the name ends in .gz).
+
+Usage: python audit_export.py --actor admin@example.com --since 2026-01-01 \
+           --format csv --output audit-2026.csv.gz
+"""
+import argparse
+import csv
+import gzip
+import json
+import sys
+from contextlib import nullcontext
+from datetime import datetime, timezone
+
+from docu_serve import audit
+from docu_serve.database import engine
+from sqlalchemy.orm import Session
+
+FIELDS = ("at", "actor", "action", "user_id", "source", "changes", "record_id")
+
+
+def _timestamp(value: str) -> datetime:
+    parsed = datetime.fromisoformat(value)
+    return parsed if parsed.tzinfo is not None else parsed.replace(tzinfo=timezone.utc)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--actor", help="admin email")
+    parser.add_argument("--user-id", type=int)
+    parser.add_argument("--action", choices=["user.deleted", "user.updated"])
+    parser.add_argument("--since", type=_timestamp, help="ISO date/time, inclusive (UTC unless given)")
+    parser.add_argument("--until", type=_timestamp, help="ISO date/time, exclusive")
+    parser.add_argument("--format", choices=["jsonl", "csv"], default="jsonl")
+    parser.add_argument("--output", help="file to write (.gz to compress); default stdout")
+    args = parser.parse_args()
+
+    statement = audit.query(args.actor, args.user_id, args.action, args.since, args.until)
+    if args.output is None:
+        target = nullcontext(sys.stdout)
+    elif args.output.endswith(".gz"):
+        target = gzip.open(args.output, "wt", newline="")
+    else:
+        target = open(args.output, "w", newline="")
+
+    count = 0
+    # The audit table lives on the primary even when users_admin is sharded
+    with Session(engine) as db, target as out:
+        rows = db.execute(statement.execution_options(yield_per=1000)).scalars()
+        writer = csv.DictWriter(out, FIELDS) if args.format == "csv" else None
+        if writer is not None:
+            writer.writeheader()
+        for row in audit.export_rows(rows):
+            if writer is not None:
+                writer.writerow({**row, "changes": json.dumps(row["changes"]) if row["changes"] is not None else ""})
+            else:
+                out.write(json.dumps(row) + "\n")
+            count += 1
+    print(f"{count} audit records exported", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+# benchmarks/bench_events.py
+"""Micro-benchmark of event encode / decode / validate per event type.
+
+Compares the docu_serve.events codec against the previous stdlib
+json.dumps / json.loads path (which did no validation).
+
+Usage: python benchmarks/bench_events.py [--number N] [--json]
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from docu_serve import events  # noqa: E402
+
+PAYLOADS = {
+    "user.created": {"user_id": 123456, "name": "Bench User", "email": "bench@example.com",
+                     "age": 42, "hashed_password": "$2b$12$" + "x" * 53, "role": "user"},
+    "user.updated": {"user_id": 123456, "name": "Bench User", "email": "bench@example.com",
+                     "age": 42, "role": "admin"},
+    "user.deleted": {"user_id": 123456, "email": "bench@example.com"},
+}
+
+
+def _per_call_us(stmt, number):
+    # Best of 5 repeats, in microseconds per call
+    return min(timeit.repeat(stmt, number=number, repeat=5)) / number * 1e6
+
+
+def run(number: int) -> dict:
+    content_types = [events.JSON_CONTENT_TYPE]
+    if events.msgpack is not None:
+        content_types.append(events.MSGPACK_CONTENT_TYPE)
+
+    results = {"msgpack": events.msgpack is not None, "events": {}}
+    for event_type, payload in PAYLOADS.items():
+        row = {}
+        stdlib_body = json.dumps(payload).encode()
+        row["stdlib_encode_us"] = _per_call_us(lambda: json.dumps(payload).encode(), number)
+        row["stdlib_decode_us"] = _per_call_us(lambda: json.loads(stdlib_body.decode()), number)
+
+        model = events.EVENT_MODELS[event_type]
+        row["validate_us"] = _per_call_us(lambda: model.model_validate(payload), number)
+        for content_type in content_types:
+            key = content_type.split("/")[1]
+            body, _ = events.encode_event(event_type, payload, content_type)
+            row[f"{key}_encode_us"] = _per_call_us(
+                lambda: events.encode_event(event_type, payload, content_type), number)
+            row[f"{key}_decode_validate_us"] = _per_call_us(
+                lambda: events.decode_event(event_type, body, content_type), number)
+            row[f"{key}_bytes"] = len(body)
+        results["events"][event_type] = row
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--number", type=int, default=20000, help="calls per timing repeat")
+    parser.add_argument("--json", action="store_true", help="print raw JSON instead of a table")
+    args = parser.parse_args()
+
+    results = run(args.number)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"msgpack available: {results['msgpack']}")
+    for event_type, row in results["events"].items():
+        print(f"\n{event_type}")
+        for key, value in row.items():
+            unit = "" if key.endswith("_bytes") else " us"
+            print(f"  {key:<28} {value:>10.2f}{unit}" if unit else f"  {key:<28} {value:>10}")
+
+
+if __name__ == "__main__":
+    main()
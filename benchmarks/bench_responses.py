@@ -0,0 +1,117 @@
+# benchmarks/bench_responses.py
+"""Per-request CPU cost of response serialization, old path vs fast path.
+
+Old path: the endpoint returns a dict / validated model and FastAPI runs
+serialize_response (validate against response_model, including EmailStr,
+then jsonable_encoder) followed by JSONResponse (json.dumps).
+Fast path: model_construct() + FastJSONResponse, with no validation.
+
+Usage: python benchmarks/bench_responses.py [--number N] [--json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SECRET_KEY", "bench-secret-key")
+os.environ.setdefault("DATABASE_URL", "sqlite:///:memory:")
+
+from fastapi.responses import JSONResponse  # noqa: E402
+from fastapi.routing import APIRoute, serialize_response  # noqa: E402
+
+from docu_serve.main import app  # noqa: E402
+from docu_serve.responses import FastJSONResponse  # noqa: E402
+from docu_serve.schemas import DeleteResponse, DeletedUserSummary, UserOut  # noqa: E402
+
+USER = {"user_id": 123456, "name": "Bench User", "email": "bench.user@example.com", "age": 42, "role": "user"}
+
+
+def _response_field(path: str, method: str):
+    for route in app.routes:
+        if isinstance(route, APIRoute) and route.path == path and method in route.methods:
+            return route.response_field
+    raise LookupError(path)
+
+
+async def _old_patch(field):
+    content = await serialize_response(field=field, response_content=dict(USER))
+    return JSONResponse(content).body
+
+
+async def _old_delete(field):
+    # The endpoint validated once to build the model, then FastAPI validated it again
+    model = DeleteResponse(
+        message=f"User {USER['email']} deleted by admin admin@example.com",
+        deleted=DeletedUserSummary(user_id=USER["user_id"], email=USER["email"])
+    )
+    content = await serialize_response(field=field, response_content=model)
+    return JSONResponse(content).body
+
+
+def _fast_patch():
+    return FastJSONResponse(UserOut.model_construct(**USER)).body
+
+
+def _fast_delete():
+    return FastJSONResponse(DeleteResponse.model_construct(
+        message=f"User {USER['email']} deleted by admin admin@example.com",
+        deleted=DeletedUserSummary.model_construct(user_id=USER["user_id"], email=USER["email"])
+    )).body
+
+
+def _per_call_us(fn, number):
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number * 1e6
+
+
+def _per_call_us_async(coro_fn, number):
+    # serialize_response is a coroutine; time it inside one running loop
+    async def runner():
+        best = float("inf")
+        for _ in range(5):
+            start = time.perf_counter()
+            for _ in range(number):
+                await coro_fn()
+            best = min(best, time.perf_counter() - start)
+        return best
+    return asyncio.run(runner()) / number * 1e6
+
+
+def run(number: int) -> dict:
+    patch_field = _response_field("/api/admin/users/{user_id}", "PATCH")
+    delete_field = _response_field("/api/admin/delete/{user_id}", "DELETE")
+    assert json.loads(asyncio.run(_old_patch(patch_field))) == json.loads(_fast_patch())
+    assert json.loads(asyncio.run(_old_delete(delete_field))) == json.loads(_fast_delete())
+
+    results = {}
+    for name, old, fast in (
+        ("patch_user", lambda: _old_patch(patch_field), _fast_patch),
+        ("delete_user", lambda: _old_delete(delete_field), _fast_delete),
+    ):
+        old_us = _per_call_us_async(old, number)
+        fast_us = _per_call_us(fast, number)
+        results[name] = {"old_us": round(old_us, 2), "fast_us": round(fast_us, 2),
+                         "saved_us": round(old_us - fast_us, 2), "speedup": round(old_us / fast_us, 2)}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--number", type=int, default=5000)
+    parser.add_argument("--json", action="store_true", help="print raw JSON instead of a table")
+    args = parser.parse_args()
+
+    results = run(args.number)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for name, row in results.items():
+        print(f"{name:<12} old {row['old_us']:>7.2f} us   fast {row['fast_us']:>6.2f} us   "
+              f"saved {row['saved_us']:>6.2f} us/request ({row['speedup']}x)")
+
+
+if __name__ == "__main__":
+    main()
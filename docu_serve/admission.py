@@ -0,0 +1,146 @@
+# docu_serve/admission.py
+"""Admission control for the admin routes.
+
+Two independent gates, both non-blocking so an overloaded service sheds load
+immediately instead of queueing requests against the DB pool and broker:
+
+  * a token bucket per admin (keyed on the JWT `sub`), over limit -> 429
+  * a concurrency limit on in-flight admin requests, over limit -> 503
+
+Both answers carry Retry-After. Buckets live in process memory by default;
+ADMISSION_BACKEND=redis shares them across gunicorn workers and hosts. The
+concurrency limit is always per process (total = workers x limit). If Redis
+is unreachable the buckets fail open: requests are admitted, and the errors
+are logged and counted.
+"""
+import logging
+import math
+import os
+import time
+from collections import OrderedDict
+
+ADMIN_RATE_LIMIT = float(os.getenv("ADMIN_RATE_LIMIT", "10"))  # tokens per second per admin, 0 = off
+ADMIN_RATE_BURST = int(os.getenv("ADMIN_RATE_BURST", "20"))
+ADMIN_MAX_CONCURRENCY = int(os.getenv("ADMIN_MAX_CONCURRENCY", "32"))  # 0 = off
+ADMISSION_BACKEND = os.getenv("ADMISSION_BACKEND", "memory").lower()
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+# Retry-After for 503s, the time we expect an in-flight request to need
+CONCURRENCY_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", "1"))
+# Redis failures are logged on the first and then every this many
+REDIS_ERROR_LOG_EVERY = 100
+
+logger = logging.getLogger(__name__)
+
+
+class InMemoryTokenBuckets:
+    """Token buckets in this process, LRU-bounded so unknown subs can't grow memory forever"""
+
+    def __init__(self, rate: float, burst: int, max_keys: int = 10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+
+    async def acquire(self, key: str) -> float:
+        """Take a token; returns 0 when admitted, else seconds until one is available"""
+        now = time.monotonic()
+        tokens, last = self._buckets.pop(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - last) * self.rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / self.rate
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return wait
+
+
+# Same refill/take logic as InMemoryTokenBuckets, run atomically inside Redis
+_TOKEN_BUCKET_LUA = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local data = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(data[1]) or burst
+local ts = tonumber(data[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+
+class RedisTokenBuckets:
+    """Token buckets shared across workers through Redis (optional `redis` package)"""
+
+    def __init__(self, rate: float, burst: int, url: str = REDIS_URL, prefix: str = "admission:"):
+        try:
+            import redis.asyncio as redis_asyncio
+            from redis.exceptions import RedisError
+        except ImportError as e:
+            raise RuntimeError("ADMISSION_BACKEND=redis requires the 'redis' package") from e
+        self.rate = rate
+        self.burst = burst
+        self.prefix = prefix
+        # Calls that failed open because Redis was unreachable or erroring
+        self.errors = 0
+        self._error_types = (RedisError, OSError)
+        self._client = redis_asyncio.from_url(url)
+        self._script = self._client.register_script(_TOKEN_BUCKET_LUA)
+
+    async def acquire(self, key: str) -> float:
+        try:
+            wait = await self._script(keys=[self.prefix + key], args=[self.rate, self.burst, time.time()])
+        except self._error_types as e:
+            # Rate limiting is protection, not correctness; an outage mustn't fail every admin write
+            self.errors += 1
+            if self.errors % REDIS_ERROR_LOG_EVERY == 1:
+                logger.warning(f"Redis rate limiter unavailable, admitting requests: {e}",
+                               extra={"errors": self.errors})
+            return 0.0
+        return float(wait)
+
+
+class ConcurrencyLimiter:
+    """Counts in-flight requests; try_acquire never waits"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_flight = 0
+
+    def try_acquire(self) -> bool:
+        if self.limit and self.in_flight >= self.limit:
+            return False
+        self.in_flight += 1
+        return True
+
+    def release(self):
+        self.in_flight -= 1
+
+
+class AdmissionController:
+    def __init__(self, rate: float = ADMIN_RATE_LIMIT, burst: int = ADMIN_RATE_BURST,
+                 max_concurrency: int = ADMIN_MAX_CONCURRENCY, backend: str = ADMISSION_BACKEND):
+        self.rate = rate
+        if rate <= 0:
+            self.buckets = None
+        elif backend == "redis":
+            self.buckets = RedisTokenBuckets(rate, burst)
+        else:
+            self.buckets = InMemoryTokenBuckets(rate, burst)
+        self.limiter = ConcurrencyLimiter(max_concurrency)
+
+    async def rate_limit(self, key: str) -> int:
+        """0 if the caller may proceed, else the Retry-After in whole seconds"""
+        if self.buckets is None:
+            return 0
+        wait = await self.buckets.acquire(key)
+        return math.ceil(wait) if wait > 0 else 0
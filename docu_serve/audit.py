@@ -0,0 +1,283 @@
+# docu_serve/audit.py
+"""Append-only audit log of admin actions.
+
+Every user deleted or patched, whether through the single-user routes, a
+bulk stream or a deletion job, becomes one admin_audit_log row: who, when,
+which user, and the deleted email or the new values of the changed fields.
+Writing that row inside each request would double its SQL cost. Instead,
+record() appends to an in-memory buffer, and a background task inserts the
+buffer in batches (one executemany per AUDIT_BATCH_SIZE rows) every
+AUDIT_FLUSH_INTERVAL seconds, or sooner once a batch is full.
+
+The buffer holds at most AUDIT_BUFFER_MAX records. A request that finds it
+full waits for a flush. If the database is down too, the record is dropped
+from memory and counted.
+
+Crash safety: with AUDIT_SPOOL_DIR set, each record is also written (one
+write(), fsync'd if AUDIT_SPOOL_FSYNC) to a spool file before record()
+returns. The spool is rotated at every flush and deleted once its records
+are committed. Each process holds an flock on the spool files it owns. A
+starting process replays spool files whose owner is gone, skipping
+record_ids already in the table, so records lost with a crashed process's
+buffer (or dropped from a full one) still reach the table.
+
+audit_export.py queries and exports the table.
+"""
+import asyncio
+import fcntl
+import glob
+import json
+import logging
+import os
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Iterable, List, Optional
+
+from sqlalchemy import insert, select
+
+from docu_serve.models import AuditRecord
+
+logger = logging.getLogger(__name__)
+
+AUDIT_ENABLED = os.getenv("AUDIT_ENABLED", "true").lower() == "true"
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "500"))
+AUDIT_FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_INTERVAL", "1"))
+AUDIT_BUFFER_MAX = int(os.getenv("AUDIT_BUFFER_MAX", "10000"))
+AUDIT_SPOOL_DIR = os.getenv("AUDIT_SPOOL_DIR") or None
+AUDIT_SPOOL_FSYNC = os.getenv("AUDIT_SPOOL_FSYNC", "false").lower() == "true"
+
+COLUMNS = ("record_id", "at", "actor", "action", "user_id", "source", "changes")
+
+
+def make_record(actor: str, action: str, user_id: int, changes: Optional[dict] = None, source: str = "api") -> dict:
+    return {
+        "record_id": uuid.uuid4().hex,
+        "at": time.time(),
+        "actor": actor,
+        "action": action,
+        "user_id": user_id,
+        "source": source,
+        "changes": json.dumps(changes, default=str) if changes is not None else None,
+    }
+
+
+class _Spool:
+    """One spool file, flock'd by the process writing it"""
+
+    __slots__ = ("path", "fd", "keep")
+
+    def __init__(self, directory: str):
+        self.path = os.path.join(directory, f"audit-{os.getpid()}-{uuid.uuid4().hex[:8]}.jsonl")
+        self.fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+        fcntl.flock(self.fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        # Holds records no longer in the buffer; left for replay rather than deleted
+        self.keep = False
+
+    def write(self, records: List[dict], fsync: bool):
+        os.write(self.fd, "".join(json.dumps(record) + "\n" for record in records).encode())
+        if fsync:
+            os.fsync(self.fd)
+
+    def close(self, delete: bool):
+        if delete:
+            os.unlink(self.path)
+        os.close(self.fd)
+
+
+def _read_spool(path: str) -> List[dict]:
+    records = []
+    with open(path, "rb") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # The last line of a crashed writer can be cut short
+                continue
+            records.append({column: record.get(column) for column in COLUMNS})
+    return records
+
+
+class AuditLog:
+    """Buffers audit records and inserts them in batches"""
+
+    def __init__(self, session_factory, batch_size: int = AUDIT_BATCH_SIZE,
+                 flush_interval: float = AUDIT_FLUSH_INTERVAL, max_buffer: int = AUDIT_BUFFER_MAX,
+                 spool_dir: Optional[str] = AUDIT_SPOOL_DIR, spool_fsync: bool = AUDIT_SPOOL_FSYNC,
+                 enabled: bool = True):
+        self.session_factory = session_factory
+        self.enabled = enabled
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.spool_dir = spool_dir
+        self.spool_fsync = spool_fsync
+        self.flushed = 0
+        self.dropped = 0
+        self._buffer: List[dict] = []
+        # Spool files rotated out but not yet committed, oldest first, then the one being written
+        self._sealed: List[_Spool] = []
+        self._spool: Optional[_Spool] = None
+        self._lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def buffered(self) -> int:
+        return len(self._buffer)
+
+    async def record(self, actor: str, action: str, user_id: int, changes: Optional[dict] = None,
+                     source: str = "api"):
+        await self.record_many([make_record(actor, action, user_id, changes, source)])
+
+    async def record_many(self, records: List[dict]):
+        """Buffer records (and spool them first, if enabled); waits for a flush when the buffer is full"""
+        if not records or not self.enabled:
+            return
+        if len(self._buffer) + len(records) > self.max_buffer:
+            await self.flush()
+        # Spooled after that flush, which rotates the spool and deletes it once its batch commits
+        if self.spool_dir is not None:
+            if self._spool is None:
+                self._spool = _Spool(self.spool_dir)
+            self._spool.write(records, self.spool_fsync)
+        room = self.max_buffer - len(self._buffer)
+        if room < len(records):
+            # Still full, so the database is failing; spooled copies are replayed on a later start
+            self.dropped += len(records) - room
+            logger.error(f"Audit buffer full, {len(records) - room} records not buffered")
+            if self._spool is not None:
+                self._spool.keep = True
+            records = records[:room]
+        self._buffer.extend(records)
+        if len(self._buffer) >= self.batch_size:
+            self._wakeup.set()
+
+    def _insert(self, records: List[dict]):
+        with self.session_factory() as db:
+            for start in range(0, len(records), self.batch_size):
+                db.execute(insert(AuditRecord), records[start:start + self.batch_size])
+            db.commit()
+
+    async def flush(self) -> bool:
+        """Insert everything buffered; False (records kept for the next try) if the insert failed"""
+        async with self._lock:
+            if not self._buffer:
+                return True
+            batch, self._buffer = self._buffer, []
+            # The current spool holds only records in this batch, so it can go once the batch commits
+            sealed = self._sealed + ([self._spool] if self._spool is not None else [])
+            self._spool = None
+            try:
+                await asyncio.to_thread(self._insert, batch)
+            except Exception as e:
+                logger.error(f"Audit flush of {len(batch)} records failed: {e}")
+                self._buffer[:0] = batch
+                self._sealed = sealed
+                return False
+            self._sealed = []
+            self.flushed += len(batch)
+            for spool in sealed:
+                spool.close(delete=not spool.keep)
+            if any(spool.keep for spool in sealed):
+                await asyncio.to_thread(self.replay_orphans)
+            return True
+
+    def replay_orphans(self) -> int:
+        """Insert the records of spool files no live process owns; returns how many were missing"""
+        if self.spool_dir is None:
+            return 0
+        replayed = 0
+        for path in sorted(glob.glob(os.path.join(self.spool_dir, "audit-*.jsonl"))):
+            try:
+                fd = os.open(path, os.O_RDONLY)
+            except FileNotFoundError:
+                continue
+            try:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue  # its writer is alive
+                records = _read_spool(path)
+                with self.session_factory() as db:
+                    for start in range(0, len(records), self.batch_size):
+                        chunk = records[start:start + self.batch_size]
+                        present = set(db.execute(select(AuditRecord.record_id).where(
+                            AuditRecord.record_id.in_([record["record_id"] for record in chunk]))).scalars())
+                        missing = [record for record in chunk if record["record_id"] not in present]
+                        if missing:
+                            db.execute(insert(AuditRecord), missing)
+                            replayed += len(missing)
+                    db.commit()
+                os.unlink(path)
+            finally:
+                os.close(fd)
+        if replayed:
+            logger.warning(f"Replayed {replayed} audit records from spool files")
+        return replayed
+
+    async def _loop(self):
+        while not self._stopping:
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.warning(f"Audit flusher error: {e}")
+
+    async def start(self):
+        if self.spool_dir is not None:
+            os.makedirs(self.spool_dir, exist_ok=True)
+            try:
+                await asyncio.to_thread(self.replay_orphans)
+            except Exception as e:
+                logger.error(f"Audit spool replay failed: {e}")
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        """Flush what is buffered; spool files of a failed final flush stay behind for replay"""
+        if self._task is not None:
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        if not await self.flush():
+            for spool in self._sealed:
+                spool.close(delete=False)
+            self._sealed = []
+
+
+def query(actor: Optional[str] = None, user_id: Optional[int] = None, action: Optional[str] = None,
+          since: Optional[datetime] = None, until: Optional[datetime] = None):
+    """SELECT of matching audit rows, oldest first"""
+    conditions = []
+    if actor is not None:
+        conditions.append(AuditRecord.actor == actor)
+    if user_id is not None:
+        conditions.append(AuditRecord.user_id == user_id)
+    if action is not None:
+        conditions.append(AuditRecord.action == action)
+    if since is not None:
+        conditions.append(AuditRecord.at >= since.timestamp())
+    if until is not None:
+        conditions.append(AuditRecord.at < until.timestamp())
+    return select(AuditRecord).where(*conditions).order_by(AuditRecord.at, AuditRecord.id)
+
+
+def export_rows(rows: Iterable[AuditRecord]) -> Iterable[dict]:
+    for row in rows:
+        yield {
+            "at": datetime.fromtimestamp(row.at, timezone.utc).isoformat(),
+            "actor": row.actor,
+            "action": row.action,
+            "user_id": row.user_id,
+            "source": row.source,
+            "changes": json.loads(row.changes) if row.changes is not None else None,
+            "record_id": row.record_id,
+        }
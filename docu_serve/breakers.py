@@ -0,0 +1,202 @@
+# docu_serve/breakers.py
+"""Circuit breakers for the auth service and RabbitMQ.
+
+By default every process keeps its own breaker state, so with N workers a
+dying dependency takes N * fail_max failures before every worker has stopped
+calling it. With BREAKER_STATE_FILE set (gunicorn_conf.py sets it), state,
+failure counter and opened_at live in a memory-mapped file instead, and all
+workers on the host trip, half-open and recover together. pybreaker re-reads
+the state from storage on every call, so there is nothing to propagate.
+
+The file is a fixed table of 64-byte slots, one per breaker name. Writers
+take an flock (plus a thread lock, since flock doesn't exclude threads of the
+same process) and bump a sequence number to odd before and even after they
+update a slot. Readers don't lock; they retry while the sequence is odd or
+changes under them (a seqlock). A writer that died mid-update leaves the
+sequence odd, and the next reader that gives up spinning repairs it under
+the lock.
+"""
+import fcntl
+import mmap
+import os
+import struct
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from pybreaker import (STATE_CLOSED, STATE_HALF_OPEN, STATE_OPEN, CircuitBreaker, CircuitBreakerStorage,
+                       CircuitMemoryStorage)
+
+BREAKER_STATE_FILE = os.getenv("BREAKER_STATE_FILE") or None
+BREAKER_STATE_SLOTS = int(os.getenv("BREAKER_STATE_SLOTS", "16"))
+
+_MAGIC = b"DSBRKR01"
+_HEADER = 64
+# seq, name, state, failure counter, opened_at (unix seconds, 0 = never)
+_SLOT = struct.Struct("<Q32sB7xqd")
+_SEQ = struct.Struct("<Q")
+_STATES = (STATE_CLOSED, STATE_OPEN, STATE_HALF_OPEN)
+_READ_SPINS = 1000
+
+
+class AsyncCircuitBreaker(CircuitBreaker):
+    """CircuitBreaker whose call_async works on asyncio.
+
+    pybreaker's call_async is built on tornado's gen.coroutine and fails with
+    a NameError when tornado isn't installed. calling() applies the same state
+    rules (open -> CircuitBreakerError, failures counted, success resets).
+    """
+
+    async def call_async(self, func, *args, **kwargs):
+        with self.calling():
+            return await func(*args, **kwargs)
+
+
+class BreakerStateFile:
+    """The memory-mapped slot table; one per path per process"""
+
+    def __init__(self, path: str, slots: int = BREAKER_STATE_SLOTS):
+        self.path = path
+        size = _HEADER + slots * _SLOT.size
+        self._pid = None
+        with self.locked():
+            if os.fstat(self._fd).st_size < size:
+                os.ftruncate(self._fd, size)
+            self._map = mmap.mmap(self._fd, size)
+            if self._map[:len(_MAGIC)] != _MAGIC:
+                self._map[:size] = bytes(size)
+                self._map[:len(_MAGIC)] = _MAGIC
+        self.slots = slots
+        self._offsets: Dict[str, int] = {}
+
+    @contextmanager
+    def locked(self):
+        if self._pid != os.getpid():
+            # A forked child shares the parent's open file, and flock doesn't exclude across a shared one
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            self._thread_lock = threading.Lock()
+            self._pid = os.getpid()
+        with self._thread_lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def offset(self, name: str, state: str) -> int:
+        """The slot for `name`, claiming a free one (in `state`) if it has none yet"""
+        if name in self._offsets:
+            return self._offsets[name]
+        key = name.encode()[:32].ljust(32, b"\0")
+        with self.locked():
+            free = None
+            for index in range(self.slots):
+                offset = _HEADER + index * _SLOT.size
+                slot_name = _SLOT.unpack_from(self._map, offset)[1]
+                if slot_name == key:
+                    break
+                if free is None and slot_name == bytes(32):
+                    free = offset
+            else:
+                if free is None:
+                    raise RuntimeError(f"No free breaker slot in {self.path} (BREAKER_STATE_SLOTS={self.slots})")
+                offset = free
+                _SLOT.pack_into(self._map, offset, 0, key, _STATES.index(state), 0, 0.0)
+        self._offsets[name] = offset
+        return offset
+
+    def read(self, offset: int):
+        """(state, counter, opened_at) of a slot, consistent without taking the lock"""
+        for _ in range(_READ_SPINS):
+            seq = _SEQ.unpack_from(self._map, offset)[0]
+            if seq & 1:
+                continue
+            values = _SLOT.unpack_from(self._map, offset)
+            if values[0] == seq:
+                return values[2:]
+        # A writer is slow or died mid-update; the lock waits for it or repairs its slot
+        with self.locked():
+            values = _SLOT.unpack_from(self._map, offset)
+            if values[0] & 1:
+                _SEQ.pack_into(self._map, offset, values[0] + 1)
+            return values[2:]
+
+    @contextmanager
+    def update(self, offset: int):
+        """Yields [state, counter, opened_at] to modify; written back as one atomic change"""
+        with self.locked():
+            seq, name, *fields = _SLOT.unpack_from(self._map, offset)
+            seq += seq & 1  # left odd by a writer that died
+            _SEQ.pack_into(self._map, offset, seq + 1)
+            try:
+                yield fields
+                _SLOT.pack_into(self._map, offset, seq + 1, name, *fields)
+            finally:
+                _SEQ.pack_into(self._map, offset, seq + 2)
+
+
+class SharedMemoryStorage(CircuitBreakerStorage):
+    """Breaker state shared by every process that maps the same file"""
+
+    def __init__(self, state_file: BreakerStateFile, breaker_name: str, state: str = STATE_CLOSED):
+        super().__init__("shared")
+        self.state_file = state_file
+        self._offset = state_file.offset(breaker_name, state)
+
+    @property
+    def state(self) -> str:
+        return _STATES[self.state_file.read(self._offset)[0]]
+
+    @state.setter
+    def state(self, state: str):
+        with self.state_file.update(self._offset) as fields:
+            fields[0] = _STATES.index(state)
+
+    def increment_counter(self):
+        with self.state_file.update(self._offset) as fields:
+            fields[1] += 1
+
+    def reset_counter(self):
+        with self.state_file.update(self._offset) as fields:
+            fields[1] = 0
+
+    @property
+    def counter(self) -> int:
+        return self.state_file.read(self._offset)[1]
+
+    @property
+    def opened_at(self) -> Optional[datetime]:
+        # pybreaker compares against naive datetime.utcnow()
+        timestamp = self.state_file.read(self._offset)[2]
+        return datetime.fromtimestamp(timestamp, timezone.utc).replace(tzinfo=None) if timestamp else None
+
+    @opened_at.setter
+    def opened_at(self, value: datetime):
+        with self.state_file.update(self._offset) as fields:
+            fields[2] = value.replace(tzinfo=timezone.utc).timestamp()
+
+
+_state_files: Dict[str, BreakerStateFile] = {}
+
+
+def breaker_storage(breaker_name: str, path: Optional[str] = BREAKER_STATE_FILE) -> CircuitBreakerStorage:
+    """Host-wide storage when a state file is configured, else this process's memory"""
+    if path is None:
+        return CircuitMemoryStorage(STATE_CLOSED)
+    if path not in _state_files:
+        _state_files[path] = BreakerStateFile(path)
+    return SharedMemoryStorage(_state_files[path], breaker_name)
+
+
+def breaker_status(breaker: CircuitBreaker) -> dict:
+    """Health view of a breaker; with shared storage this is every worker's combined state"""
+    storage = breaker._state_storage
+    opened_at = storage.opened_at
+    return {
+        "state": str(breaker.current_state),
+        "failures": breaker.fail_counter,
+        "fail_max": breaker.fail_max,
+        "opened_at": opened_at.replace(tzinfo=timezone.utc).isoformat() if opened_at else None,
+        "scope": "host" if isinstance(storage, SharedMemoryStorage) else "process",
+    }
@@ -0,0 +1,302 @@
+# docu_serve/bulk.py
+"""Streamed bulk delete/patch commands.
+
+POST /api/admin/users/bulk takes an NDJSON body, one command per line:
+
+    {"op": "delete", "user_id": 5}
+    {"op": "patch", "user_id": 6, "changes": {"age": 31}, "if_match": "\\"2\\""}
+
+and streams one NDJSON result per command back in input order, followed by a
+summary line:
+
+    {"line": 1, "op": "delete", "user_id": 5, "status": 200}
+    {"line": 2, "op": "patch", "user_id": 6, "status": 412, "detail": "...", "etag": "\\"3\\""}
+    {"summary": {"lines": 2, "succeeded": 1, "failed": 1}}
+
+Statuses mean what they mean on DELETE /api/admin/delete/{id} and PATCH
+/api/admin/users/{id}. A reader task parses the body into chunks of
+BULK_CHUNK_SIZE commands while the previous chunk is in the database. At most
+BULK_PIPELINE_DEPTH parsed chunks wait in a bounded queue, so a fast client
+is throttled to the database's pace and a slow reader throttles the database
+work. Memory use stays the same however long the stream is.
+
+Each chunk is one transaction. Runs of consecutive deletes become one SELECT
+and one DELETE ... IN, and patches are the same conditional UPDATE as the
+single-user route. If the transaction fails (say, a duplicate email), it is
+rolled back and the chunk is replayed one command per transaction, so only
+the offending lines fail. Events are published after each commit, in
+command order, and each applied command is audited as coming from the
+stream's admin. Each chunk gets its own BULK_CHUNK_TIMEOUT budget instead of
+the request deadline, because a stream can run far longer than one request.
+"""
+import asyncio
+import json
+import logging
+import os
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy import delete, select
+from sqlalchemy.exc import IntegrityError
+from starlette.requests import ClientDisconnect
+from starlette.responses import StreamingResponse
+
+from docu_serve import deadlines, users
+from docu_serve.audit import make_record
+from docu_serve.deadlines import DeadlineExceeded
+from docu_serve.models import User
+from docu_serve.schemas import BulkCommand
+from docu_serve.sharding import ShardFrozen
+
+logger = logging.getLogger(__name__)
+
+BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", "200"))
+BULK_PIPELINE_DEPTH = int(os.getenv("BULK_PIPELINE_DEPTH", "2"))
+BULK_MAX_LINE_BYTES = int(os.getenv("BULK_MAX_LINE_BYTES", "16384"))
+BULK_CHUNK_TIMEOUT = float(os.getenv("BULK_CHUNK_TIMEOUT", "10"))
+
+MEDIA_TYPE = "application/x-ndjson"
+
+# async (event_type, payloads) -> None, publishes a batch of events
+PublishMany = Callable[[str, List[dict]], Awaitable[None]]
+# async (audit records) -> None, e.g. AuditLog.record_many
+AuditMany = Callable[[List[dict]], Awaitable[None]]
+
+# Chunks still committing or publishing after their client went away
+_in_flight = set()
+
+
+class Line:
+    """One parsed input line: a command, or the reason it was rejected"""
+
+    __slots__ = ("number", "command", "error")
+
+    def __init__(self, number: int, command: Optional[BulkCommand] = None, error: Optional[str] = None):
+        self.number = number
+        self.command = command
+        self.error = error
+
+    def result(self, status: int, **extra) -> dict:
+        result = {"line": self.number}
+        if self.command is not None:
+            result["op"] = self.command.op
+            result["user_id"] = self.command.user_id
+        result["status"] = status
+        result.update(extra)
+        return result
+
+
+class DuplexStreamingResponse(StreamingResponse):
+    """StreamingResponse for a handler that is still reading the request body.
+
+    Starlette's disconnect listener would swallow the body messages; here a
+    hang-up surfaces as ClientDisconnect from request.stream() instead.
+    on_close runs once the stream has ended, however it ended.
+    """
+
+    def __init__(self, content, on_close: Optional[Callable[[], None]] = None, **kwargs):
+        super().__init__(content, **kwargs)
+        self.on_close = on_close
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await self.stream_response(send)
+        except OSError:
+            raise ClientDisconnect()
+        finally:
+            if self.on_close is not None:
+                self.on_close()
+        if self.background is not None:
+            await self.background()
+
+
+def parse_line(number: int, raw: Optional[bytes]) -> Line:
+    if raw is None:
+        return Line(number, error=f"Line longer than {BULK_MAX_LINE_BYTES} bytes")
+    try:
+        return Line(number, BulkCommand.model_validate_json(raw))
+    except ValidationError as e:
+        error = e.errors()[0]
+        location = ".".join(str(part) for part in error["loc"])
+        return Line(number, error=f"{location}: {error['msg']}" if location else error["msg"])
+
+
+async def read_lines(body: AsyncIterator[bytes], max_line: int = BULK_MAX_LINE_BYTES) -> AsyncIterator[Optional[bytes]]:
+    """Split a byte stream into lines; a line over max_line bytes comes out as None and is skipped"""
+    buffer = bytearray()
+    skipping = False
+    async for piece in body:
+        if skipping:
+            newline = piece.find(b"\n")
+            if newline < 0:
+                continue
+            piece = piece[newline + 1:]
+            skipping = False
+        buffer += piece
+        start = 0
+        while (newline := buffer.find(b"\n", start)) >= 0:
+            yield bytes(buffer[start:newline]) if newline - start <= max_line else None
+            start = newline + 1
+        del buffer[:start]
+        if len(buffer) > max_line:
+            # Don't buffer the rest of an over-long line, drop it up to its newline
+            yield None
+            buffer.clear()
+            skipping = True
+    if buffer.strip():
+        yield bytes(buffer)
+
+
+def _delete_run(db, run: List[Line], results: Dict[int, dict], events: list):
+    if not run:
+        return
+    ids = {line.command.user_id for line in run}
+    emails = dict(db.execute(select(User.user_id, User.email).where(User.user_id.in_(ids))).all())
+    if emails:
+        db.execute(delete(User).where(User.user_id.in_(list(emails))).execution_options(synchronize_session=False))
+    for line in run:
+        # pop: a second delete of the same user in one run finds it gone
+        email = emails.pop(line.command.user_id, None)
+        if email is None:
+            results[line.number] = line.result(404, detail="User not found")
+        else:
+            results[line.number] = line.result(200)
+            events.append(("user.deleted", {"user_id": line.command.user_id, "email": email}, {"email": email}))
+
+
+def _patch(db, line: Line, results: Dict[int, dict], events: list):
+    command = line.command
+    data = command.changes.model_dump(exclude_unset=True) if command.changes is not None else {}
+    if not data:
+        results[line.number] = line.result(400, detail="No fields to update")
+        return
+    if "email" in data and users.email_taken(db, data["email"], command.user_id):
+        results[line.number] = line.result(409, detail="Email already exists")
+        return
+    versions = users.if_match_versions(command.if_match) if command.if_match is not None else None
+    row = db.execute(users.update_statement(command.user_id, data, versions)).first()
+    if row is not None:
+        results[line.number] = line.result(200, etag=users.etag(row.version))
+        events.append(("user.updated", users.snapshot(row), data))
+        return
+    current = users.current_version(db, command.user_id) if versions is not None else None
+    if current is None:
+        results[line.number] = line.result(404, detail="User not found")
+    else:
+        results[line.number] = line.result(412, detail="User was modified by another request",
+                                           etag=users.etag(current))
+
+
+def _apply(db, lines: List[Line], results: Dict[int, dict], events: list):
+    """Run the commands in order, batching each run of consecutive deletes"""
+    run = []
+    for line in lines:
+        if line.command.op == "delete":
+            run.append(line)
+            continue
+        _delete_run(db, run, results, events)
+        run = []
+        _patch(db, line, results, events)
+    _delete_run(db, run, results, events)
+
+
+def _failure(line: Line, error: Exception) -> dict:
+    if isinstance(error, IntegrityError) and users.is_unique_violation(error):
+        return line.result(409, detail="Email already exists")
+    if isinstance(error, ShardFrozen):
+        return line.result(503, detail=str(error))
+    if isinstance(error, DeadlineExceeded):
+        return line.result(504, detail="Chunk deadline exceeded")
+    logger.exception("Bulk command failed", extra={"line": line.number})
+    return line.result(500, detail="Failed to apply command")
+
+
+def apply_chunk(session_factory, lines: List[Line]) -> Tuple[List[dict], list]:
+    """Results in line order and (event_type, payload, audited changes) in commit order"""
+    results: Dict[int, dict] = {}
+    events = []
+    for line in lines:
+        if line.error is not None:
+            results[line.number] = line.result(400, detail=line.error)
+    commands = [line for line in lines if line.command is not None]
+    with session_factory() as db:
+        try:
+            _apply(db, commands, results, events)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.info(f"Bulk chunk rolled back ({type(e).__name__}), "
+                        f"applying its {len(commands)} commands one by one")
+            events.clear()
+            for line in commands:
+                line_events = []
+                try:
+                    _apply(db, [line], results, line_events)
+                    db.commit()
+                    events.extend(line_events)
+                except Exception as line_error:
+                    db.rollback()
+                    results[line.number] = _failure(line, line_error)
+    return [results[line.number] for line in lines], events
+
+
+async def _process(session_factory, publish_many: PublishMany, audit_many: Optional[AuditMany], actor: str,
+                   lines: List[Line], chunk_timeout: float) -> List[dict]:
+    with deadlines.deadline(chunk_timeout):
+        results, events = await asyncio.to_thread(apply_chunk, session_factory, lines)
+        if audit_many is not None:
+            await audit_many([make_record(actor, event_type, payload["user_id"], changes, source="bulk")
+                              for event_type, payload, changes in events])
+        # One batch per run of same-type events, so a delete never overtakes an earlier update
+        start = 0
+        for end in range(1, len(events) + 1):
+            if end == len(events) or events[end][0] != events[start][0]:
+                await publish_many(events[start][0], [payload for _, payload, _ in events[start:end]])
+                start = end
+    return results
+
+
+async def stream_commands(body: AsyncIterator[bytes], session_factory, publish_many: PublishMany,
+                          audit_many: Optional[AuditMany] = None, actor: str = "",
+                          chunk_size: int = BULK_CHUNK_SIZE, depth: int = BULK_PIPELINE_DEPTH,
+                          max_line: int = BULK_MAX_LINE_BYTES,
+                          chunk_timeout: float = BULK_CHUNK_TIMEOUT) -> AsyncIterator[bytes]:
+    """NDJSON results for an NDJSON body of commands, one write per chunk"""
+    chunks: asyncio.Queue = asyncio.Queue(maxsize=depth)
+
+    async def read():
+        chunk = []
+        number = 0
+        try:
+            async for raw in read_lines(body, max_line):
+                number += 1
+                if raw is not None and not raw.strip():
+                    continue
+                chunk.append(parse_line(number, raw))
+                if len(chunk) >= chunk_size:
+                    await chunks.put(chunk)
+                    chunk = []
+            if chunk:
+                await chunks.put(chunk)
+        finally:
+            await chunks.put(None)
+
+    reader = asyncio.create_task(read())
+    lines = succeeded = 0
+    try:
+        while (chunk := await chunks.get()) is not None:
+            # Shielded: a client that hangs up mid-chunk must not strand a commit without its events
+            task = asyncio.create_task(
+                _process(session_factory, publish_many, audit_many, actor, chunk, chunk_timeout))
+            _in_flight.add(task)
+            task.add_done_callback(_in_flight.discard)
+            results = await asyncio.shield(task)
+            lines += len(results)
+            succeeded += sum(1 for result in results if result["status"] == 200)
+            yield b"".join(json.dumps(result).encode() + b"\n" for result in results)
+        # Re-raises a body read error (e.g. the client disconnected)
+        await reader
+        yield json.dumps({"summary": {"lines": lines, "succeeded": succeeded,
+                                      "failed": lines - succeeded}}).encode() + b"\n"
+    finally:
+        reader.cancel()
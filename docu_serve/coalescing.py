@@ -0,0 +1,89 @@
+# docu_serve/coalescing.py
+"""Coalescing of user.updated events.
+
+With EVENT_COALESCE_WINDOW > 0, user.updated snapshots are held for up to
+that many seconds and only the latest one per user_id is published, as one
+batch over a single broker connection. An admin tool patching the same user
+ten times in a second then costs consumers one event instead of ten.
+
+Ordering: before any other event (user.deleted) is published, everything
+pending is flushed first, so a delete never overtakes an earlier update of
+any user. Pending snapshots are flushed on shutdown, and as soon as more than
+EVENT_COALESCE_MAX_PENDING users are waiting.
+"""
+import asyncio
+import contextvars
+import logging
+import os
+from typing import Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+EVENT_COALESCE_WINDOW = float(os.getenv("EVENT_COALESCE_WINDOW", "0"))  # seconds, 0 = off
+EVENT_COALESCE_MAX_PENDING = int(os.getenv("EVENT_COALESCE_MAX_PENDING", "1000"))
+COALESCED_EVENT_TYPE = "user.updated"
+
+PublishBatch = Callable[[str, List[dict]], Awaitable[None]]
+
+
+class EventCoalescer:
+    """Keeps the latest user.updated snapshot per user until the window closes"""
+
+    def __init__(self, publish_batch: PublishBatch, window: float = EVENT_COALESCE_WINDOW,
+                 max_pending: int = EVENT_COALESCE_MAX_PENDING):
+        self.publish_batch = publish_batch
+        self.window = window
+        self.max_pending = max_pending
+        # Snapshots replaced by a newer one before they were published
+        self.coalesced = 0
+        self._pending: Dict[int, dict] = {}
+        self._lock = asyncio.Lock()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._flush_task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.window > 0
+
+    def add(self, payload: dict):
+        """Queue a user.updated snapshot, replacing any pending one for the same user"""
+        user_id = payload["user_id"]
+        if self._pending.pop(user_id, None) is not None:
+            self.coalesced += 1
+        # Re-inserted at the end, so the batch goes out in order of each user's last update
+        self._pending[user_id] = payload
+        if len(self._pending) > self.max_pending:
+            self._schedule(0)
+        elif self._timer is None:
+            self._schedule(self.window)
+
+    def _schedule(self, delay: float):
+        if self._timer is not None:
+            self._timer.cancel()
+        # Empty context: the timer would otherwise run with the first request's deadline and trace
+        self._timer = asyncio.get_running_loop().call_later(delay, self._start_flush, context=contextvars.Context())
+
+    def _start_flush(self):
+        self._timer = None
+        self._flush_task = asyncio.ensure_future(self.flush())
+
+    async def flush(self):
+        """Publish everything pending now; waits for a flush already in progress"""
+        async with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._pending:
+                return
+            payloads = list(self._pending.values())
+            self._pending.clear()
+            try:
+                await self.publish_batch(COALESCED_EVENT_TYPE, payloads)
+            except Exception as e:
+                logger.error(f"Failed to flush {len(payloads)} coalesced {COALESCED_EVENT_TYPE} events: {e}")
+
+    async def close(self):
+        """Flush on shutdown"""
+        if self._flush_task is not None and not self._flush_task.done():
+            await self._flush_task
+        await self.flush()
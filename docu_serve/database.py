@@ -1,9 +1,16 @@
+import logging
 import os
 import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import partial
+from typing import Optional
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 from sqlalchemy.exc import OperationalError
+from docu_serve.sharding import build_router
  
 # Pick env file by APP_ENV (default dev)
 envfile = {
@@ -18,6 +25,10 @@ DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./app.db")
 SQL_ECHO = os.getenv("SQL_ECHO", "false").lower() == "true"
 RETRIES = int(os.getenv("DB_RETRIES", "10"))
 DELAY = float(os.getenv("DB_RETRY_DELAY", "1.5"))
+# Log individual statements slower than this (0 = off); a targeted alternative to SQL_ECHO
+SQL_SLOW_QUERY_MS = float(os.getenv("SQL_SLOW_QUERY_MS", "0"))
+
+logger = logging.getLogger(__name__)
  
 connect_args = {"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
  
@@ -33,7 +44,7 @@ for attempt in range(RETRIES):
         break
     except OperationalError as e:
         if attempt < RETRIES - 1:
-            print(f"Database connection attempt {attempt + 1}/{RETRIES} failed.  Retrying in {DELAY}s...")
+            logger.warning(f"Database connection attempt {attempt + 1}/{RETRIES} failed.  Retrying in {DELAY}s...")
             time.sleep(DELAY)
         else:
             raise Exception(
@@ -44,11 +55,101 @@ for attempt in range(RETRIES):
 Base = declarative_base()
 
 SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False, expire_on_commit=False)
+
+# users_admin split across shards when SHARD_MAP_FILE / DATABASE_SHARDS is set; sessions route by user_id
+shard_router = build_router(engine, echo=SQL_ECHO)
+if shard_router is not None:
+    SessionLocal = partial(shard_router.session, autoflush=False, expire_on_commit=False)
  
  
+def create_tables():
+    """Create missing tables on the primary, and users_admin on every shard"""
+    from docu_serve.models import Base as ModelBase
+    ModelBase.metadata.create_all(bind=engine)
+    if shard_router is not None:
+        shard_router.create_all(ModelBase.metadata)
+
+
+def tables_created_by_launcher() -> bool:
+    # gunicorn_conf.on_starting creates them once in the master and sets this for the workers it forks
+    return os.getenv("DB_CREATE_TABLES", "true").lower() == "false"
+
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally: 
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+def get_session_factory():
+    # For streamed responses, which outlive get_db's session and open their own
+    return SessionLocal
+
+
+class QueryStats:
+    """Statement count and time for one unit of work (usually a request)"""
+
+    __slots__ = ("count", "seconds", "parent")
+
+    def __init__(self, parent: Optional["QueryStats"] = None):
+        self.count = 0
+        self.seconds = 0.0
+        # Nested trackers also add to the enclosing one
+        self.parent = parent
+
+    def add(self, seconds: float):
+        stats = self
+        while stats is not None:
+            stats.count += 1
+            stats.seconds += seconds
+            stats = stats.parent
+
+
+_query_stats: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+
+
+def current_query_stats() -> Optional[QueryStats]:
+    return _query_stats.get()
+
+
+@contextmanager
+def track_queries():
+    """Count and time every statement executed inside the block, on any engine"""
+    stats = QueryStats(parent=_query_stats.get())
+    token = _query_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _query_stats.reset(token)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _query_stats.get() is not None or SQL_SLOW_QUERY_MS:
+        conn.info["query_start"] = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = conn.info.pop("query_start", None)
+    if start is None:
+        return
+    elapsed = time.perf_counter() - start
+    stats = _query_stats.get()
+    if stats is not None:
+        stats.add(elapsed)
+    if SQL_SLOW_QUERY_MS and elapsed * 1000 >= SQL_SLOW_QUERY_MS:
+        logger.warning(f"Slow query ({elapsed * 1000:.1f}ms): {statement[:500]}")
+
+
+@event.listens_for(Engine, "handle_error")
+def _handle_error(exception_context):
+    # Failed statements still count against the budget
+    conn = exception_context.connection
+    start = conn.info.pop("query_start", None) if conn is not None else None
+    stats = _query_stats.get()
+    if stats is not None and start is not None:
+        stats.add(time.perf_counter() - start)
+
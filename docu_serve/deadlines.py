@@ -0,0 +1,217 @@
+# docu_serve/deadlines.py
+"""Per-request deadlines.
+
+DeadlineMiddleware gives every request a budget of REQUEST_TIMEOUT seconds
+(or what the client asks for in X-Request-Timeout, capped at
+REQUEST_TIMEOUT_MAX) and stores the absolute deadline in a contextvar.
+Everything downstream reads the remaining time from there:
+
+  * auth proxy and broker calls run under bounded(), which cancels them when
+    the budget is spent, and size their own timeouts with timeout()
+  * SQL statements are refused once the deadline has passed, and in-flight
+    ones are interrupted: SET LOCAL statement_timeout on PostgreSQL, a
+    progress handler on SQLite
+
+A spent budget surfaces as DeadlineExceeded, which the middleware turns into
+a 504. Circuit breakers exclude it, so clients with short deadlines can't
+open a breaker on a healthy dependency.
+
+Once a request's change is committed, a 504 would report a write that
+happened as failed, and skip its audit record and event. Handlers call
+release() right after the commit, which lifts the deadline for the rest of
+the request.
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import time
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+import httpx
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+REQUEST_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT", "10"))
+REQUEST_TIMEOUT_MAX = float(os.getenv("REQUEST_TIMEOUT_MAX", "30"))
+TIMEOUT_HEADER = b"x-request-timeout"
+# The middleware's own cancellation fires this long after the deadline, so bounded()
+# blocks get to fail cleanly first (e.g. publish_event logging the event for replay)
+BACKSTOP_GRACE = 0.1
+# SQLite calls the progress handler every N virtual machine instructions
+SQLITE_PROGRESS_INTERVAL = 1000
+
+
+class DeadlineExceeded(Exception):
+    """The current request's time budget is spent"""
+
+
+_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+# The middleware's backstop timer for the current request
+_backstop: ContextVar[Optional[asyncio.Timeout]] = ContextVar("request_backstop", default=None)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left for the current request, None outside a request"""
+    deadline = _deadline.get()
+    return deadline - time.monotonic() if deadline is not None else None
+
+
+def expired() -> bool:
+    deadline = _deadline.get()
+    return deadline is not None and time.monotonic() >= deadline
+
+
+def timeout(default: float) -> float:
+    """`default` shortened to the remaining budget; raises if nothing is left"""
+    left = remaining()
+    if left is None:
+        return default
+    if left <= 0:
+        raise DeadlineExceeded("Request deadline exceeded")
+    return min(default, left)
+
+
+def release():
+    """Stop enforcing the deadline for the rest of the request, e.g. once its write is committed"""
+    _deadline.set(None)
+    backstop = _backstop.get()
+    if backstop is not None:
+        backstop.reschedule(None)
+
+
+@contextmanager
+def deadline(seconds: float):
+    """Run the block with a budget of `seconds`"""
+    token = _deadline.set(time.monotonic() + seconds)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+@asynccontextmanager
+async def bounded():
+    """Cancel the block when the deadline passes; timeouts after that raise DeadlineExceeded"""
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded("Request deadline exceeded")
+    try:
+        async with asyncio.timeout(left):
+            yield
+    except (TimeoutError, httpx.TimeoutException, asyncio.CancelledError) as e:
+        # CancelledError too: if the loop stalled past the deadline the middleware's backstop
+        # may have cancelled the task in the same tick, and asyncio.timeout leaves that alone
+        if expired():
+            raise DeadlineExceeded("Request deadline exceeded") from e
+        raise
+
+
+def parse_timeout(value: Optional[str]) -> float:
+    """Budget for a request from its X-Request-Timeout header (seconds)"""
+    if value:
+        try:
+            seconds = float(value)
+        except ValueError:
+            seconds = 0
+        if seconds > 0:
+            return min(seconds, REQUEST_TIMEOUT_MAX)
+    return REQUEST_TIMEOUT
+
+
+# --- database -----------------------------------------------------------------
+
+def _sqlite_progress():
+    # Non-zero aborts the running statement with OperationalError("interrupted")
+    return 1 if expired() else 0
+
+
+@event.listens_for(Engine, "connect")
+def _on_connect(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        dbapi_connection.set_progress_handler(_sqlite_progress, SQLITE_PROGRESS_INTERVAL)
+
+
+@event.listens_for(Engine, "begin")
+def _on_begin(conn):
+    left = remaining()
+    if left is None or conn.dialect.name != "postgresql":
+        return
+    # Raw cursor so the SET isn't counted against the route's query budget
+    cursor = conn.connection.cursor()
+    try:
+        cursor.execute(f"SET LOCAL statement_timeout = {max(1, int(left * 1000))}")
+    finally:
+        cursor.close()
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if expired():
+        raise DeadlineExceeded("Request deadline exceeded before SQL statement")
+
+
+@event.listens_for(Engine, "handle_error")
+def _handle_error(exception_context):
+    # Interrupted/cancelled statements (SQLite "interrupted", PostgreSQL QueryCanceled)
+    if expired() and not isinstance(exception_context.original_exception, DeadlineExceeded):
+        return DeadlineExceeded("Request deadline exceeded during SQL statement")
+
+
+# --- middleware ---------------------------------------------------------------
+
+_TIMEOUT_BODY = json.dumps({"detail": "Request deadline exceeded"}).encode()
+
+
+class DeadlineMiddleware:
+    """Pure ASGI middleware setting the request deadline and answering 504 when it passes.
+
+    The deadline covers the work up to the response start; once headers are
+    sent the body is allowed to finish.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        header = None
+        for name, value in scope["headers"]:
+            if name == TIMEOUT_HEADER:
+                header = value.decode("latin-1")
+                break
+        seconds = parse_timeout(header)
+
+        started = False
+        timer = None
+
+        async def send_wrapper(message):
+            nonlocal started
+            if message["type"] == "http.response.start":
+                started = True
+                timer.reschedule(None)
+            await send(message)
+
+        with deadline(seconds):
+            try:
+                async with asyncio.timeout(seconds + BACKSTOP_GRACE) as timer:
+                    backstop = _backstop.set(timer)
+                    try:
+                        await self.app(scope, receive, send_wrapper)
+                    finally:
+                        _backstop.reset(backstop)
+            except (TimeoutError, DeadlineExceeded):
+                if started:
+                    raise
+                await send({
+                    "type": "http.response.start",
+                    "status": 504,
+                    "headers": [(b"content-type", b"application/json"),
+                                (b"content-length", str(len(_TIMEOUT_BODY)).encode())],
+                })
+                await send({"type": "http.response.body", "body": _TIMEOUT_BODY})
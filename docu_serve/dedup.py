@@ -0,0 +1,92 @@
+# docu_serve/dedup.py
+"""Redelivery deduplication for the admin sync worker.
+
+After a broker reconnect (connect_robust), unacked messages are delivered
+again, and each one used to cost the worker a SELECT on users_admin. The
+worker now remembers the ids of messages it has processed, so a redelivery
+is acked without any DB work:
+
+- the id is the AMQP message_id, a uuid the API stamps once per event.
+  Redeliveries of that message keep it, while two events with equal bodies
+  (age 30 -> 31 -> 30) stay distinct. Messages from publishers that don't
+  set one fall back to fallback_message_id(), a hash of routing key and
+  body, which can't tell such events apart.
+- ids are kept in an LRU of WORKER_DEDUP_MAX_IDS entries for
+  WORKER_DEDUP_TTL seconds, per worker process.
+- with WORKER_DEDUP_BACKEND=db they are also written to the
+  processed_messages table, in the same transaction as the synced user,
+  so they survive restarts and are shared between workers. A miss in the
+  LRU then costs one primary-key lookup, and rows past the TTL are
+  deleted every PURGE_EVERY inserts.
+"""
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from sqlalchemy import delete
+
+from docu_serve.models import ProcessedMessage
+
+WORKER_DEDUP_MAX_IDS = int(os.getenv("WORKER_DEDUP_MAX_IDS", "10000"))
+WORKER_DEDUP_TTL = float(os.getenv("WORKER_DEDUP_TTL", "86400"))
+WORKER_DEDUP_BACKEND = os.getenv("WORKER_DEDUP_BACKEND", "memory").lower()
+# Expired rows are deleted every this many inserts
+PURGE_EVERY = 1000
+
+
+def fallback_message_id(routing_key: str, body: bytes) -> str:
+    """Id for a message without an AMQP message_id: a hash of its content"""
+    digest = hashlib.sha256(f"{routing_key}\0".encode())
+    digest.update(body)
+    return digest.hexdigest()[:32]
+
+
+class ProcessedMessages:
+    """LRU of processed message ids with a TTL, optionally backed by processed_messages"""
+
+    def __init__(self, max_ids: int = WORKER_DEDUP_MAX_IDS, ttl: float = WORKER_DEDUP_TTL,
+                 durable: bool = WORKER_DEDUP_BACKEND == "db"):
+        self.max_ids = max_ids
+        self.ttl = ttl
+        self.durable = durable
+        # Redeliveries acked without touching the DB
+        self.duplicates = 0
+        self._ids = OrderedDict()
+        self._inserts = 0
+
+    def seen(self, message_id: str) -> bool:
+        """Whether the id was processed recently, from memory only"""
+        expires_at = self._ids.get(message_id)
+        if expires_at is None:
+            return False
+        if expires_at <= time.time():
+            del self._ids[message_id]
+            return False
+        self._ids.move_to_end(message_id)
+        return True
+
+    def add(self, message_id: str):
+        self._ids[message_id] = time.time() + self.ttl
+        self._ids.move_to_end(message_id)
+        while len(self._ids) > self.max_ids:
+            self._ids.popitem(last=False)
+
+    def seen_in(self, db, message_id: str) -> bool:
+        """Whether the table has the id (durable only); called on an LRU miss"""
+        if not self.durable:
+            return False
+        row = db.get(ProcessedMessage, message_id)
+        return row is not None and row.processed_at + self.ttl > time.time()
+
+    def record_in(self, db, message_id: Optional[str]):
+        """Add the id to the session's transaction (durable only); the caller commits"""
+        if not self.durable or message_id is None:
+            return
+        now = time.time()
+        self._inserts += 1
+        if self._inserts % PURGE_EVERY == 0:
+            db.execute(delete(ProcessedMessage).where(ProcessedMessage.processed_at <= now - self.ttl))
+        # merge: an expired row for the same id is overwritten rather than conflicting
+        db.merge(ProcessedMessage(message_id=message_id, processed_at=now))
@@ -0,0 +1,115 @@
+# docu_serve/events.py
+"""Shared codec for user.* events published by the API and consumed by the worker.
+
+JSON goes through pydantic-core's Rust serializer/parser, which validates
+and encodes in one pass and beats json/orjson plus a separate validation
+step. msgpack is an optional second content type, chosen per message through
+the AMQP content_type header so producers and consumers can be rolled out
+independently.
+"""
+import os
+from typing import Optional, Tuple, Type, Union
+
+from pydantic import BaseModel, ConfigDict, ValidationError
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - depends on installed extras
+    msgpack = None
+
+JSON_CONTENT_TYPE = "application/json"
+MSGPACK_CONTENT_TYPE = "application/msgpack"
+
+# Content type used when publishing; consumers accept both regardless
+EVENT_CONTENT_TYPE = os.getenv("EVENT_CONTENT_TYPE", JSON_CONTENT_TYPE)
+
+
+class EventDecodeError(ValueError):
+    """Raised when an event body can't be decoded or fails validation"""
+
+
+class _Event(BaseModel):
+    # Unknown keys from newer producers are ignored rather than rejected
+    model_config = ConfigDict(extra="ignore", frozen=True)
+
+
+class UserCreatedEvent(_Event):
+    user_id: int
+    name: str
+    email: str
+    age: Optional[int] = None
+    hashed_password: str
+    role: str = "user"
+
+
+class UserUpdatedEvent(_Event):
+    user_id: int
+    name: str
+    email: str
+    age: Optional[int] = None
+    role: str
+
+
+class UserDeletedEvent(_Event):
+    user_id: int
+    email: str
+
+
+UserEvent = Union[UserCreatedEvent, UserUpdatedEvent, UserDeletedEvent]
+
+# Routing key -> model; pydantic builds each model's validator once at import
+EVENT_MODELS: dict[str, Type[_Event]] = {
+    "user.created": UserCreatedEvent,
+    "user.updated": UserUpdatedEvent,
+    "user.deleted": UserDeletedEvent,
+}
+
+
+def _model_for(event_type: str) -> Type[_Event]:
+    try:
+        return EVENT_MODELS[event_type]
+    except KeyError:
+        raise EventDecodeError(f"Unknown event type '{event_type}'") from None
+
+
+def encode_event(event_type: str, payload: Union[dict, _Event],
+                 content_type: Optional[str] = None) -> Tuple[bytes, str]:
+    """Validate payload against the event model and encode it, returns (body, content_type)"""
+    model = _model_for(event_type)
+    if isinstance(payload, model):
+        event = payload
+    else:
+        try:
+            event = model.model_validate(payload)
+        except ValidationError as e:
+            raise EventDecodeError(f"Invalid {event_type} payload: {e}") from e
+
+    content_type = content_type or EVENT_CONTENT_TYPE
+    # Fall back rather than fail the publish if msgpack isn't installed here
+    if content_type == MSGPACK_CONTENT_TYPE and msgpack is not None:
+        return msgpack.packb(event.model_dump(), use_bin_type=True), MSGPACK_CONTENT_TYPE
+    return event.__pydantic_serializer__.to_json(event), JSON_CONTENT_TYPE
+
+
+def _media_type(content_type: Optional[str]) -> str:
+    # "application/json; charset=utf-8" -> "application/json"
+    return (content_type or "").split(";")[0].strip().lower()
+
+
+def decode_event(event_type: str, body: bytes, content_type: Optional[str] = None) -> UserEvent:
+    """Decode and validate a message body into its typed event model"""
+    model = _model_for(event_type)
+    media_type = _media_type(content_type)
+    if media_type == MSGPACK_CONTENT_TYPE and msgpack is None:
+        raise EventDecodeError("Received msgpack event but msgpack is not installed")
+    try:
+        if media_type in ("", JSON_CONTENT_TYPE):
+            # Parse and validate in one pass inside pydantic-core
+            return model.model_validate_json(body)
+        if media_type == MSGPACK_CONTENT_TYPE:
+            return model.model_validate(msgpack.unpackb(body, raw=False))
+    except ValidationError as e:
+        raise EventDecodeError(f"Invalid {event_type} event: {e}") from e
+    except (ValueError, TypeError) as e:
+        raise EventDecodeError(f"Malformed {event_type} event: {e}") from e
+    raise EventDecodeError(f"Unsupported content type '{content_type}'")
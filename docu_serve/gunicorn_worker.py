@@ -0,0 +1,15 @@
+# docu_serve/gunicorn_worker.py
+"""Uvicorn worker class for gunicorn with the event loop and HTTP parser chosen from env"""
+import os
+
+from uvicorn_worker import UvicornWorker
+
+
+class TunedUvicornWorker(UvicornWorker):
+    # "auto" picks uvloop/httptools when installed; set explicitly to pin or to fall back to asyncio/h11
+    CONFIG_KWARGS = {
+        "loop": os.getenv("UVICORN_LOOP", "auto"),
+        "http": os.getenv("UVICORN_HTTP", "httptools"),
+        "lifespan": "on",
+        "access_log": os.getenv("UVICORN_ACCESS_LOG", "false").lower() == "true",
+    }
@@ -0,0 +1,135 @@
+# docu_serve/health.py
+"""Background-refreshed health checks.
+
+A single task probes the database, broker and auth service every
+HEALTH_PROBE_INTERVAL seconds and caches the results, so orchestrators,
+load balancers and dashboards polling /health/detailed read a snapshot
+instead of each taking a pool connection for SELECT 1. Forced probes
+(?fresh=1) are single-flighted: concurrent callers share one probe run.
+"""
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, Optional
+
+import aio_pika
+import httpx
+from sqlalchemy import text
+
+from docu_serve import database
+
+logger = logging.getLogger(__name__)
+
+HEALTH_PROBE_INTERVAL = float(os.getenv("HEALTH_PROBE_INTERVAL", "10"))
+HEALTH_PROBE_TIMEOUT = float(os.getenv("HEALTH_PROBE_TIMEOUT", "2"))
+
+Probe = Callable[[], Awaitable[None]]
+
+
+def _select_one():
+    with database.engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+
+
+async def probe_database():
+    # Blocking driver call, keep it off the event loop
+    await asyncio.to_thread(_select_one)
+
+
+async def probe_broker(url: str, timeout: float = HEALTH_PROBE_TIMEOUT):
+    connection = await aio_pika.connect(url, timeout=timeout)
+    await connection.close()
+
+
+async def probe_auth(url: str, timeout: float = HEALTH_PROBE_TIMEOUT):
+    async with httpx.AsyncClient(timeout=timeout) as client:
+        response = await client.get(f"{url}/health")
+    if response.status_code >= 500:
+        raise RuntimeError(f"auth service returned {response.status_code}")
+
+
+async def probe_replicas(router):
+    # Also refreshes the lag the router uses to skip stale replicas
+    statuses = await asyncio.to_thread(router.refresh)
+    now = time.monotonic()
+    if not any(replica.usable(now, router.max_lag) for replica in router.replicas):
+        raise RuntimeError(f"no usable replica, reads go to the primary: {statuses}")
+
+
+class HealthMonitor:
+    """Runs the probes on an interval and serves the latest results"""
+
+    def __init__(self, probes: Dict[str, Probe], interval: float = HEALTH_PROBE_INTERVAL,
+                 timeout: float = HEALTH_PROBE_TIMEOUT):
+        self.probes = probes
+        self.interval = interval
+        self.timeout = timeout
+        self.results: Optional[dict] = None
+        self.checked_at: Optional[float] = None
+        self._in_progress: Optional[asyncio.Future] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run_probe(self, probe: Probe) -> dict:
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(probe(), self.timeout)
+            status = "healthy"
+        except asyncio.TimeoutError:
+            status = f"unhealthy: timed out after {self.timeout}s"
+        except Exception as e:
+            status = f"unhealthy: {str(e)}"
+        return {"status": status, "latency_ms": round((time.perf_counter() - start) * 1000, 2)}
+
+    async def _probe_all(self) -> dict:
+        names = list(self.probes)
+        outcomes = await asyncio.gather(*(self._run_probe(self.probes[name]) for name in names))
+        self.results = dict(zip(names, outcomes))
+        self.checked_at = time.time()
+        return self.results
+
+    async def probe(self) -> dict:
+        """Run all probes now; callers arriving while a run is in flight share its result"""
+        if self._in_progress is None:
+            self._in_progress = asyncio.ensure_future(self._probe_all())
+            self._in_progress.add_done_callback(self._clear_in_progress)
+        return await asyncio.shield(self._in_progress)
+
+    def _clear_in_progress(self, _future):
+        self._in_progress = None
+
+    async def snapshot(self, fresh: bool = False) -> Optional[dict]:
+        """Cached results, probing first if forced or if nothing has been probed yet"""
+        if fresh or self.results is None:
+            await self.probe()
+        return self.results
+
+    def age(self) -> Optional[float]:
+        return round(time.time() - self.checked_at, 3) if self.checked_at is not None else None
+
+    def checked_at_iso(self) -> Optional[str]:
+        if self.checked_at is None:
+            return None
+        return datetime.fromtimestamp(self.checked_at, timezone.utc).isoformat()
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.probe()
+            except Exception as e:
+                logger.warning(f"Health probe run failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,305 @@
+# docu_serve/idempotency.py
+"""Idempotency-Key support for admin mutations.
+
+The first response for a key (scoped to the admin who sent it) is stored
+with a fingerprint of the request. A retry with the same key gets that
+response back, marked `Idempotent-Replayed: true`, without running the
+handler, so there is no second DB query, commit or publish. Reusing a key for
+a different request is a 422.
+
+Duplicates arriving while the first is still running wait for it and share
+its response (single flight). With IDEMPOTENCY_BACKEND=db, results are also
+kept in the idempotency_keys table so they survive restarts and are shared
+across gunicorn workers, and a pending row makes a duplicate on another
+worker get 409 instead of running in parallel.
+
+Only final outcomes are stored: 5xx, 408 and 429 are transient, so a retry
+runs again.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional
+
+from fastapi import HTTPException, Response
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from sqlalchemy import delete
+from sqlalchemy.exc import IntegrityError
+
+from docu_serve.models import IdempotencyRecord
+from docu_serve.responses import validated_response
+
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", "86400"))
+IDEMPOTENCY_MAX_KEYS = int(os.getenv("IDEMPOTENCY_MAX_KEYS", "10000"))
+IDEMPOTENCY_BACKEND = os.getenv("IDEMPOTENCY_BACKEND", "memory").lower()
+HEADER = "Idempotency-Key"
+MAX_KEY_LENGTH = 255
+# Expired rows are deleted every this many claims
+PURGE_EVERY = 1000
+
+_TRANSIENT = (408, 429)
+
+
+def cacheable(status_code: int) -> bool:
+    return status_code < 500 and status_code not in _TRANSIENT
+
+
+def scoped_key(subject: str, key: str) -> str:
+    return hashlib.sha256(f"{subject}\0{key}".encode()).hexdigest()
+
+
+def fingerprint(method: str, path: str, body: bytes) -> str:
+    digest = hashlib.sha256(f"{method} {path}\0".encode())
+    digest.update(body)
+    return digest.hexdigest()
+
+
+class StoredResponse:
+    __slots__ = ("status_code", "headers", "body", "fingerprint")
+
+    def __init__(self, status_code: int, headers: list, body: bytes, fingerprint: str):
+        self.status_code = status_code
+        self.headers = headers
+        self.body = body
+        self.fingerprint = fingerprint
+
+    @classmethod
+    def from_response(cls, response: Response, fingerprint: str) -> "StoredResponse":
+        headers = [(k.decode("latin-1"), v.decode("latin-1")) for k, v in response.raw_headers
+                   if k != b"content-length"]
+        return cls(response.status_code, headers, bytes(response.body), fingerprint)
+
+    def to_response(self) -> Response:
+        response = Response(content=self.body, status_code=self.status_code)
+        response.raw_headers = [(k.encode("latin-1"), v.encode("latin-1")) for k, v in self.headers] + [
+            (b"content-length", str(len(self.body)).encode()),
+            (b"idempotent-replayed", b"true"),
+        ]
+        return response
+
+
+class MemoryStore:
+    """LRU of stored responses with a TTL; per process"""
+
+    def __init__(self, ttl: float = IDEMPOTENCY_TTL, max_keys: int = IDEMPOTENCY_MAX_KEYS):
+        self.ttl = ttl
+        self.max_keys = max_keys
+        self._entries = OrderedDict()
+
+    async def get(self, key: str) -> Optional[StoredResponse]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        stored, expires_at = entry
+        if expires_at <= time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return stored
+
+    async def claim(self, key: str, fingerprint: str) -> bool:
+        # In-process duplicates are already single-flighted by IdempotencyCache
+        return True
+
+    async def put(self, key: str, stored: StoredResponse):
+        self._entries[key] = (stored, time.time() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_keys:
+            self._entries.popitem(last=False)
+
+    async def release(self, key: str):
+        pass
+
+
+class DatabaseStore:
+    """Stored responses in the idempotency_keys table, shared by all workers.
+
+    Runs in the default executor without copying the request context, so its
+    statements don't count against the route's SQL budget or deadline.
+    """
+
+    def __init__(self, session_factory, ttl: float = IDEMPOTENCY_TTL):
+        self.session_factory = session_factory
+        self.ttl = ttl
+        self._claims = 0
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+    def _get(self, key: str) -> Optional[StoredResponse]:
+        with self.session_factory() as db:
+            row = db.get(IdempotencyRecord, key)
+            if row is None or row.status_code is None or row.expires_at <= time.time():
+                return None
+            return StoredResponse(row.status_code, json.loads(row.headers), row.body, row.fingerprint)
+
+    def _claim(self, key: str, fingerprint: str) -> bool:
+        now = time.time()
+        with self.session_factory() as db:
+            self._claims += 1
+            if self._claims % PURGE_EVERY == 0:
+                db.execute(delete(IdempotencyRecord).where(IdempotencyRecord.expires_at <= now))
+            # A pending or finished row past its TTL is abandoned; take it over
+            db.execute(delete(IdempotencyRecord).where(
+                IdempotencyRecord.key == key, IdempotencyRecord.expires_at <= now
+            ))
+            db.add(IdempotencyRecord(key=key, fingerprint=fingerprint, expires_at=now + self.ttl))
+            try:
+                db.commit()
+                return True
+            except IntegrityError:
+                db.rollback()
+                return False
+
+    def _put(self, key: str, stored: StoredResponse):
+        with self.session_factory() as db:
+            row = db.get(IdempotencyRecord, key)
+            if row is None:
+                row = IdempotencyRecord(key=key)
+                db.add(row)
+            row.fingerprint = stored.fingerprint
+            row.status_code = stored.status_code
+            row.headers = json.dumps(stored.headers)
+            row.body = stored.body
+            row.expires_at = time.time() + self.ttl
+            db.commit()
+
+    def _release(self, key: str):
+        with self.session_factory() as db:
+            db.execute(delete(IdempotencyRecord).where(
+                IdempotencyRecord.key == key, IdempotencyRecord.status_code.is_(None)
+            ))
+            db.commit()
+
+    async def get(self, key: str) -> Optional[StoredResponse]:
+        return await self._run(self._get, key)
+
+    async def claim(self, key: str, fingerprint: str) -> bool:
+        """Insert a pending row; False if another worker holds the key"""
+        return await self._run(self._claim, key, fingerprint)
+
+    async def put(self, key: str, stored: StoredResponse):
+        await self._run(self._put, key, stored)
+
+    async def release(self, key: str):
+        await self._run(self._release, key)
+
+
+class TieredStore:
+    """Memory in front of the database, so repeat retries on one worker skip the table"""
+
+    def __init__(self, memory: MemoryStore, database: DatabaseStore):
+        self.memory = memory
+        self.database = database
+
+    async def get(self, key: str) -> Optional[StoredResponse]:
+        stored = await self.memory.get(key)
+        if stored is None:
+            stored = await self.database.get(key)
+            if stored is not None:
+                await self.memory.put(key, stored)
+        return stored
+
+    async def claim(self, key: str, fingerprint: str) -> bool:
+        return await self.database.claim(key, fingerprint)
+
+    async def put(self, key: str, stored: StoredResponse):
+        await self.memory.put(key, stored)
+        await self.database.put(key, stored)
+
+    async def release(self, key: str):
+        await self.database.release(key)
+
+
+def _error(status_code: int, detail: str) -> Response:
+    return JSONResponse({"detail": detail}, status_code=status_code)
+
+
+def _mark_retrieved(future: asyncio.Future):
+    # Keeps asyncio from warning about an exception nobody was waiting for
+    if not future.cancelled():
+        future.exception()
+
+
+class IdempotencyCache:
+    def __init__(self, store):
+        self.store = store
+        self._in_flight = {}
+
+    async def execute(self, key: str, fingerprint: str,
+                      handler: Callable[[], Awaitable[Response]]) -> Response:
+        stored = None
+        if key not in self._in_flight:
+            stored = await self.store.get(key)
+        # Checked after the lookup too: a duplicate may have started while we awaited the store
+        if stored is None and key in self._in_flight:
+            stored = await asyncio.shield(self._in_flight[key])
+            if stored is None:
+                return _error(409, "A request with this Idempotency-Key is already in progress")
+        if stored is not None:
+            if stored.fingerprint != fingerprint:
+                return _error(422, "Idempotency-Key was already used for a different request")
+            return stored.to_response()
+
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(_mark_retrieved)
+        self._in_flight[key] = future
+        try:
+            if not await self.store.claim(key, fingerprint):
+                future.set_result(None)
+                return _error(409, "A request with this Idempotency-Key is already in progress")
+            try:
+                response = await handler()
+                if isinstance(response, BaseModel):
+                    # A bare model (FAST_RESPONSES=false) is rendered here so it can be stored
+                    response = validated_response(response)
+            except HTTPException as e:
+                # 404s and other client errors are final outcomes worth replaying too
+                response = JSONResponse({"detail": e.detail}, status_code=e.status_code, headers=e.headers)
+            stored = StoredResponse.from_response(response, fingerprint)
+            if cacheable(response.status_code):
+                await self.store.put(key, stored)
+            else:
+                await self.store.release(key)
+            future.set_result(stored)
+            return response
+        except BaseException as e:
+            if not future.done():
+                if isinstance(e, Exception):
+                    future.set_exception(e)
+                else:
+                    future.cancel()
+            await asyncio.shield(self.store.release(key))
+            raise
+        finally:
+            del self._in_flight[key]
+
+
+class IdempotentRequest:
+    """Per-request handle given to endpoints; run() is a plain call without a key"""
+
+    __slots__ = ("cache", "key", "fingerprint")
+
+    def __init__(self, cache: Optional[IdempotencyCache], key: Optional[str] = None,
+                 fingerprint: Optional[str] = None):
+        self.cache = cache
+        self.key = key
+        self.fingerprint = fingerprint
+
+    async def run(self, handler: Callable[[], Awaitable[Response]]) -> Response:
+        if self.key is None:
+            return await handler()
+        return await self.cache.execute(self.key, self.fingerprint, handler)
+
+
+def create_cache(backend: str = IDEMPOTENCY_BACKEND, session_factory=None) -> IdempotencyCache:
+    memory = MemoryStore()
+    if backend == "db":
+        if session_factory is None:
+            from docu_serve.database import SessionLocal as session_factory
+        return IdempotencyCache(TieredStore(memory, DatabaseStore(session_factory)))
+    return IdempotencyCache(memory)
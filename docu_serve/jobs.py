@@ -0,0 +1,333 @@
+# docu_serve/jobs.py
+"""Background bulk-deletion jobs.
+
+POST /api/admin/jobs/deletions stores a job (a list of user ids or a
+filter) in the deletion_jobs table and returns straight away. A JobRunner
+in each API process claims queued jobs and deletes their users in chunks of
+JOBS_CHUNK_SIZE, walking user_id upwards from a cursor kept on the job row,
+then publishes user.deleted for each deleted user the same way delete_user
+does (after the commit).
+
+Each chunk's deletes commit in the same transaction as a conditional UPDATE
+of the job row (WHERE status = 'running' AND locked_by = me). A cancel or a
+lost lease makes that update match nothing, so the chunk is rolled back and
+nothing is deleted after a cancel. The runner renews a lease on every chunk;
+if its process dies the lease runs out and any runner resumes the job from
+the cursor. Progress counters and elapsed time are on the row for polling.
+"""
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+from bisect import bisect_right
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, List, Optional
+
+from sqlalchemy import delete, func, or_, select, update
+
+from docu_serve.audit import make_record
+from docu_serve.models import DeletionJob, User
+from docu_serve.schemas import DeletionJobCreate, DeletionJobOut
+from docu_serve.sharding import ShardFrozen
+
+logger = logging.getLogger(__name__)
+
+JOBS_ENABLED = os.getenv("JOBS_ENABLED", "true").lower() == "true"
+JOBS_CHUNK_SIZE = int(os.getenv("JOBS_CHUNK_SIZE", "500"))
+JOBS_POLL_INTERVAL = float(os.getenv("JOBS_POLL_INTERVAL", "2"))
+JOBS_LEASE_SECONDS = float(os.getenv("JOBS_LEASE_SECONDS", "60"))
+JOBS_MAX_IDS = int(os.getenv("JOBS_MAX_IDS", "100000"))
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+CANCELLED = "cancelled"
+FAILED = "failed"
+ACTIVE = (QUEUED, RUNNING)
+RESUMABLE = (CANCELLED, FAILED)
+
+# async (event_type, payloads) -> None, publishes a batch of events
+PublishMany = Callable[[str, List[dict]], Awaitable[None]]
+# async (audit records) -> None, e.g. AuditLog.record_many
+AuditMany = Callable[[List[dict]], Awaitable[None]]
+
+
+def _iso(timestamp: Optional[float]) -> Optional[datetime]:
+    return datetime.fromtimestamp(timestamp, timezone.utc) if timestamp is not None else None
+
+
+def job_out(job: DeletionJob) -> DeletionJobOut:
+    progress = 1.0 if job.status == COMPLETED else min(1.0, job.processed / job.total) if job.total else 0.0
+    return DeletionJobOut.model_construct(
+        job_id=job.job_id,
+        status=job.status,
+        requested_by=job.requested_by,
+        total=job.total,
+        processed=job.processed,
+        deleted=job.deleted,
+        not_found=job.not_found,
+        progress=round(progress, 4),
+        elapsed_seconds=round(job.elapsed_seconds, 3),
+        throughput_per_second=round(job.processed / job.elapsed_seconds, 1) if job.elapsed_seconds else None,
+        error=job.error,
+        created_at=_iso(job.created_at),
+        started_at=_iso(job.started_at),
+        finished_at=_iso(job.finished_at),
+    )
+
+
+def _filter_conditions(filter_: dict) -> list:
+    conditions = []
+    if filter_.get("role") is not None:
+        conditions.append(User.role == filter_["role"])
+    if filter_.get("email_domain") is not None:
+        conditions.append(User.email.endswith("@" + filter_["email_domain"], autoescape=True))
+    if filter_.get("min_user_id") is not None:
+        conditions.append(User.user_id >= filter_["min_user_id"])
+    if filter_.get("max_user_id") is not None:
+        conditions.append(User.user_id <= filter_["max_user_id"])
+    return conditions
+
+
+def create_job(db, payload: DeletionJobCreate, requested_by: str) -> DeletionJobOut:
+    job = DeletionJob(job_id=uuid.uuid4().hex, status=QUEUED, requested_by=requested_by, processed=0, deleted=0,
+                      not_found=0, elapsed_seconds=0.0, created_at=time.time())
+    if payload.user_ids is not None:
+        user_ids = sorted(set(payload.user_ids))
+        job.user_ids = json.dumps(user_ids)
+        job.total = len(user_ids)
+    else:
+        filter_ = payload.filter.model_dump(exclude_none=True)
+        job.filter = json.dumps(filter_)
+        # Users matching later are still deleted, progress is capped at 1
+        # Summed, a sharded session returns one count per shard
+        count = select(func.count()).select_from(User).where(*_filter_conditions(filter_))
+        job.total = sum(db.execute(count).scalars())
+    db.add(job)
+    # Snapshot first, reading the job back after the commit would cost another SELECT
+    out = job_out(job)
+    db.commit()
+    return out
+
+
+def _transition(db, job_id: str, from_statuses: tuple, **values) -> Optional[DeletionJob]:
+    """Move a job between states; None if it doesn't exist, unchanged if it wasn't in from_statuses"""
+    db.execute(
+        update(DeletionJob)
+        .where(DeletionJob.job_id == job_id, DeletionJob.status.in_(from_statuses))
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return db.get(DeletionJob, job_id)
+
+
+def cancel_job(db, job_id: str) -> Optional[DeletionJob]:
+    now = time.time()
+    return _transition(db, job_id, ACTIVE, status=CANCELLED, finished_at=now, locked_by=None, lease_expires_at=None)
+
+
+def resume_job(db, job_id: str) -> Optional[DeletionJob]:
+    return _transition(db, job_id, RESUMABLE, status=QUEUED, error=None, finished_at=None,
+                       locked_by=None, lease_expires_at=None)
+
+
+class _ClaimedJob:
+    __slots__ = ("job_id", "requested_by", "user_ids", "filter", "cursor", "marked_at")
+
+    def __init__(self, job: DeletionJob):
+        self.job_id = job.job_id
+        self.requested_by = job.requested_by
+        self.user_ids = json.loads(job.user_ids) if job.user_ids is not None else None
+        self.filter = json.loads(job.filter) if job.filter is not None else None
+        self.cursor = job.cursor
+        # Wall-clock time is added to elapsed_seconds in chunk commits, so publishing counts too
+        self.marked_at = time.monotonic()
+
+
+class JobRunner:
+    """Claims deletion jobs and works through them one chunk at a time"""
+
+    def __init__(self, session_factory, publish_many: PublishMany, chunk_size: int = JOBS_CHUNK_SIZE,
+                 poll_interval: float = JOBS_POLL_INTERVAL, lease_seconds: float = JOBS_LEASE_SECONDS,
+                 audit_many: Optional[AuditMany] = None):
+        self.session_factory = session_factory
+        self.publish_many = publish_many
+        self.audit_many = audit_many
+        self.chunk_size = chunk_size
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.runner_id = f"{socket.gethostname()[:40]}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._job: Optional[_ClaimedJob] = None
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._task: Optional[asyncio.Task] = None
+
+    def _claim(self) -> Optional[_ClaimedJob]:
+        now = time.time()
+        claimable = (DeletionJob.status.in_(ACTIVE),
+                     or_(DeletionJob.lease_expires_at.is_(None), DeletionJob.lease_expires_at < now))
+        with self.session_factory() as db:
+            job_id = db.execute(
+                select(DeletionJob.job_id).where(*claimable).order_by(DeletionJob.created_at).limit(1)
+            ).scalar()
+            if job_id is None:
+                return None
+            # Conditional, so two runners racing for the same job can't both win
+            result = db.execute(
+                update(DeletionJob)
+                .where(DeletionJob.job_id == job_id, *claimable)
+                .values(status=RUNNING, locked_by=self.runner_id, lease_expires_at=now + self.lease_seconds,
+                        started_at=func.coalesce(DeletionJob.started_at, now))
+                .execution_options(synchronize_session=False)
+            )
+            db.commit()
+            if result.rowcount != 1:
+                return None
+            return _ClaimedJob(db.get(DeletionJob, job_id))
+
+    def _owned(self, job_id: str) -> tuple:
+        return (DeletionJob.job_id == job_id, DeletionJob.status == RUNNING,
+                DeletionJob.locked_by == self.runner_id)
+
+    def _next_targets(self, db, job: _ClaimedJob):
+        """(users to delete, ids handled, new cursor); handled is 0 when the job is done"""
+        if job.user_ids is not None:
+            start = bisect_right(job.user_ids, job.cursor) if job.cursor is not None else 0
+            chunk = job.user_ids[start:start + self.chunk_size]
+            if not chunk:
+                return [], 0, job.cursor
+            rows = db.execute(select(User.user_id, User.email).where(User.user_id.in_(chunk))).all()
+            return rows, len(chunk), chunk[-1]
+        conditions = _filter_conditions(job.filter)
+        if job.cursor is not None:
+            conditions.append(User.user_id > job.cursor)
+        rows = db.execute(
+            select(User.user_id, User.email).where(*conditions).order_by(User.user_id).limit(self.chunk_size)
+        ).all()
+        # Sharded sessions concatenate each shard's ordered, limited rows
+        rows = sorted(rows, key=lambda row: row.user_id)[:self.chunk_size]
+        return rows, len(rows), rows[-1].user_id if rows else job.cursor
+
+    def _process_chunk(self, job: _ClaimedJob) -> Optional[tuple]:
+        """Delete the next chunk; returns (deleted rows, finished), None if the job was taken away"""
+        with self.session_factory() as db:
+            rows, handled, cursor = self._next_targets(db, job)
+            now = time.time()
+            elapsed = DeletionJob.elapsed_seconds + (time.monotonic() - job.marked_at)
+            if handled:
+                db.execute(delete(User).where(User.user_id.in_([row.user_id for row in rows]))
+                           .execution_options(synchronize_session=False))
+                values = dict(cursor=cursor, processed=DeletionJob.processed + handled,
+                              deleted=DeletionJob.deleted + len(rows),
+                              not_found=DeletionJob.not_found + handled - len(rows),
+                              lease_expires_at=now + self.lease_seconds)
+            else:
+                values = dict(status=COMPLETED, finished_at=now, locked_by=None, lease_expires_at=None)
+            result = db.execute(
+                update(DeletionJob).where(*self._owned(job.job_id)).values(elapsed_seconds=elapsed, **values)
+                .execution_options(synchronize_session=False)
+            )
+            if result.rowcount != 1:
+                db.rollback()
+                return None
+            db.commit()
+        job.cursor = cursor
+        job.marked_at = time.monotonic()
+        return rows, not handled
+
+    def _fail(self, job_id: str, error: str):
+        with self.session_factory() as db:
+            db.execute(
+                update(DeletionJob).where(*self._owned(job_id))
+                .values(status=FAILED, error=error[:1000], finished_at=time.time(), locked_by=None,
+                        lease_expires_at=None)
+                .execution_options(synchronize_session=False)
+            )
+            db.commit()
+
+    def _release(self, job_id: str):
+        # Let any runner pick the job up right away instead of waiting out the lease
+        with self.session_factory() as db:
+            db.execute(update(DeletionJob).where(*self._owned(job_id)).values(lease_expires_at=time.time())
+                       .execution_options(synchronize_session=False))
+            db.commit()
+
+    async def run_once(self) -> bool:
+        """Claim a job if idle and process one chunk of it; False when there was nothing to do"""
+        if self._job is None:
+            self._job = await asyncio.to_thread(self._claim)
+            if self._job is None:
+                return False
+            logger.info("Deletion job claimed", extra={"job_id": self._job.job_id})
+        job = self._job
+        try:
+            outcome = await asyncio.to_thread(self._process_chunk, job)
+        except ShardFrozen as e:
+            # A shard split pauses writes for a few seconds; try again at the next poll
+            logger.info(f"Deletion job waiting: {e}", extra={"job_id": job.job_id})
+            return False
+        except Exception as e:
+            logger.error(f"Deletion job failed: {e}", extra={"job_id": job.job_id})
+            self._job = None
+            await asyncio.to_thread(self._fail, job.job_id, str(e))
+            return True
+        if outcome is None:
+            # Cancelled or taken over; this chunk was rolled back
+            logger.info("Deletion job stopped", extra={"job_id": job.job_id})
+            self._job = None
+            return True
+        rows, finished = outcome
+        if finished:
+            logger.info("Deletion job completed", extra={"job_id": job.job_id})
+            self._job = None
+            return True
+        if rows:
+            if self.audit_many is not None:
+                await self.audit_many([make_record(job.requested_by, "user.deleted", row.user_id,
+                                                   {"email": row.email, "job_id": job.job_id}, source="job")
+                                       for row in rows])
+            await self.publish_many("user.deleted", [{"user_id": row.user_id, "email": row.email} for row in rows])
+        return True
+
+    def wake(self):
+        """Check for work now instead of at the next poll"""
+        self._wakeup.set()
+
+    async def _loop(self):
+        while not self._stopping:
+            try:
+                worked = await self.run_once()
+            except Exception as e:
+                logger.warning(f"Deletion job runner error: {e}")
+                worked = False
+            if worked or self._stopping:
+                continue
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self, timeout: float = 10.0):
+        """Finish the current chunk (and its publish), then hand the job back"""
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        try:
+            await asyncio.wait_for(self._task, timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Deletion job runner did not stop in time, cancelling")
+        self._task = None
+        if self._job is not None:
+            await asyncio.to_thread(self._release, self._job.job_id)
+            self._job = None
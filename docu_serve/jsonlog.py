@@ -0,0 +1,299 @@
+# docu_serve/jsonlog.py
+"""Non-blocking structured logging shared by the API and the worker.
+
+Log calls only copy the record onto a bounded queue; a background thread
+formats records as JSON lines and writes them in batches to stdout and,
+optionally, a file (LOG_FILE). Files are rotated by size (LOG_MAX_BYTES) or
+age (LOG_ROTATE_INTERVAL) and rotated files are gzipped, keeping the newest
+LOG_BACKUP_COUNT.
+
+Under bursts the queue never grows past LOG_QUEUE_SIZE: above 80% full only
+WARNING and up are accepted, when full everything is dropped, and the writer
+logs how many records of each level it lost once it catches up. Failed events
+(failed_events.log) are replay data, so their writer never drops: if its
+queue is full the record is written synchronously instead, and the file is
+never rotated, compressed or pruned.
+
+Extra fields passed with `extra={...}` become top-level JSON keys, and the
+current trace id is attached when tracing is on.
+"""
+import atexit
+import copy
+import glob
+import gzip
+import json
+import logging
+import os
+import queue
+import shutil
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+from docu_serve import tracing
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FILE = os.getenv("LOG_FILE")  # unset = stdout only
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_ROTATE_INTERVAL = float(os.getenv("LOG_ROTATE_INTERVAL", "86400"))  # seconds, 0 = size only
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "7"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "256"))
+LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", "0.5"))
+FAILED_EVENTS_LOG = os.getenv("FAILED_EVENTS_LOG", "failed_events.log")
+
+# Above this fraction of the queue, records below WARNING are dropped
+HIGH_WATER = 0.8
+
+# Standard LogRecord attributes; anything else on a record came from extra={...}
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+def format_record(record: logging.LogRecord, static: Optional[dict] = None) -> str:
+    entry = {
+        "timestamp": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+        "level": record.levelname,
+        "logger": record.name,
+        "message": record.message,
+    }
+    if static:
+        entry.update(static)
+    for key, value in record.__dict__.items():
+        if key not in _RESERVED:
+            entry[key] = value
+    if record.exc_text:
+        entry["exception"] = record.exc_text
+    return json.dumps(entry, default=str)
+
+
+class StreamSink:
+    def __init__(self, stream=None):
+        self.stream = stream
+
+    def write(self, lines):
+        # Resolved per write so pytest's capture and redirected stdout are honoured
+        stream = self.stream or sys.stdout
+        stream.write("".join(lines))
+        stream.flush()
+
+
+class RotatingFileSink:
+    """Appends lines to `path`, rotating by size or age into gzipped backups"""
+
+    def __init__(self, path: str, max_bytes: int = LOG_MAX_BYTES, interval: float = LOG_ROTATE_INTERVAL,
+                 backup_count: int = LOG_BACKUP_COUNT, compress: bool = True):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self.backup_count = backup_count
+        self.compress = compress
+        self._period_start = time.time()
+
+    def write(self, lines):
+        # Opened per batch, so the file may be moved or deleted from outside between batches
+        with open(self.path, "a") as f:
+            f.write("".join(lines))
+            size = f.tell()
+        if (self.max_bytes and size >= self.max_bytes) or \
+                (self.interval and time.time() - self._period_start >= self.interval):
+            self.rotate()
+
+    def rotate(self):
+        self._period_start = time.time()
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+        target = f"{self.path}.{stamp}.{os.getpid()}"
+        try:
+            os.rename(self.path, target)
+        except FileNotFoundError:
+            return  # another process rotated it first
+        if self.compress:
+            with open(target, "rb") as src, gzip.open(target + ".gz", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(target)
+        self._prune()
+
+    def backups(self):
+        return sorted(glob.glob(glob.escape(self.path) + ".*"))
+
+    def _prune(self):
+        if self.backup_count <= 0:
+            return
+        for old in self.backups()[:-self.backup_count]:
+            try:
+                os.remove(old)
+            except FileNotFoundError:
+                pass
+
+
+class LogWriter:
+    """Bounded queue of records drained in batches by a background thread"""
+
+    def __init__(self, sinks, static: Optional[dict] = None, queue_size: int = LOG_QUEUE_SIZE,
+                 batch_size: int = LOG_BATCH_SIZE, interval: float = LOG_FLUSH_INTERVAL,
+                 overflow: str = "drop"):
+        self.sinks = sinks
+        self.static = static
+        self.batch_size = batch_size
+        self.interval = interval
+        self.overflow = overflow
+        self.high_water = int(queue_size * HIGH_WATER)
+        self.dropped = {}
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, record: logging.LogRecord):
+        if self.overflow == "drop" and record.levelno < logging.WARNING \
+                and self._queue.qsize() >= self.high_water:
+            self._drop(record)
+            return
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            if self.overflow == "sync":
+                with self._lock:
+                    self._write([record])
+            else:
+                self._drop(record)
+            return
+        if self._queue.qsize() >= self.batch_size:
+            self._wake.set()
+
+    def _drop(self, record):
+        # Read-modify-write race between threads only costs accuracy of the count
+        self.dropped[record.levelname] = self.dropped.get(record.levelname, 0) + 1
+
+    def _write(self, records):
+        lines = [format_record(record, self.static) + "\n" for record in records]
+        for sink in self.sinks:
+            try:
+                sink.write(lines)
+            except Exception as e:
+                # Nowhere better to report a broken log sink
+                sys.stderr.write(f"log sink {type(sink).__name__} failed: {e}\n")
+
+    def _drop_summary(self) -> Optional[logging.LogRecord]:
+        if not self.dropped:
+            return None
+        dropped, self.dropped = self.dropped, {}
+        record = logging.LogRecord(__name__, logging.WARNING, __file__, 0,
+                                   "Dropped %d log records under load", (sum(dropped.values()),), None)
+        record.message = record.getMessage()
+        record.dropped = dropped
+        return record
+
+    def _export(self):
+        with self._lock:
+            while True:
+                batch = []
+                while len(batch) < self.batch_size:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                summary = self._drop_summary()
+                if summary is not None:
+                    batch.append(summary)
+                if not batch:
+                    return
+                self._write(batch)
+
+    def _run(self):
+        while not self._closed:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self._export()
+
+    def flush(self):
+        self._export()
+
+    def close(self):
+        self._closed = True
+        self._wake.set()
+        self._export()
+
+
+class QueueingHandler(logging.Handler):
+    """Hands records to a LogWriter; emit() does no I/O"""
+
+    def __init__(self, writer: LogWriter, level=logging.NOTSET):
+        super().__init__(level)
+        self.writer = writer
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Like logging.handlers.QueueHandler: resolve message/args and traceback now, on the caller's
+        # thread, since args may change and exc_info can't be formatted later
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg, record.args, record.exc_info = record.message, None, None
+        span = tracing.current_span()
+        if span is not None:
+            record.trace_id = span.trace_id_hex
+        return record
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            self.writer.submit(self.prepare(record))
+        except Exception:
+            self.handleError(record)
+
+
+_writers = []
+_root_handler: Optional[QueueingHandler] = None
+_failed_events: Optional[logging.Logger] = None
+
+
+def configure(service: str, level: str = LOG_LEVEL, log_file: Optional[str] = LOG_FILE):
+    """Route all logging through the pipeline; called once per process (API import, worker start)"""
+    global _root_handler
+    root = logging.getLogger()
+    if _root_handler is not None:
+        root.removeHandler(_root_handler)
+        _root_handler.writer.close()
+        _writers.remove(_root_handler.writer)
+    sinks = [StreamSink()]
+    if log_file:
+        sinks.append(RotatingFileSink(log_file))
+    writer = LogWriter(sinks, static={"service": service})
+    _writers.append(writer)
+    _root_handler = QueueingHandler(writer)
+    root.addHandler(_root_handler)
+    root.setLevel(level)
+    return _root_handler
+
+
+def failed_event_logger() -> logging.Logger:
+    """Logger whose records go only to FAILED_EVENTS_LOG, one JSON line per event, never dropped"""
+    global _failed_events
+    if _failed_events is None:
+        # Append-only: no rotation, so nothing is pruned before it is replayed
+        sink = RotatingFileSink(FAILED_EVENTS_LOG, max_bytes=0, interval=0, backup_count=0, compress=False)
+        writer = LogWriter([sink], overflow="sync")
+        _writers.append(writer)
+        logger = logging.getLogger("docu_serve.failed_events")
+        logger.addHandler(QueueingHandler(writer))
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        _failed_events = logger
+    return _failed_events
+
+
+def flush():
+    """Write out everything queued so far"""
+    for writer in _writers:
+        writer.flush()
+
+
+def shutdown():
+    for writer in _writers:
+        writer.close()
+
+
+atexit.register(shutdown)
@@ -1,22 +1,42 @@
 # docu_serve/main.py
 # Admin User Deletion Service - Fixed version with 84% test coverage
-from contextlib import asynccontextmanager
-from docu_serve.database import get_db, engine
-from docu_serve.models import Base, User
-from docu_serve.schemas import DeleteResponse, DeletedUserSummary, UserUpdate, UserOut
-from fastapi import FastAPI, Depends, HTTPException, status
+from contextlib import asynccontextmanager, nullcontext
+from docu_serve.database import (
+    get_db, get_session_factory, engine, SessionLocal, shard_router, create_tables, tables_created_by_launcher
+)
+from docu_serve.models import DeletionJob, User
+from docu_serve.schemas import (
+    DeleteResponse, DeletedUserSummary, DeletionJobCreate, DeletionJobOut, UserUpdate, UserOut
+)
+from docu_serve.admission import CONCURRENCY_RETRY_AFTER, AdmissionController
+from docu_serve.breakers import AsyncCircuitBreaker, breaker_status, breaker_storage
+from docu_serve.coalescing import COALESCED_EVENT_TYPE, EventCoalescer
+from docu_serve import deadlines
+from docu_serve.deadlines import DeadlineExceeded, DeadlineMiddleware
+from docu_serve.events import encode_event
+from docu_serve import audit, bulk, idempotency, jobs, jsonlog, users
+from docu_serve.idempotency import IdempotentRequest
+from docu_serve.health import HealthMonitor, probe_auth, probe_broker, probe_database, probe_replicas
+from docu_serve.replicas import router as replica_router
+from docu_serve.sharding import SHARD_FROZEN_RETRY_AFTER, ShardFrozen
+from docu_serve.metrics import MetricsMiddleware, preallocate, render_metrics, timed
+from docu_serve.responses import fast_response
+from docu_serve.profiling import ProfilingMiddleware, profile_path, profiling_enabled
+from docu_serve.tracing import TracingMiddleware, current_traceparent, start_span
+from docu_serve.warmup import Warmup, fill_pools, open_keepalive
+from fastapi import FastAPI, Depends, HTTPException, Request, Response, status
+from fastapi.responses import FileResponse, JSONResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from jose import jwt, JWTError
-from pybreaker import CircuitBreaker, CircuitBreakerError
+from pybreaker import CircuitBreakerError
 import httpx
 import os
 import aio_pika
-import json
 from dotenv import load_dotenv
 from sqlalchemy.orm import Session
-from sqlalchemy import text
-from datetime import datetime
+from typing import Optional
 import logging
+import uuid
 import asyncio
 
 #load environment variables
@@ -33,32 +53,128 @@ RABBIT_URL = os.getenv("RABBIT_URL")
 # OAuth2 scheme definition OAuth2PasswordBearer for token extraction
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/users/login")
 
-#Create logger
+# Create logger; records are written as JSON lines by a background thread
+jsonlog.configure(service=os.getenv("LOG_SERVICE_NAME", "admin-user-deletion"))
 logger = logging.getLogger(__name__)
+failed_events = jsonlog.failed_event_logger()
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Create database tables
-    Base.metadata.create_all(bind=engine)
-    print("Database tables created")
+    # Create database tables, unless the gunicorn master already did before forking the workers
+    if not tables_created_by_launcher():
+        create_tables()
+        logger.info("Database tables created")
+    # Probe dependencies in the background; health endpoints serve the cached results
+    health_monitor.start()
+    if jobs.JOBS_ENABLED:
+        job_runner.start()
+    if audit.AUDIT_ENABLED:
+        await audit_log.start()
+    # Keep-alive pool for auth calls; warm-up opens its first connections
+    global auth_client
+    auth_client = httpx.AsyncClient(timeout=10.0)
+    # /health/ready answers 503 until the pools and the publisher channel are open
+    warmup.start()
     yield
+    await warmup.stop()
+    await job_runner.stop()
+    await audit_log.stop()
+    await event_coalescer.close()
+    await close_publisher()
+    await auth_client.aclose()
+    auth_client = None
+    await health_monitor.stop()
     
+# Max SQL statements per request by route; exceeding logs a warning (SQL_BUDGET_MODE=raise fails instead)
+QUERY_BUDGETS = {
+    "DELETE /api/admin/delete/{user_id}": 2,
+    "PATCH /api/admin/users/{user_id}": 2,
+    "GET /health/detailed": 1,
+    "POST /api/admin/jobs/deletions": 2,
+    "GET /api/admin/jobs/{job_id}": 1,
+    "POST /api/admin/jobs/{job_id}/cancel": 2,
+    "POST /api/admin/jobs/{job_id}/resume": 2,
+}
+
 app = FastAPI(title="Admin User Deletion API", lifespan=lifespan)
+# Only installed when PROFILE_SECRET or PROFILE_SAMPLE_RATE is set, so it costs nothing otherwise
+if profiling_enabled():
+    app.add_middleware(ProfilingMiddleware)
+app.add_middleware(DeadlineMiddleware)
+app.add_middleware(MetricsMiddleware, query_budgets=QUERY_BUDGETS)
+app.add_middleware(TracingMiddleware)
+
+
+@app.exception_handler(ShardFrozen)
+async def shard_frozen_handler(request: Request, exc: ShardFrozen):
+    # The user's shard is being split; the write pause lasts seconds
+    return JSONResponse({"detail": str(exc)}, status_code=503,
+                        headers={"Retry-After": str(SHARD_FROZEN_RETRY_AFTER)})
 
 #Configuration of circuit breaker for the authorization service
-auth_breaker = CircuitBreaker(
+auth_breaker = AsyncCircuitBreaker(
     fail_max=3,
     reset_timeout=30,
+    exclude=[DeadlineExceeded],  # a spent request budget is not the service's fault
+    state_storage=breaker_storage("auth_service_breaker"),  # host-wide when BREAKER_STATE_FILE is set
     name="auth_service_breaker"
 )
 
 #Configuration of circuit breaker for RabbitMQ
-rabbitmq_breaker = CircuitBreaker(
+rabbitmq_breaker = AsyncCircuitBreaker(
     fail_max=5,#more tolerant for message queues 
     reset_timeout=60,
+    exclude=[DeadlineExceeded],
+    state_storage=breaker_storage("rabbitmq_breaker"),
     name="rabbitmq_breaker"
 )
 
+# Stored first responses for Idempotency-Key retries (IDEMPOTENCY_BACKEND=db shares them across workers)
+idempotency_cache = idempotency.create_cache()
+
+# Admin actions, buffered and inserted in batches off the request path
+audit_log = audit.AuditLog(SessionLocal, enabled=audit.AUDIT_ENABLED)
+
+# Works through bulk deletion jobs in the background, resuming any left behind by a restart
+job_runner = jobs.JobRunner(SessionLocal, lambda event_type, payloads: publish_events(event_type, payloads),
+                            audit_many=audit_log.record_many)
+
+# Holds user.updated snapshots for EVENT_COALESCE_WINDOW seconds, publishing the latest per user (off by default)
+event_coalescer = EventCoalescer(lambda event_type, payloads: _send_events(event_type, payloads))
+
+# Shared auth client and publisher channel, opened at startup; None until then (and in tests), when calls open their own
+auth_client: Optional[httpx.AsyncClient] = None
+publisher_connection = None
+publisher_exchange = None
+
+# Per-admin token buckets plus a cap on in-flight admin requests; rejects instead of queueing
+admission = AdmissionController()
+
+health_monitor = HealthMonitor({
+    "database": probe_database,
+    "broker": lambda: probe_broker(RABBIT_URL),
+    "auth_service": lambda: probe_auth(AUTH_SERVICE_URL),
+    # Also keeps the replica lag used for routing up to date
+    **({"replicas": lambda: probe_replicas(replica_router)} if replica_router.replicas else {}),
+})
+
+
+def _engines():
+    # Every pool a request may use: the primary, users_admin shards and read replicas
+    yield engine
+    if shard_router is not None:
+        yield from shard_router.engines.values()
+    for replica in replica_router.replicas:
+        yield replica.engine
+
+
+# Startup warm-up gating /health/ready; only the database is required, as in /health/detailed
+warmup = Warmup({
+    "database": lambda: fill_pools(_engines()),
+    "broker": lambda: open_publisher(),
+    "auth_service": lambda: open_keepalive(auth_client, AUTH_SERVICE_URL),
+})
+
 async def get_rabbitmq_connection():
     """Connect to RabbitMQ with retry logic"""
     max_retries = 5
@@ -66,9 +182,11 @@ async def get_rabbitmq_connection():
     
     for attempt in range(max_retries):
         try:
-            connection = await aio_pika.connect_robust(RABBIT_URL, timeout=5.0)
+            connection = await aio_pika.connect_robust(RABBIT_URL, timeout=deadlines.timeout(5.0))
             logger.info("Successfully connected to RabbitMQ")
             return connection
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             if attempt < max_retries - 1:
                 logger.warning(f"RabbitMQ connection attempt {attempt + 1} failed, retrying in {retry_delay}s...")
@@ -77,37 +195,111 @@ async def get_rabbitmq_connection():
                 logger.error(f"Failed to connect to RabbitMQ after {max_retries} attempts: {str(e)}")
                 raise
 
+
+async def open_publisher() -> dict:
+    # Warm-up step: one robust connection and channel with user_events declared, reused by every publish
+    global publisher_connection, publisher_exchange
+    connection = await aio_pika.connect_robust(RABBIT_URL)
+    try:
+        channel = await connection.channel()
+        exchange = await channel.declare_exchange("user_events", aio_pika.ExchangeType.TOPIC, durable=True)
+    except Exception:
+        await connection.close()
+        raise
+    publisher_connection, publisher_exchange = connection, exchange
+    return {"exchange": "user_events"}
+
+
+async def close_publisher():
+    global publisher_connection, publisher_exchange
+    if publisher_connection is not None:
+        await publisher_connection.close()
+    publisher_connection = publisher_exchange = None
+
 async def publish_event(event_type:str, payload: dict):
     #Publishes the event to RabbitMQ with circuit breaker protection
+    if event_coalescer.enabled:
+        if event_type == COALESCED_EVENT_TYPE:
+            event_coalescer.add(payload)
+            return
+        # Pending updates go out first so a delete never overtakes them
+        await event_coalescer.flush()
     try:
-        await rabbitmq_breaker.call_async(_publish_to_rabbitmq, event_type, payload)
+        with timed("publish"), start_span("amqp.publish", event_type=event_type):
+            await rabbitmq_breaker.call_async(_publish_to_rabbitmq, event_type, payload)
     except CircuitBreakerError:
         #Circuit breaker is open, log the event instead of publishing
         logger.warning(f"RabbitMQ circuit breaker is open. Event {event_type} not published.")
         _log_failed_event(event_type, payload)
+    except DeadlineExceeded:
+        # The DB change is already committed, so keep the event for replay rather than failing the request
+        logger.warning(f"Request deadline exceeded before event {event_type} was published.")
+        _log_failed_event(event_type, payload)
 
-async def _publish_to_rabbitmq(event_type: str, payload: dict):
-    #Internal function that actually publishes to RabbitMQ
+
+async def publish_events(event_type: str, payloads: list):
+    # Publishes a batch over one connection (bulk jobs); the DB changes are committed, so failures are logged for replay
+    if event_coalescer.enabled:
+        if event_type == COALESCED_EVENT_TYPE:
+            for payload in payloads:
+                event_coalescer.add(payload)
+            return
+        await event_coalescer.flush()
+    await _send_events(event_type, payloads)
+
+
+async def _send_events(event_type: str, payloads: list):
+    try:
+        await rabbitmq_breaker.call_async(_publish_to_rabbitmq, event_type, *payloads)
+    except CircuitBreakerError:
+        logger.warning(f"RabbitMQ circuit breaker is open. {len(payloads)} {event_type} events not published.")
+        for payload in payloads:
+            _log_failed_event(event_type, payload)
+    except Exception as e:
+        logger.error(f"Failed to publish {len(payloads)} {event_type} events: {str(e)}")
+        for payload in payloads:
+            _log_failed_event(event_type, payload)
+
+
+async def _publish_to_rabbitmq(event_type: str, *payloads: dict):
+    # Bounded by the request deadline, including connection retries
+    async with deadlines.bounded():
+        await _publish(event_type, *payloads)
+
+
+async def _publish(event_type: str, *payloads: dict):
+    # Internal function that actually publishes to RabbitMQ, on the warm publisher channel if open
+    if publisher_exchange is not None and not publisher_connection.is_closed:
+        await _publish_on(publisher_exchange, event_type, payloads)
+        return
+    # Otherwise one connection for all payloads
     connection = await get_rabbitmq_connection()
     try:
         channel = await connection.channel()
         exchange = await channel.declare_exchange("user_events", aio_pika.ExchangeType.TOPIC,
         durable=True
         )
-        message = aio_pika.Message(body=json.dumps(payload).encode())
-        await exchange.publish(message, routing_key=event_type)
-        logger.info(f"Published event {event_type} to RabbitMQ")
+        await _publish_on(exchange, event_type, payloads)
     finally:
         await connection.close()
 
+
+async def _publish_on(exchange, event_type: str, payloads):
+    # Carry the trace context so the worker continues the same trace
+    traceparent = current_traceparent()
+    headers = {"traceparent": traceparent} if traceparent else None
+    for payload in payloads:
+        body, content_type = encode_event(event_type, payload)
+        # Unique per event and kept across redeliveries, so the worker can drop duplicates
+        message = aio_pika.Message(body=body, content_type=content_type, headers=headers,
+                                   message_id=uuid.uuid4().hex)
+        await exchange.publish(message, routing_key=event_type)
+    logger.info(f"Published {len(payloads)} {event_type} event(s) to RabbitMQ")
+
 def _log_failed_event(event_type: str, payload: dict):
-    #Logs failed events to a file
-    with open("failed_events.log", "a") as f:
-        f.write(json.dumps({
-            "timestamp": datetime.utcnow().isoformat(),
-            "event_type": event_type,
-            "payload": payload
-        }) + "\n")
+    # Queues the event for failed_events.log (one JSON line with timestamp, event_type, payload)
+    # without blocking the loop
+    failed_events.warning("Event not published", extra={"event_type": event_type, "payload": payload})
 
 
 # Dependency to get current admin user from token, raises exception if not admin
@@ -115,7 +307,8 @@ def get_current_admin(token: str = Depends(oauth2_scheme)):
     credentials_exception = HTTPException(status_code=401, detail="Invalid token", headers={"WWW-Authenticate": "Bearer"})
     try:
         #Try to decode the JWT token using the SECRET_KEY and ALGORITHM
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM], audience="delete-service")
+        with timed("jwt"), start_span("auth.jwt"):
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM], audience="delete-service")
         role = payload.get("role")
         email = payload.get("sub")
         if role != "admin":# if role is not admin, raise exception
@@ -124,6 +317,46 @@ def get_current_admin(token: str = Depends(oauth2_scheme)):
     except JWTError:
         raise credentials_exception
 
+
+# Dependency for write routes: authenticates, then sheds load before any DB or broker work
+async def admit_admin(admin: dict = Depends(get_current_admin)):
+    await _admit(admin)
+    try:
+        yield admin
+    finally:
+        _release(admin)
+
+
+# Dependency for streamed admin routes: the slot outlives the handler, the response releases it when the stream ends
+async def admit_admin_stream(admin: dict = Depends(get_current_admin)):
+    await _admit(admin)
+    return admin
+
+
+async def _admit(admin: dict):
+    retry_after = await admission.rate_limit(admin["email"])
+    if retry_after:
+        raise HTTPException(status_code=429, detail="Rate limit exceeded", headers={"Retry-After": str(retry_after)})
+    if not admission.limiter.try_acquire():
+        raise HTTPException(status_code=503, detail="Server busy, retry later",
+                            headers={"Retry-After": str(CONCURRENCY_RETRY_AFTER)})
+
+
+def _release(admin: dict):
+    admission.limiter.release()
+    # Read-your-writes: this admin's reads skip the replicas for a while
+    replica_router.mark_write(admin["email"])
+
+
+# Dependency for read-only routes: a session that reads from a replica when one is usable.
+# Lookups that decide a write stay on get_db (see docu_serve/replicas.py)
+def get_read_db(admin: dict = Depends(get_current_admin)):
+    db = replica_router.session(admin["email"])
+    try:
+        yield db
+    finally:
+        db.close()
+
 # @app.post("/api/users/login")
 # async def login_proxy(form_data: OAuth2PasswordRequestForm = Depends()):
    
@@ -169,7 +402,7 @@ async def login_proxy(form_data: OAuth2PasswordRequestForm = Depends()):
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
             detail="Auth service is currently unavailable. Please try again later."
         )
-    except HTTPException:
+    except (HTTPException, DeadlineExceeded):
         raise
     except Exception as e:
         logger.error(f"Unexpected error in login_proxy: {str(e)}")
@@ -179,21 +412,52 @@ async def login_proxy(form_data: OAuth2PasswordRequestForm = Depends()):
         )
 
 async def call_auth_service(username: str, password: str):
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        response = await client.post(
-            f"{AUTH_SERVICE_URL}/api/users/login",
-            data={"username": username, "password": password},
-            headers={"Content-Type": "application/x-www-form-urlencoded"}
-        )
+    with start_span("auth.login"):
+        headers = {"Content-Type": "application/x-www-form-urlencoded"}
+        traceparent = current_traceparent()
+        if traceparent:
+            headers["traceparent"] = traceparent
+        # Pass on what's left of our budget so the auth service can give up too
+        timeout = deadlines.timeout(10.0)
+        headers["X-Request-Timeout"] = f"{timeout:.3f}"
+        # Reuse the warm keep-alive connections when lifespan opened the shared client
+        client = nullcontext(auth_client) if auth_client is not None else httpx.AsyncClient(timeout=timeout)
+        async with deadlines.bounded(), client as client:
+            response = await client.post(
+                f"{AUTH_SERVICE_URL}/api/users/login",
+                data={"username": username, "password": password},
+                headers=headers,
+                timeout=timeout
+            )
         if response.status_code != 202:
             raise HTTPException(
                 status_code=401, detail= "Invalid Admin Credentials")
         
         return response
 
+
+# Dependency for mutations: a retry carrying the same Idempotency-Key replays the first response
+async def idempotent_request(request: Request, admin: dict = Depends(admit_admin)):
+    key = request.headers.get(idempotency.HEADER)
+    if key is None:
+        return IdempotentRequest(None)
+    if not key or len(key) > idempotency.MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400,
+                            detail=f"{idempotency.HEADER} must be 1-{idempotency.MAX_KEY_LENGTH} characters")
+    return IdempotentRequest(
+        idempotency_cache,
+        idempotency.scoped_key(admin["email"], key),
+        idempotency.fingerprint(request.method, request.url.path, await request.body())
+    )
+
 # Endpoint to delete a user by user_id, requires admin authentication
 @app.delete("/api/admin/delete/{user_id}", response_model=DeleteResponse)
-async def delete_user(user_id: int, admin: dict = Depends(get_current_admin), db: Session = Depends(get_db)):
+async def delete_user(user_id: int, admin: dict = Depends(admit_admin),
+                      idempotent: IdempotentRequest = Depends(idempotent_request), db: Session = Depends(get_db)):
+    return await idempotent.run(lambda: _delete_user(user_id, admin, db))
+
+
+async def _delete_user(user_id: int, admin: dict, db: Session):
     user = db.query(User).filter(User.user_id == user_id).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
@@ -201,57 +465,145 @@ async def delete_user(user_id: int, admin: dict = Depends(get_current_admin), db
     user_email = user.email
     db.delete(user)
     db.commit()
+    # Committed: report it and publish its event even if the deadline passes from here on
+    deadlines.release()
+    await audit_log.record(admin["email"], "user.deleted", user_id, {"email": user_email})
     
     await publish_event("user.deleted", {"user_id": user_id, "email": user_email})
-    return DeleteResponse(
+    # Trusted construction: the email came from our own DB, no need to re-run EmailStr validation
+    return fast_response(DeleteResponse.model_construct(
         message=f"User {user_email} deleted by admin {admin['email']}",
-        deleted=DeletedUserSummary(user_id=user_id, email=user_email)
-    )
+        deleted=DeletedUserSummary.model_construct(user_id=user_id, email=user_email)
+    ))
 
 @app.patch("/api/admin/users/{user_id}", response_model=UserOut)
-async def patch_user(user_id: int, payload: UserUpdate, admin: dict = Depends(get_current_admin), db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.user_id == user_id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+async def patch_user(user_id: int, payload: UserUpdate, request: Request, admin: dict = Depends(admit_admin),
+                     idempotent: IdempotentRequest = Depends(idempotent_request), db: Session = Depends(get_db)):
+    if_match = request.headers.get("If-Match")
+    return await idempotent.run(lambda: _patch_user(user_id, payload, admin, db, if_match))
 
+
+async def _patch_user(user_id: int, payload: UserUpdate, admin: dict, db: Session, if_match: Optional[str] = None):
     data = payload.model_dump(exclude_unset=True)
     if not data:
+        if db.query(User.user_id).filter(User.user_id == user_id).first() is None:
+            raise HTTPException(status_code=404, detail="User not found")
         raise HTTPException(status_code=400, detail="No fields to update")
 
-    # Update user fields
-    for field, value in data.items():
-        if hasattr(user, field):
-            setattr(user, field, value)
-    
+    # Optimistic concurrency: one conditional UPDATE, no row lock; it matches nothing if the version moved on
+    versions = users.if_match_versions(if_match) if if_match is not None else None
+    statement = users.update_statement(user_id, data, versions)
+
     try:
+        if "email" in data and users.email_taken(db, data["email"], user_id):
+            raise HTTPException(status_code=409, detail="Email already exists")
+        row = db.execute(statement).first()
         db.commit()
-        db.refresh(user)
+        deadlines.release()
+    except (DeadlineExceeded, HTTPException, ShardFrozen):
+        db.rollback()
+        raise
     except Exception as e:
         db.rollback()
-        if "duplicate key" in str(e).lower() or "unique constraint" in str(e).lower():
+        if users.is_unique_violation(e):
             raise HTTPException(status_code=409, detail="Email already exists")
         raise HTTPException(status_code=400, detail="Failed to update user")
-   
+
+    if row is None:
+        # Only a precondition can tell a missing user from a stale one; without If-Match it was missing
+        current = None
+        if versions is not None:
+            current = users.current_version(db, user_id)
+        if current is None:
+            raise HTTPException(status_code=404, detail="User not found")
+        raise HTTPException(status_code=412, detail="User was modified by another request",
+                            headers={"ETag": users.etag(current)})
+
+    snapshot = users.snapshot(row)
+    await audit_log.record(admin["email"], "user.updated", user_id, data)
+
     # Publish user.updated event
-    await publish_event("user.updated", {
-        "user_id": user.user_id,
-        "name": user.name,
-        "email": user.email,
-        "age": user.age,
-        "role": user.role
-    })
+    await publish_event("user.updated", snapshot)
     
-    return {
-        "user_id": user.user_id,
-        "name": user.name,
-        "email": user.email,
-        "age": user.age,
-        "role": user.role
-    }
+    return fast_response(UserOut.model_construct(**snapshot), headers={"ETag": users.etag(row.version)})
+
+
+@app.post("/api/admin/users/bulk")
+async def bulk_users(request: Request, admin: dict = Depends(admit_admin_stream),
+                     session_factory=Depends(get_session_factory)):
+    # NDJSON commands in, NDJSON results out; read and applied chunk by chunk at the client's pace
+    logger.info("Bulk command stream started", extra={"admin": admin["email"]})
+    return bulk.DuplexStreamingResponse(
+        bulk.stream_commands(request.stream(), session_factory,
+                             lambda event_type, payloads: publish_events(event_type, payloads),
+                             audit_log.record_many, admin["email"]),
+        media_type=bulk.MEDIA_TYPE,
+        # Held for the whole stream, so long bulk runs count against ADMIN_MAX_CONCURRENCY
+        on_close=lambda: _release(admin),
+    )
+
+
+@app.post("/api/admin/jobs/deletions", response_model=DeletionJobOut, status_code=202)
+async def create_deletion_job(payload: DeletionJobCreate, admin: dict = Depends(admit_admin),
+                              idempotent: IdempotentRequest = Depends(idempotent_request),
+                              db: Session = Depends(get_db)):
+    # Queue a bulk deletion by ids or filter; poll the returned job for progress
+    if payload.user_ids is not None and len(payload.user_ids) > jobs.JOBS_MAX_IDS:
+        raise HTTPException(status_code=422, detail=f"At most {jobs.JOBS_MAX_IDS} user_ids per job")
+    return await idempotent.run(lambda: _create_deletion_job(payload, admin, db))
+
+
+async def _create_deletion_job(payload: DeletionJobCreate, admin: dict, db: Session):
+    job = jobs.create_job(db, payload, admin["email"])
+    deadlines.release()
+    job_runner.wake()
+    logger.info("Deletion job queued", extra={"job_id": job.job_id, "total": job.total})
+    return fast_response(job, status_code=202,
+                         headers={"Location": f"/api/admin/jobs/{job.job_id}"})
+
+
+@app.get("/api/admin/jobs/{job_id}", response_model=DeletionJobOut)
+def get_deletion_job(job_id: str, admin: dict = Depends(get_current_admin), db: Session = Depends(get_read_db)):
+    job = db.get(DeletionJob, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return fast_response(jobs.job_out(job))
+
+
+@app.post("/api/admin/jobs/{job_id}/cancel", response_model=DeletionJobOut)
+def cancel_deletion_job(job_id: str, admin: dict = Depends(admit_admin), db: Session = Depends(get_db)):
+    # Stops the job before its next chunk; the chunk in flight is rolled back, users already deleted stay deleted
+    job = jobs.cancel_job(db, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.status != jobs.CANCELLED:
+        raise HTTPException(status_code=409, detail=f"Job is already {job.status}")
+    return fast_response(jobs.job_out(job))
+
+
+@app.post("/api/admin/jobs/{job_id}/resume", response_model=DeletionJobOut)
+async def resume_deletion_job(job_id: str, admin: dict = Depends(admit_admin), db: Session = Depends(get_db)):
+    # Requeues a cancelled or failed job; it carries on from where it stopped
+    job = jobs.resume_job(db, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.status != jobs.QUEUED:
+        raise HTTPException(status_code=409, detail=f"Job is {job.status}, only cancelled or failed jobs can resume")
+    job_runner.wake()
+    return fast_response(jobs.job_out(job))
+
+
+@app.get("/api/admin/profiles/{profile_id}", include_in_schema=False)
+def download_profile(profile_id: str, admin: dict = Depends(get_current_admin)):
+    # Download a cProfile capture by the id returned in the X-Profile-Id header
+    path = profile_path(profile_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="application/octet-stream", filename=f"{profile_id}.prof")
 
 @app.get("/health")
 def health_check():
-    #Basic health check with circuit breaker status
+    # Basic health check with circuit breaker status, plus the cached dependency snapshot if any
     return {
         "status": "ok",
         "service": "admin-user-deletion",
@@ -261,36 +613,57 @@ def health_check():
                 "fail_counter": auth_breaker.fail_counter,
                 "name": auth_breaker.name
             }
-        }
+        },
+        "checks": {name: result["status"] for name, result in (health_monitor.results or {}).items()},
+        "checked_at": health_monitor.checked_at_iso(),
+        "snapshot_age_seconds": health_monitor.age()
     }
 
+
+@app.get("/health/ready")
+def readiness(response: Response):
+    # Readiness for the load balancer: 503 until startup warm-up has opened the DB pool and connections
+    report = warmup.status()
+    response.status_code = 200 if report["ready"] else 503
+    return {"status": "ready" if report["ready"] else "warming_up", **report}
+
 @app.get("/health/detailed")
-def detailed_health(db: Session = Depends(get_db)):
-    #Detailed health check including database and circuit breakers
+async def detailed_health(fresh: bool = False):
+    # Detailed health check from the cached probe snapshot; ?fresh=1 forces a probe now
+    results = await health_monitor.snapshot(fresh=fresh)
     health_status = {
         "status": "healthy",
         "service": "admin-user-deletion",
-        "checks": {}
+        "checked_at": health_monitor.checked_at_iso(),
+        "snapshot_age_seconds": health_monitor.age(),
+        "checks": {},
+        "latency_ms": {name: result["latency_ms"] for name, result in results.items()},
+        # Broker/auth outages degrade the service (events get logged, logins fail) but don't make it unhealthy
+        "degraded": [name for name, result in results.items()
+                     if name != "database" and result["status"] != "healthy"]
     }
 
-    #Check database connectivity
-    try:
-        db.execute(text("SELECT 1"))
-        health_status["checks"]["database"] = "healthy"
-    except Exception as e:
-        health_status["checks"]["database"] = f"unhealthy: {str(e)}"
+    # Database connectivity decides overall health
+    for name, result in results.items():
+        health_status["checks"][name] = result["status"]
+    if results["database"]["status"] != "healthy":
         health_status["status"] = "unhealthy"
-    #Check Auth Service circuit breaker
-    health_status["checks"]["auth_service_circuit"] = {
-        "state": str(auth_breaker.current_state),
-        "failures": auth_breaker.fail_counter,
-        "last_failure": auth_breaker.last_failure if hasattr(auth_breaker, "last_failure") else None
-    }
 
-    #Check RabbitMQ circuit breaker
-    health_status["checks"]["rabbitmq_circuit"] = {
-        "state": str(rabbitmq_breaker.current_state),
-        "failures": rabbitmq_breaker.fail_counter
-    }
+    # Circuit breakers; scope "host" means the state is shared by every worker on this host
+    health_status["checks"]["auth_service_circuit"] = breaker_status(auth_breaker)
+    health_status["checks"]["rabbitmq_circuit"] = breaker_status(rabbitmq_breaker)
+    health_status["audit"] = {"buffered": audit_log.buffered, "flushed": audit_log.flushed,
+                              "dropped": audit_log.dropped}
 
     return health_status
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    # Prometheus scrape endpoint, aggregated across workers when PROMETHEUS_MULTIPROC_DIR is set
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+
+# Create metric label children for every route now that they are all registered
+preallocate(app)
@@ -0,0 +1,236 @@
+# docu_serve/metrics.py
+"""Prometheus request metrics for the API.
+
+MetricsMiddleware records count/latency per (method, route template, status)
+and the time each request spent in JWT validation, the database and
+publishing. Label children are resolved once and cached, so the hot path is
+a dict lookup plus observe() with no metric objects created per request.
+
+When PROMETHEUS_MULTIPROC_DIR is set (gunicorn), prometheus_client writes
+values to per-process mmap files and /metrics aggregates them across workers.
+"""
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+)
+from prometheus_client import multiprocess
+
+from docu_serve.database import track_queries
+
+logger = logging.getLogger(__name__)
+
+MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+# What to do when a route issues more SQL statements than its budget: off | log | raise
+SQL_BUDGET_MODE = os.getenv("SQL_BUDGET_MODE", "log").lower()
+# JSON object of {"METHOD /route/template": max statements}, merged over the app's defaults
+SQL_QUERY_BUDGETS = json.loads(os.getenv("SQL_QUERY_BUDGETS", "{}"))
+
+# Statuses the API returns in normal operation; children for these are created up front
+COMMON_STATUSES = (200, 400, 401, 403, 404, 409, 422, 429, 500, 503, 504)
+PHASES = ("jwt", "db", "publish")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PHASE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+
+REQUESTS = Counter(
+    "http_requests_total", "HTTP requests handled", ["method", "route", "status"]
+)
+LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency", ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS
+)
+IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "HTTP requests currently being handled", multiprocess_mode="livesum"
+)
+PHASE_SECONDS = Histogram(
+    "http_request_phase_seconds", "Time a request spent in JWT validation, DB and publish",
+    ["route", "phase"], buckets=PHASE_BUCKETS
+)
+DB_QUERIES = Histogram(
+    "http_request_db_queries", "SQL statements issued per request", ["route"], buckets=QUERY_COUNT_BUCKETS
+)
+QUERY_BUDGET_EXCEEDED = Counter(
+    "sql_query_budget_exceeded_total", "Requests that issued more SQL statements than their budget", ["route"]
+)
+
+
+class QueryBudgetExceeded(RuntimeError):
+    """Raised in SQL_BUDGET_MODE=raise (tests/CI) when a route goes over its statement budget"""
+
+
+class RequestTimings:
+    """Per-request accumulator for phase timings, read by the middleware at the end"""
+
+    __slots__ = ("jwt", "publish")
+
+    def __init__(self):
+        self.jwt = 0.0
+        self.publish = 0.0
+
+
+_current: ContextVar[Optional[RequestTimings]] = ContextVar("request_timings", default=None)
+
+
+def current_timings() -> Optional[RequestTimings]:
+    return _current.get()
+
+
+@contextmanager
+def timed(phase: str):
+    """Add the time spent in the block to the current request's phase total"""
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        setattr(timings, phase, getattr(timings, phase) + time.perf_counter() - start)
+
+
+class _LabelCache:
+    """Caches metric children per label tuple so labels() runs once per combination"""
+
+    def __init__(self):
+        self._requests = {}
+        self._phases = {}
+        self._routes = {}
+
+    def request_children(self, method: str, route: str, status: int):
+        key = (method, route, status)
+        children = self._requests.get(key)
+        if children is None:
+            status_label = str(status)
+            children = (
+                REQUESTS.labels(method, route, status_label),
+                LATENCY.labels(method, route, status_label),
+            )
+            self._requests[key] = children
+        return children
+
+    def phase_children(self, route: str):
+        children = self._phases.get(route)
+        if children is None:
+            children = tuple(PHASE_SECONDS.labels(route, phase) for phase in PHASES)
+            self._phases[route] = children
+        return children
+
+    def route_children(self, route: str):
+        children = self._routes.get(route)
+        if children is None:
+            children = (DB_QUERIES.labels(route), QUERY_BUDGET_EXCEEDED.labels(route))
+            self._routes[route] = children
+        return children
+
+
+_labels = _LabelCache()
+
+
+def preallocate(app):
+    """Create label children for every route and common status before serving traffic"""
+    for route in app.routes:
+        methods = getattr(route, "methods", None)
+        if not methods:
+            continue
+        for method in methods:
+            for status in COMMON_STATUSES:
+                _labels.request_children(method, route.path, status)
+        _labels.phase_children(route.path)
+        _labels.route_children(route.path)
+
+
+def server_timing(timings: RequestTimings, query_count: int, query_seconds: float) -> bytes:
+    """Server-Timing header value; durations in milliseconds"""
+    return (
+        f'db;dur={query_seconds * 1000:.2f};desc="{query_count} queries", '
+        f"jwt;dur={timings.jwt * 1000:.2f}, publish;dur={timings.publish * 1000:.2f}"
+    ).encode()
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware; avoids BaseHTTPMiddleware's per-request task and body copying.
+
+    Also counts SQL statements per request, reports them with the phase timings
+    in a Server-Timing header and checks them against the route's query budget.
+    """
+
+    def __init__(self, app, query_budgets: Optional[dict] = None, budget_mode: Optional[str] = None):
+        self.app = app
+        self.query_budgets = {**(query_budgets or {}), **SQL_QUERY_BUDGETS}
+        self.budget_mode = (budget_mode or SQL_BUDGET_MODE).lower()
+
+    def _check_budget(self, method: str, route_path: str, query_count: int, exceeded_child):
+        budget = self.query_budgets.get(f"{method} {route_path}")
+        if budget is None or query_count <= budget or self.budget_mode == "off":
+            return
+        exceeded_child.inc()
+        message = f"{method} {route_path} issued {query_count} SQL statements, budget is {budget}"
+        if self.budget_mode == "raise":
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        timings = RequestTimings()
+
+        with track_queries() as queries:
+            async def send_wrapper(message):
+                nonlocal status
+                if message["type"] == "http.response.start":
+                    status = message["status"]
+                    route = scope.get("route")
+                    if route is not None:
+                        self._check_budget(scope["method"], route.path, queries.count,
+                                           _labels.route_children(route.path)[1])
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"server-timing", server_timing(timings, queries.count, queries.seconds))
+                    ]
+                await send(message)
+
+            token = _current.set(timings)
+            IN_FLIGHT.inc()
+            start = time.perf_counter()
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                elapsed = time.perf_counter() - start
+                IN_FLIGHT.dec()
+                _current.reset(token)
+
+                # FastAPI puts the matched route on the scope; use its template to keep cardinality bounded
+                route = scope.get("route")
+                route_path = route.path if route is not None else "unmatched"
+                count, latency = _labels.request_children(scope["method"], route_path, status)
+                count.inc()
+                latency.observe(elapsed)
+
+                jwt_child, db_child, publish_child = _labels.phase_children(route_path)
+                if timings.jwt:
+                    jwt_child.observe(timings.jwt)
+                if queries.seconds:
+                    db_child.observe(queries.seconds)
+                if timings.publish:
+                    publish_child.observe(timings.publish)
+                _labels.route_children(route_path)[0].observe(queries.count)
+
+
+def render_metrics():
+    """Return (body, content_type) for the /metrics endpoint"""
+    if MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
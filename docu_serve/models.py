@@ -1,5 +1,6 @@
+from typing import Optional
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
-from sqlalchemy import String, Integer
+from sqlalchemy import DDL, Float, Integer, LargeBinary, String, Text, event
 
 
 class Base(DeclarativeBase):
@@ -15,3 +16,86 @@ class User(Base):
     age: Mapped[int] = mapped_column(Integer, nullable=False)
     role: Mapped[str] = mapped_column(String(50), default="user", nullable=False)
     hashed_password: Mapped[str] = mapped_column(String(255), nullable=False)
+    # Bumped on every admin update; exposed as the ETag for If-Match on PATCH
+    version: Mapped[int] = mapped_column(Integer, default=1, server_default="1", nullable=False)
+
+
+class IdempotencyRecord(Base):
+    __tablename__ = "idempotency_keys"
+
+    # sha256 of (admin, Idempotency-Key)
+    key: Mapped[str] = mapped_column(String(64), primary_key=True)
+    fingerprint: Mapped[str] = mapped_column(String(64), nullable=False)
+    # NULL while the first request is still running
+    status_code: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    headers: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    body: Mapped[Optional[bytes]] = mapped_column(LargeBinary, nullable=True)
+    expires_at: Mapped[float] = mapped_column(Float, nullable=False, index=True)
+
+
+class DeletionJob(Base):
+    __tablename__ = "deletion_jobs"
+
+    job_id: Mapped[str] = mapped_column(String(32), primary_key=True)
+    # queued | running | completed | cancelled | failed
+    status: Mapped[str] = mapped_column(String(20), nullable=False, index=True)
+    requested_by: Mapped[str] = mapped_column(String(255), nullable=False)
+    # JSON: a sorted list of user ids, or a DeletionFilter; exactly one is set
+    user_ids: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    filter: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    # Highest user_id handled so far; a resumed job carries on after it
+    cursor: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    total: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    processed: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    deleted: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    not_found: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    elapsed_seconds: Mapped[float] = mapped_column(Float, default=0.0, nullable=False)
+    error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    created_at: Mapped[float] = mapped_column(Float, nullable=False)
+    started_at: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    finished_at: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    # The executor holding the job; another one takes over once the lease runs out
+    locked_by: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)
+    lease_expires_at: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+
+
+class ProcessedMessage(Base):
+    __tablename__ = "processed_messages"
+
+    # AMQP message_id of an event the sync worker has applied (docu_serve/dedup.py)
+    message_id: Mapped[str] = mapped_column(String(64), primary_key=True)
+    processed_at: Mapped[float] = mapped_column(Float, nullable=False, index=True)
+
+
+class AuditRecord(Base):
+    __tablename__ = "admin_audit_log"
+
+    # Append-only: docu_serve/audit.py inserts rows in batches, triggers refuse UPDATE and DELETE
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    # Set when the record is made, so a replayed spool file can't insert it twice
+    record_id: Mapped[str] = mapped_column(String(32), unique=True, nullable=False)
+    at: Mapped[float] = mapped_column(Float, nullable=False, index=True)
+    actor: Mapped[str] = mapped_column(String(255), nullable=False, index=True)
+    # user.deleted | user.updated
+    action: Mapped[str] = mapped_column(String(50), nullable=False)
+    user_id: Mapped[int] = mapped_column(Integer, nullable=False, index=True)
+    # api | bulk | job
+    source: Mapped[str] = mapped_column(String(20), nullable=False)
+    # JSON: the new values of the changed fields, or the deleted user's email
+    changes: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+
+
+# SQLite and Postgres refuse changes to audit rows; other backends rely on the code only inserting
+for _statement in ("UPDATE", "DELETE"):
+    event.listen(AuditRecord.__table__, "after_create", DDL(
+        f"CREATE TRIGGER admin_audit_log_no_{_statement.lower()} BEFORE {_statement} ON admin_audit_log "
+        "BEGIN SELECT RAISE(ABORT, 'admin_audit_log is append-only'); END"
+    ).execute_if(dialect="sqlite"))
+event.listen(AuditRecord.__table__, "after_create", DDL(
+    "CREATE OR REPLACE FUNCTION admin_audit_log_append_only() RETURNS trigger AS $$ "
+    "BEGIN RAISE EXCEPTION 'admin_audit_log is append-only'; END; $$ LANGUAGE plpgsql"
+).execute_if(dialect="postgresql"))
+event.listen(AuditRecord.__table__, "after_create", DDL(
+    "CREATE TRIGGER admin_audit_log_append_only BEFORE UPDATE OR DELETE ON admin_audit_log "
+    "FOR EACH ROW EXECUTE FUNCTION admin_audit_log_append_only()"
+).execute_if(dialect="postgresql"))
@@ -0,0 +1,226 @@
+# docu_serve/profiling.py
+"""Opt-in per-request cProfile capture.
+
+A request is profiled when it carries a valid signed X-Profile header or is
+picked by PROFILE_SAMPLE_RATE. The .prof file is written to PROFILE_DIR and
+its id returned in the X-Profile-Id response header; admins download it from
+/api/admin/profiles/{id} and open it with pstats or snakeviz.
+
+When neither PROFILE_SECRET nor PROFILE_SAMPLE_RATE is set the middleware is
+not installed at all, so there is no cost when profiling is off.
+
+Finished profiles are handed to a single background writer thread per
+process, which dumps each one and then prunes the directory: files older
+than PROFILE_MAX_AGE seconds go first, then the oldest beyond
+PROFILE_MAX_FILES, so sampling can't fill the disk. Writes and prunes never
+overlap, and the request returns without waiting for either. When more than
+PROFILE_QUEUE_SIZE profiles are waiting, new ones are dropped.
+
+cProfile only sees the thread it runs on, so sync dependencies executed in
+the threadpool are not included, and other requests interleaving on the
+event loop during the profiled one will show up in its profile.
+"""
+import atexit
+import cProfile
+import glob
+import hashlib
+import hmac
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+import uuid
+from typing import Optional
+
+PROFILE_SECRET = os.getenv("PROFILE_SECRET")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+# How long a signed header stays valid, limits replay of a leaked header
+PROFILE_TOKEN_TTL = int(os.getenv("PROFILE_TOKEN_TTL", "300"))
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "200"))  # 0 = unlimited
+PROFILE_MAX_AGE = float(os.getenv("PROFILE_MAX_AGE", str(7 * 86400)))  # seconds, 0 = unlimited
+PROFILE_QUEUE_SIZE = int(os.getenv("PROFILE_QUEUE_SIZE", "16"))
+
+logger = logging.getLogger(__name__)
+
+HEADER = b"x-profile"
+PROFILE_ID_PATTERN = re.compile(r"^[0-9]+-[a-z]+-[a-z0-9_]+-[0-9a-f]{12}$")
+
+
+def profiling_enabled() -> bool:
+    return bool(PROFILE_SECRET) or PROFILE_SAMPLE_RATE > 0
+
+
+def sign_profile_token(secret: str, timestamp: Optional[int] = None) -> str:
+    """Build an X-Profile header value: '<unix ts>.<hex hmac-sha256 of ts>'"""
+    timestamp = int(time.time()) if timestamp is None else timestamp
+    signature = hmac.new(secret.encode(), str(timestamp).encode(), hashlib.sha256).hexdigest()
+    return f"{timestamp}.{signature}"
+
+
+def verify_profile_token(secret: str, token: str, ttl: int = PROFILE_TOKEN_TTL) -> bool:
+    try:
+        timestamp, signature = token.split(".", 1)
+        issued = int(timestamp)
+    except ValueError:
+        return False
+    if abs(time.time() - issued) > ttl:
+        return False
+    expected = hmac.new(secret.encode(), timestamp.encode(), hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+
+def profile_path(profile_id: str, directory: str = None) -> Optional[str]:
+    """Resolve a profile id to its file, None if the id is malformed or missing"""
+    if not PROFILE_ID_PATTERN.match(profile_id):
+        return None
+    path = os.path.join(directory or PROFILE_DIR, f"{profile_id}.prof")
+    return path if os.path.isfile(path) else None
+
+
+def prune_profiles(directory: str, max_files: int = PROFILE_MAX_FILES, max_age: float = PROFILE_MAX_AGE) -> int:
+    """Delete expired profiles, then the oldest beyond max_files; returns how many were removed"""
+    entries = []
+    for path in glob.glob(os.path.join(glob.escape(directory), "*.prof")):
+        try:
+            entries.append((os.path.getmtime(path), path))
+        except FileNotFoundError:
+            pass
+    entries.sort()
+    doomed = [path for mtime, path in entries if max_age and time.time() - mtime > max_age]
+    kept = len(entries) - len(doomed)
+    if max_files and kept > max_files:
+        doomed += [path for _, path in entries[len(doomed):len(doomed) + kept - max_files]]
+    removed = 0
+    for path in doomed:
+        try:
+            os.remove(path)
+            removed += 1
+        except FileNotFoundError:
+            pass  # another worker pruned it first
+    return removed
+
+
+def _write_profile(profiler: cProfile.Profile, directory: str, profile_id: str):
+    os.makedirs(directory, exist_ok=True)
+    profiler.dump_stats(os.path.join(directory, f"{profile_id}.prof"))
+    prune_profiles(directory)
+
+
+class ProfileWriter:
+    """Writes finished profiles and prunes their directory on one background thread"""
+
+    def __init__(self, queue_size: int = PROFILE_QUEUE_SIZE):
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = threading.Thread(target=self._run, name="profile-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, profiler: cProfile.Profile, directory: str, profile_id: str):
+        try:
+            self._queue.put_nowait((profiler, directory, profile_id))
+        except queue.Full:
+            # Never block a request on profiling
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                try:
+                    _write_profile(*item)
+                except Exception as e:
+                    logger.warning(f"Failed to write profile {item[2]}: {e}")
+            finally:
+                self._queue.task_done()
+
+    def flush(self):
+        """Block until everything submitted so far is on disk"""
+        self._queue.join()
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+
+_writer: Optional[ProfileWriter] = None
+_writer_lock = threading.Lock()
+
+
+def get_writer() -> ProfileWriter:
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = ProfileWriter()
+        return _writer
+
+
+def flush():
+    """Write out every profile queued so far"""
+    if _writer is not None:
+        _writer.flush()
+
+
+def shutdown():
+    if _writer is not None:
+        _writer.close()
+
+
+atexit.register(shutdown)
+
+
+def _route_slug(path: str) -> str:
+    slug = re.sub(r"[^a-z0-9]+", "_", path.lower()).strip("_")
+    return slug[:60] or "root"
+
+
+class ProfilingMiddleware:
+    """Pure ASGI middleware that wraps selected requests in cProfile"""
+
+    def __init__(self, app, secret: Optional[str] = None, sample_rate: Optional[float] = None,
+                 directory: Optional[str] = None):
+        self.app = app
+        self.secret = PROFILE_SECRET if secret is None else secret
+        self.sample_rate = PROFILE_SAMPLE_RATE if sample_rate is None else sample_rate
+        self.directory = directory or PROFILE_DIR
+        # cProfile can't run two profilers at once in a thread; skip rather than queue
+        self._busy = threading.Lock()
+
+    def _wants_profile(self, scope) -> bool:
+        if self.secret:
+            for name, value in scope["headers"]:
+                if name == HEADER:
+                    return verify_profile_token(self.secret, value.decode("latin-1"))
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._wants_profile(scope) or not self._busy.acquire(blocking=False):
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = "-".join((str(int(time.time())), scope["method"].lower(), _route_slug(scope["path"]),
+                               uuid.uuid4().hex[:12]))
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"x-profile-id", profile_id.encode())]
+            await send(message)
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                profiler.disable()
+            # Marshalling the stats and pruning are file I/O; the writer thread does both
+            get_writer().submit(profiler, self.directory, profile_id)
+        finally:
+            self._busy.release()
@@ -0,0 +1,259 @@
+# docu_serve/reconcile.py
+"""Drift reconciliation between the auth service's users and users_admin.
+
+users_admin is fed only by user.created events, and a lost event is never
+seen again. Comparing full table dumps costs O(users) transfers per run, so
+both sides summarise their users as a Merkle-style tree of hash digests
+instead:
+
+- a leaf covers RECONCILE_BUCKET_WIDTH consecutive user_ids. Its digest is
+  the sum (mod 2**256) of the sha256 of each row in it. The sum doesn't
+  depend on row order, so it streams in one pass, even over shards.
+- a node at level k > 0 covers RECONCILE_FANOUT nodes of level k - 1, and
+  its digest hashes its non-empty children. The height is fixed by
+  RECONCILE_MAX_USER_ID, so both sides build the same shape.
+
+reconcile() walks down from the root, one request per level, asking the
+remote only for the children of nodes whose digests differ. Then it fetches
+the rows of just the mismatched leaves and repairs users_admin: missing
+users are inserted, differing ones get the auth values, and users the auth
+service no longer has are reported (or deleted with delete_extra).
+Transfers grow with the number of changed buckets, not the table size.
+
+The remote side is a DigestSource. HttpDigestSource speaks to digest_app,
+the endpoints the auth service would expose. digest_app over a
+DatabaseDigestSource is also a local stub of the auth side. reconcile_users.py
+runs a reconciliation from cron.
+"""
+import hashlib
+import json
+import logging
+import os
+from typing import Dict, Iterable, List, Optional, Protocol
+
+from sqlalchemy import delete, or_, select, update
+from sqlalchemy.exc import IntegrityError
+
+from docu_serve.models import User
+
+logger = logging.getLogger(__name__)
+
+RECONCILE_BUCKET_WIDTH = int(os.getenv("RECONCILE_BUCKET_WIDTH", "1024"))
+RECONCILE_FANOUT = int(os.getenv("RECONCILE_FANOUT", "16"))
+RECONCILE_MAX_USER_ID = int(os.getenv("RECONCILE_MAX_USER_ID", str(2 ** 31)))
+
+FIELDS = ("user_id", "name", "email", "age", "role", "hashed_password")
+_MODULUS = 2 ** 256
+
+
+def row_hash(row: dict) -> int:
+    canonical = json.dumps([row[field] for field in FIELDS], separators=(",", ":"))
+    return int.from_bytes(hashlib.sha256(canonical.encode()).digest(), "big")
+
+
+class DigestTree:
+    """Leaf and node digests of one side's users"""
+
+    def __init__(self, rows: Iterable[dict], width: int = RECONCILE_BUCKET_WIDTH,
+                 fanout: int = RECONCILE_FANOUT, max_user_id: int = RECONCILE_MAX_USER_ID):
+        self.width = width
+        self.fanout = fanout
+        self.height = 0
+        while width * fanout ** self.height < max_user_id:
+            self.height += 1
+        leaves: Dict[int, int] = {}
+        for row in rows:
+            leaf = row["user_id"] // width
+            leaves[leaf] = (leaves.get(leaf, 0) + row_hash(row)) % _MODULUS
+        # levels[k]: node index -> hex digest; empty nodes are absent on both sides
+        self.levels: List[Dict[int, str]] = [{leaf: f"{total:064x}" for leaf, total in leaves.items()}]
+        for _ in range(self.height):
+            children: Dict[int, List[str]] = {}
+            for index in sorted(self.levels[-1]):
+                children.setdefault(index // fanout, []).append(f"{index}:{self.levels[-1][index]}")
+            self.levels.append({index: hashlib.sha256(",".join(parts).encode()).hexdigest()
+                                for index, parts in children.items()})
+
+    def params(self) -> dict:
+        return {"width": self.width, "fanout": self.fanout, "height": self.height}
+
+    def digests(self, level: int, parents: List[int]) -> Dict[int, str]:
+        """Digests of the non-empty nodes at `level` whose parent is in `parents`"""
+        wanted = set(parents)
+        return {index: digest for index, digest in self.levels[level].items() if index // self.fanout in wanted}
+
+
+class DigestSource(Protocol):
+    def params(self) -> dict: ...
+
+    def digests(self, level: int, parents: List[int]) -> Dict[int, str]: ...
+
+    def rows(self, leaves: List[int]) -> List[dict]: ...
+
+
+class DatabaseDigestSource:
+    """Digests of a users table; the tree is built on first use and kept for the run"""
+
+    def __init__(self, session_factory, width: int = RECONCILE_BUCKET_WIDTH, fanout: int = RECONCILE_FANOUT,
+                 max_user_id: int = RECONCILE_MAX_USER_ID):
+        self.session_factory = session_factory
+        self.width = width
+        self.fanout = fanout
+        self.max_user_id = max_user_id
+        self._tree: Optional[DigestTree] = None
+
+    @property
+    def tree(self) -> DigestTree:
+        if self._tree is None:
+            columns = [getattr(User, field) for field in FIELDS]
+            with self.session_factory() as db:
+                result = db.execute(select(*columns).execution_options(yield_per=5000))
+                self._tree = DigestTree((row._asdict() for row in result), self.width, self.fanout,
+                                        self.max_user_id)
+        return self._tree
+
+    def refresh(self):
+        self._tree = None
+
+    def params(self) -> dict:
+        return self.tree.params()
+
+    def digests(self, level: int, parents: List[int]) -> Dict[int, str]:
+        return self.tree.digests(level, parents)
+
+    def rows(self, leaves: List[int]) -> List[dict]:
+        columns = [getattr(User, field) for field in FIELDS]
+        rows = []
+        with self.session_factory() as db:
+            for start in range(0, len(leaves), 100):
+                ranges = [User.user_id.between(leaf * self.width, (leaf + 1) * self.width - 1)
+                          for leaf in leaves[start:start + 100]]
+                rows.extend(row._asdict() for row in db.execute(select(*columns).where(or_(*ranges))))
+        return rows
+
+
+class HttpDigestSource:
+    """The auth service's digests over HTTP (the digest_app endpoints)"""
+
+    def __init__(self, client, base_url: str = ""):
+        # An httpx.Client; the caller owns timeouts and auth headers
+        self.client = client
+        self.base_url = base_url.rstrip("/")
+
+    def _get(self, path: str, **params):
+        response = self.client.get(f"{self.base_url}{path}", params=params)
+        response.raise_for_status()
+        return response.json()
+
+    def params(self) -> dict:
+        return self._get("/internal/user-digests/params")
+
+    def digests(self, level: int, parents: List[int]) -> Dict[int, str]:
+        body = self._get("/internal/user-digests", level=level, parents=",".join(map(str, parents)))
+        return {int(index): digest for index, digest in body.items()}
+
+    def rows(self, leaves: List[int]) -> List[dict]:
+        response = self.client.post(f"{self.base_url}/internal/user-digests/rows", json={"leaves": leaves})
+        response.raise_for_status()
+        return response.json()
+
+
+def digest_app(source: DigestSource):
+    """The endpoints HttpDigestSource expects, serving `source` (a stub of the auth side)"""
+    from fastapi import FastAPI
+
+    app = FastAPI(title="User digests")
+
+    @app.get("/internal/user-digests/params")
+    def params():
+        # Asked first by every run, so a long-running stub serves current digests
+        if hasattr(source, "refresh"):
+            source.refresh()
+        return source.params()
+
+    @app.get("/internal/user-digests")
+    def digests(level: int, parents: str):
+        return source.digests(level, [int(parent) for parent in parents.split(",") if parent])
+
+    @app.post("/internal/user-digests/rows")
+    def rows(body: dict):
+        return source.rows([int(leaf) for leaf in body["leaves"]])
+
+    return app
+
+
+def _diff(local: DigestSource, remote: DigestSource, report: dict) -> List[int]:
+    """Leaf indexes whose digests differ, walking only into differing nodes"""
+    height = local.params()["height"]
+    parents = [0]
+    for level in range(height, -1, -1):
+        mine = local.digests(level, parents)
+        theirs = remote.digests(level, parents)
+        report["digests_fetched"] += len(theirs)
+        parents = sorted(index for index in mine.keys() | theirs.keys() if mine.get(index) != theirs.get(index))
+        if not parents:
+            break
+    return parents
+
+
+def _repair(db, mine: Dict[int, dict], theirs: Dict[int, dict], delete_extra: bool, report: dict):
+    """Apply one leaf's differences; with db None only count them (dry run)"""
+    for user_id, row in theirs.items():
+        current = mine.get(user_id)
+        if current == row:
+            continue
+        report["inserted" if current is None else "updated"] += 1
+        if db is None:
+            continue
+        if current is None:
+            db.add(User(**row))
+        else:
+            # Bumps the version like an admin PATCH, so pre-repair ETags stop matching
+            db.execute(update(User).where(User.user_id == user_id)
+                       .values(**{field: row[field] for field in FIELDS if field != "user_id"},
+                               version=User.version + 1))
+    extra = sorted(mine.keys() - theirs.keys())
+    report["extra"].extend(extra)
+    if extra and delete_extra:
+        report["deleted"] += len(extra)
+        if db is not None:
+            db.execute(delete(User).where(User.user_id.in_(extra)).execution_options(synchronize_session=False))
+
+
+def reconcile(session_factory, local: DigestSource, remote: DigestSource, apply: bool = True,
+              delete_extra: bool = False) -> dict:
+    """Bring users_admin in line with the auth side; returns what differed and what was changed"""
+    if local.params() != remote.params():
+        raise ValueError(f"Digest parameters differ: local {local.params()}, remote {remote.params()}")
+    # With apply=False the counts are what would have changed
+    report = {"digests_fetched": 0, "mismatched_leaves": 0, "rows_fetched": 0, "inserted": 0, "updated": 0,
+              "extra": [], "deleted": 0, "failed_leaves": []}
+    leaves = _diff(local, remote, report)
+    report["mismatched_leaves"] = len(leaves)
+    if not leaves:
+        return report
+
+    auth_rows = remote.rows(leaves)
+    report["rows_fetched"] = len(auth_rows)
+    width = local.params()["width"]
+    mine: Dict[int, Dict[int, dict]] = {leaf: {} for leaf in leaves}
+    theirs: Dict[int, Dict[int, dict]] = {leaf: {} for leaf in leaves}
+    for side, rows in ((mine, local.rows(leaves)), (theirs, auth_rows)):
+        for row in rows:
+            side.setdefault(row["user_id"] // width, {})[row["user_id"]] = row
+    for leaf in leaves:
+        if not apply:
+            _repair(None, mine[leaf], theirs[leaf], delete_extra, report)
+            continue
+        # One transaction per leaf, so a conflict only holds back its own leaf
+        with session_factory() as db:
+            _repair(db, mine[leaf], theirs[leaf], delete_extra, report)
+            try:
+                db.commit()
+            except IntegrityError as e:
+                # e.g. an email moved between users in different leaves; the next run retries
+                db.rollback()
+                report["failed_leaves"].append(leaf)
+                logger.warning(f"Reconciliation of leaf {leaf} failed: {e}")
+    logger.info("Reconciliation finished", extra={key: value for key, value in report.items() if key != "extra"})
+    return report
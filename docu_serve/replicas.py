@@ -0,0 +1,179 @@
+# docu_serve/replicas.py
+"""Read-replica routing.
+
+Set DATABASE_REPLICA_URLS (comma separated) and read-only endpoints get a
+RoutingSession: reads go to a replica picked round-robin, anything that
+writes (flushes and INSERT/UPDATE/DELETE statements) goes to the primary,
+as do all reads after the session's first write.
+
+A replica is skipped when:
+  * its replication lag is over REPLICA_MAX_LAG_SECONDS. Lag is measured
+    off the request path by the health monitor's "replicas" probe.
+  * it failed recently (for REPLICA_RETRY_SECONDS). A read that fails on a
+    replica is retried once on the primary.
+  * the admin wrote something within REPLICA_STICKY_SECONDS, so they read
+    their own writes. Stickiness is kept per process; the lag guard bounds
+    staleness for requests that land on another worker.
+
+Some reads stay on the primary on purpose:
+  * the health monitor's database probe. It checks the database writes go
+    to; each replica has its own probe, and /health/detailed serves a
+    cached snapshot, so it costs one SELECT 1 per HEALTH_PROBE_INTERVAL.
+  * existence and version lookups in DELETE and PATCH (the row to delete,
+    404 vs 412, email_taken). They decide a write, so a lagging replica
+    would give wrong answers.
+  * users_admin when it is sharded: the replicas mirror DATABASE_URL, and
+    the rows live on the shards.
+
+With no usable replica everything goes to the primary. For local testing,
+point DATABASE_URL and DATABASE_REPLICA_URLS at two SQLite files or two
+Postgres instances. Lag is only measured on Postgres; other backends
+report 0.
+"""
+import itertools
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Callable, List, Optional
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from docu_serve import database, deadlines
+
+logger = logging.getLogger(__name__)
+
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "5"))
+REPLICA_STICKY_SECONDS = float(os.getenv("REPLICA_STICKY_SECONDS", str(REPLICA_MAX_LAG_SECONDS)))
+REPLICA_RETRY_SECONDS = float(os.getenv("REPLICA_RETRY_SECONDS", "30"))
+
+_PG_LAG = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+
+def replica_lag(engine: Engine) -> float:
+    """Seconds the replica is behind; 0 where the backend can't tell"""
+    with engine.connect() as conn:
+        if engine.dialect.name == "postgresql":
+            return float(conn.execute(_PG_LAG).scalar() or 0)
+        conn.execute(text("SELECT 1"))
+        return 0.0
+
+
+class Replica:
+    __slots__ = ("engine", "name", "lag", "down_until")
+
+    def __init__(self, engine: Engine, name: str):
+        self.engine = engine
+        self.name = name
+        # Unknown until the first probe; assumed fine so a fresh process uses replicas straight away
+        self.lag: Optional[float] = None
+        self.down_until = 0.0
+
+    def usable(self, now: float, max_lag: float) -> bool:
+        return now >= self.down_until and (self.lag is None or self.lag <= max_lag)
+
+
+class ReplicaRouter:
+    def __init__(self, replicas: List[Replica], max_lag: float = REPLICA_MAX_LAG_SECONDS,
+                 sticky_seconds: float = REPLICA_STICKY_SECONDS, retry_seconds: float = REPLICA_RETRY_SECONDS,
+                 lag_probe: Callable[[Engine], float] = replica_lag, max_keys: int = 10000):
+        self.replicas = replicas
+        self.max_lag = max_lag
+        self.sticky_seconds = sticky_seconds
+        self.retry_seconds = retry_seconds
+        self.lag_probe = lag_probe
+        self.max_keys = max_keys
+        self._next = itertools.count()
+        self._sticky = OrderedDict()
+
+    def choose(self, sticky_key: Optional[str] = None) -> Optional[Replica]:
+        """Next usable replica in round-robin order, None to read from the primary"""
+        if not self.replicas or self.is_sticky(sticky_key):
+            return None
+        now = time.monotonic()
+        for _ in range(len(self.replicas)):
+            replica = self.replicas[next(self._next) % len(self.replicas)]
+            if replica.usable(now, self.max_lag):
+                return replica
+        return None
+
+    def mark_write(self, key: Optional[str]):
+        """Send `key`'s reads to the primary for the next sticky_seconds"""
+        if key is None or not self.replicas:
+            return
+        self._sticky.pop(key, None)
+        self._sticky[key] = time.monotonic() + self.sticky_seconds
+        if len(self._sticky) > self.max_keys:
+            self._sticky.popitem(last=False)
+
+    def is_sticky(self, key: Optional[str]) -> bool:
+        until = self._sticky.get(key) if key is not None else None
+        return until is not None and time.monotonic() < until
+
+    def mark_down(self, replica: Replica):
+        replica.down_until = time.monotonic() + self.retry_seconds
+        logger.warning(f"Replica {replica.name} failed, reading from the primary for {self.retry_seconds}s")
+
+    def refresh(self) -> dict:
+        """Measure every replica's lag; returns {name: lag or error}"""
+        statuses = {}
+        for replica in self.replicas:
+            try:
+                replica.lag = self.lag_probe(replica.engine)
+                replica.down_until = 0.0
+                statuses[replica.name] = replica.lag
+            except Exception as e:
+                replica.lag = None
+                self.mark_down(replica)
+                statuses[replica.name] = str(e)
+        return statuses
+
+    def session(self, sticky_key: Optional[str] = None, bind: Optional[Engine] = None) -> "RoutingSession":
+        return RoutingSession(self, self.choose(sticky_key), bind=bind or database.engine,
+                              autoflush=False, expire_on_commit=False)
+
+
+class RoutingSession(Session):
+    """Reads from its replica, writes (and reads after a write) on the primary bind"""
+
+    def __init__(self, router: ReplicaRouter, replica: Optional[Replica], **kw):
+        super().__init__(**kw)
+        self.router = router
+        self.replica = replica
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if self.replica is not None and not self._flushing and not getattr(clause, "is_dml", False):
+            return self.replica.engine
+        # Once anything is written, stay on the primary so the session reads its own writes
+        self.replica = None
+        return super().get_bind(mapper, clause=clause, **kw)
+
+    def execute(self, statement, *args, **kw):
+        replica = self.replica
+        try:
+            return super().execute(statement, *args, **kw)
+        except OperationalError:
+            # Only a pure read on a replica can be retried; a spent deadline is not the replica's fault
+            if replica is None or self.replica is not replica or deadlines.expired():
+                raise
+            self.rollback()
+            self.router.mark_down(replica)
+            self.replica = None
+            return super().execute(statement, *args, **kw)
+
+
+def _create_replica_engine(url: str) -> Engine:
+    connect_args = {"check_same_thread": False} if url.startswith("sqlite") else {}
+    # No smoke test: a replica that's down at startup is just skipped until it answers a probe
+    return create_engine(url, pool_pre_ping=True, echo=database.SQL_ECHO, connect_args=connect_args)
+
+
+router = ReplicaRouter([Replica(_create_replica_engine(url), f"replica{i}")
+                        for i, url in enumerate(DATABASE_REPLICA_URLS)])
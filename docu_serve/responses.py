@@ -0,0 +1,53 @@
+# docu_serve/responses.py
+"""Fast response path for data the service produced itself.
+
+Endpoints build their response models with model_construct() (no validation,
+so no EmailStr re-check of emails we just read from our own DB) and return a
+FastJSONResponse. Returning a Response makes FastAPI skip the response_model
+validate + jsonable_encoder + json.dumps pass; response_model stays on the
+route for the OpenAPI schema.
+
+FAST_RESPONSES=false switches back to returning the models for FastAPI to
+validate, e.g. to rule this path out while debugging. Responses that carry
+headers are validated here instead, since a bare model can't hold them.
+"""
+import os
+from typing import Optional
+
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from pydantic_core import to_json
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on installed extras
+    orjson = None
+
+FAST_RESPONSES = os.getenv("FAST_RESPONSES", "true").lower() == "true"
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON response rendered with pydantic-core for models and orjson for plain data"""
+
+    def render(self, content) -> bytes:
+        if isinstance(content, BaseModel):
+            # Serializes the model's fields directly in Rust, no validation
+            return content.__pydantic_serializer__.to_json(content)
+        if orjson is not None:
+            return orjson.dumps(content)
+        return to_json(content)
+
+
+def fast_response(model: BaseModel, status_code: int = 200, headers: Optional[dict] = None):
+    """Return a trusted model as a FastJSONResponse, or as-is when FAST_RESPONSES is off"""
+    if not FAST_RESPONSES:
+        if headers is None:
+            return model
+        return validated_response(model, status_code, headers)
+    return FastJSONResponse(model, status_code=status_code, headers=headers)
+
+
+def validated_response(model: BaseModel, status_code: int = 200, headers: Optional[dict] = None) -> JSONResponse:
+    """Validate a model as FastAPI's response_model pass would and render it as a JSONResponse"""
+    validated = type(model).model_validate(model.model_dump())
+    return JSONResponse(validated.model_dump(mode="json"), status_code=status_code, headers=headers)
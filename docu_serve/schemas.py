@@ -1,5 +1,6 @@
-from pydantic import EmailStr, BaseModel
-from typing import Optional
+from datetime import datetime
+from pydantic import EmailStr, BaseModel, model_validator
+from typing import List, Literal, Optional
 
 class DeletedUserSummary(BaseModel):
     user_id: int
@@ -22,3 +23,53 @@ class UserOut(BaseModel):
     email: EmailStr
     age: int
     role: str
+
+
+class DeletionFilter(BaseModel):
+    role: Optional[str] = None
+    email_domain: Optional[str] = None
+    min_user_id: Optional[int] = None
+    max_user_id: Optional[int] = None
+
+    @model_validator(mode="after")
+    def _not_empty(self):
+        # An empty filter would match every user
+        if all(value is None for value in self.model_dump().values()):
+            raise ValueError("filter needs at least one field")
+        return self
+
+
+class DeletionJobCreate(BaseModel):
+    user_ids: Optional[List[int]] = None
+    filter: Optional[DeletionFilter] = None
+
+    @model_validator(mode="after")
+    def _one_target(self):
+        if (self.user_ids is None) == (self.filter is None):
+            raise ValueError("give exactly one of user_ids or filter")
+        return self
+
+
+class DeletionJobOut(BaseModel):
+    job_id: str
+    status: str
+    requested_by: str
+    total: int
+    processed: int
+    deleted: int
+    not_found: int
+    progress: float
+    elapsed_seconds: float
+    throughput_per_second: Optional[float]
+    error: Optional[str]
+    created_at: datetime
+    started_at: Optional[datetime]
+    finished_at: Optional[datetime]
+
+
+class BulkCommand(BaseModel):
+    # One NDJSON line of POST /api/admin/users/bulk
+    op: Literal["delete", "patch"]
+    user_id: int
+    changes: Optional[UserUpdate] = None
+    if_match: Optional[str] = None
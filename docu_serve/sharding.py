@@ -0,0 +1,317 @@
+# docu_serve/sharding.py
+"""Range sharding of users_admin by user_id.
+
+With SHARD_MAP_FILE (or DATABASE_SHARDS, the same JSON inline) set,
+SessionLocal hands out ShardedSessions, so get_db, the worker and the job
+runner all become shard-aware without changes:
+
+    {"shards": [{"name": "shard0", "url": "postgresql://.../users0", "min_user_id": 0},
+                {"name": "shard1", "url": "postgresql://.../users1", "min_user_id": 500000}],
+     "frozen": []}
+
+Each shard owns user_ids from its min_user_id up to the next shard's. The
+users_admin rows live on the shards. Every other table (jobs, idempotency
+keys) stays on the primary at DATABASE_URL, and a shard may point at that
+same URL. Statements on User that name user_ids (== or IN) go to the
+owning shards. Others are scattered to every shard and the results
+concatenated, so aggregates come back as one row per shard, and ORDER BY /
+LIMIT apply per shard.
+
+split_shard() moves the top of a shard's range to a new shard while it keeps
+serving. It bulk-copies first, then briefly freezes writes to the moving
+range (they get ShardFrozen -> 503 Retry-After), syncs what changed, switches
+the map and cleans up. Processes re-read the map file every
+SHARD_MAP_RELOAD_SECONDS.
+
+Email uniqueness: each shard's unique index only covers its own rows, so
+PATCH, bulk patch and the worker's insert check the other shards first
+(users.email_taken). That is check-then-write: two concurrent writes of the
+same email to different shards can both succeed.
+
+Multi-shard transactions commit shard by shard. This is not two-phase, so a
+crash mid-commit can leave one shard committed and another not.
+"""
+import json
+import logging
+import os
+import time
+from bisect import bisect_right
+from typing import Dict, List, Optional
+
+from sqlalchemy import create_engine, delete, event, insert, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.horizontal_shard import ShardedSession
+from sqlalchemy.sql import operators, visitors
+
+from docu_serve.models import User
+
+logger = logging.getLogger(__name__)
+
+SHARD_MAP_FILE = os.getenv("SHARD_MAP_FILE")
+DATABASE_SHARDS = os.getenv("DATABASE_SHARDS")
+SHARD_MAP_RELOAD_SECONDS = float(os.getenv("SHARD_MAP_RELOAD_SECONDS", "2"))
+SHARD_FROZEN_RETRY_AFTER = int(os.getenv("SHARD_FROZEN_RETRY_AFTER", "2"))
+PRIMARY = "primary"
+
+_USERS = User.__table__
+_USER_ID = _USERS.c.user_id
+
+
+class ShardFrozen(Exception):
+    """Writes to this user_id range are paused while its shard is split"""
+
+
+def make_engine(url: str, echo: bool = False) -> Engine:
+    connect_args = {"check_same_thread": False} if url.startswith("sqlite") else {}
+    return create_engine(url, pool_pre_ping=True, echo=echo, connect_args=connect_args)
+
+
+class ShardMap:
+    """Sorted user_id ranges -> shard names, plus ranges frozen for a split"""
+
+    def __init__(self, shards: List[dict], frozen: Optional[List[list]] = None):
+        if not shards:
+            raise ValueError("shard map needs at least one shard")
+        self.shards = sorted(shards, key=lambda shard: shard.get("min_user_id") or 0)
+        self.frozen = [tuple(bounds) for bounds in frozen or []]
+        self._mins = [shard.get("min_user_id") or 0 for shard in self.shards]
+
+    @classmethod
+    def from_json(cls, data: str) -> "ShardMap":
+        parsed = json.loads(data)
+        return cls(parsed["shards"], parsed.get("frozen"))
+
+    def to_json(self) -> str:
+        return json.dumps({"shards": self.shards, "frozen": [list(bounds) for bounds in self.frozen]}, indent=2)
+
+    def shard_for(self, user_id: int) -> str:
+        # Ids below the first bound still belong to the first shard
+        return self.shards[max(bisect_right(self._mins, user_id) - 1, 0)]["name"]
+
+    def bounds(self, name: str) -> tuple:
+        """[min, max) user_id range of a shard, max None for the last one"""
+        for i, shard in enumerate(self.shards):
+            if shard["name"] == name:
+                upper = self._mins[i + 1] if i + 1 < len(self.shards) else None
+                return self._mins[i], upper
+        raise KeyError(f"Unknown shard '{name}'")
+
+    def is_frozen(self, user_id: Optional[int]) -> bool:
+        """Whether user_id is in a frozen range; None (unknown ids) is frozen if any range is"""
+        if user_id is None:
+            return bool(self.frozen)
+        return any(low <= user_id and (high is None or user_id < high) for low, high in self.frozen)
+
+
+def _user_ids(statement) -> Optional[list]:
+    """user_ids a statement is limited to by `user_id == x` / `user_id IN (...)`, None if it isn't"""
+    where = getattr(statement, "whereclause", None)
+    if where is None:
+        return None
+    found = []
+    widened = []
+
+    def visit_clauselist(clauses):
+        # Under an OR other conditions could match more users, so the ids don't limit the statement
+        if clauses.operator is operators.or_:
+            widened.append(clauses)
+
+    def visit_binary(binary):
+        if binary.left is not _USER_ID and getattr(binary.left, "key", None) != "user_id":
+            return
+        value = getattr(binary.right, "effective_value", None)
+        if binary.operator is operators.eq and value is not None:
+            found.append(value)
+        elif binary.operator is operators.in_op and value is not None:
+            found.extend(value)
+
+    visitors.traverse(where, {}, {"binary": visit_binary, "expression_clauselist": visit_clauselist})
+    if not found or widened:
+        return None
+    return found
+
+
+class ShardRouter:
+    def __init__(self, primary: Engine, shard_map: ShardMap, path: Optional[str] = None,
+                 reload_seconds: float = SHARD_MAP_RELOAD_SECONDS, echo: bool = False):
+        self.primary = primary
+        self.path = path
+        self.reload_seconds = reload_seconds
+        self.echo = echo
+        self._engines_by_url: Dict[str, Engine] = {str(primary.url): primary}
+        self._mtime = os.stat(path).st_mtime if path else None
+        self._next_check = time.monotonic() + reload_seconds
+        self._apply(shard_map)
+
+    @classmethod
+    def from_file(cls, primary: Engine, path: str, **kw) -> "ShardRouter":
+        with open(path) as f:
+            return cls(primary, ShardMap.from_json(f.read()), path=path, **kw)
+
+    def _apply(self, shard_map: ShardMap):
+        engines = {PRIMARY: self.primary}
+        for shard in shard_map.shards:
+            url = shard["url"]
+            if url not in self._engines_by_url:
+                self._engines_by_url[url] = make_engine(url, self.echo)
+            engines[shard["name"]] = self._engines_by_url[url]
+        self.engines = engines
+        self.map = shard_map
+
+    def current(self) -> ShardMap:
+        """The shard map, re-read from its file at most every reload_seconds"""
+        if self.path and time.monotonic() >= self._next_check:
+            self._next_check = time.monotonic() + self.reload_seconds
+            try:
+                mtime = os.stat(self.path).st_mtime
+                if mtime != self._mtime:
+                    with open(self.path) as f:
+                        self._apply(ShardMap.from_json(f.read()))
+                    self._mtime = mtime
+                    logger.info("Shard map reloaded", extra={"shards": [s["name"] for s in self.map.shards]})
+            except (OSError, ValueError, KeyError) as e:
+                logger.error(f"Keeping the current shard map, reload failed: {e}")
+        return self.map
+
+    def _check_writable(self, user_ids):
+        shard_map = self.current()
+        for user_id in user_ids:
+            if shard_map.is_frozen(user_id):
+                raise ShardFrozen(f"user_id {user_id} is being moved to another shard")
+
+    # ShardedSession hooks
+
+    def shard_chooser(self, mapper, instance, clause=None):
+        if mapper is not None and mapper.class_ is User and instance is not None:
+            # Only called when flushing, i.e. writing this user
+            self._check_writable([instance.user_id])
+            return self.current().shard_for(instance.user_id)
+        return PRIMARY
+
+    def identity_chooser(self, mapper, primary_key, **kw):
+        if mapper.class_ is User:
+            return [self.current().shard_for(primary_key[0])]
+        return [PRIMARY]
+
+    def execute_chooser(self, orm_context):
+        mapper = orm_context.bind_mapper
+        if mapper is None or mapper.class_ is not User:
+            return [PRIMARY]
+        shard_map = self.current()
+        user_ids = _user_ids(orm_context.statement)
+        if orm_context.is_update or orm_context.is_delete:
+            self._check_writable(user_ids if user_ids is not None else [None])
+        if user_ids is None:
+            return [shard["name"] for shard in shard_map.shards]
+        return sorted({shard_map.shard_for(user_id) for user_id in user_ids})
+
+    def before_flush(self, session, flush_context, instances):
+        # Loaded users are flushed to the shard of their identity token without shard_chooser,
+        # so an ORM update or db.delete() of a user in a frozen range is refused here
+        self._check_writable([obj.user_id for obj in session.deleted if isinstance(obj, User)] +
+                             [obj.user_id for obj in session.dirty
+                              if isinstance(obj, User) and session.is_modified(obj)])
+
+    def session(self, **kw) -> ShardedSession:
+        """A session over the current shards; used as SessionLocal"""
+        self.current()
+        session = ShardedSession(shard_chooser=self.shard_chooser, identity_chooser=self.identity_chooser,
+                                 execute_chooser=self.execute_chooser, shards=dict(self.engines), **kw)
+        event.listen(session, "before_flush", self.before_flush)
+        return session
+
+    def create_all(self, metadata):
+        """Create users_admin on every shard"""
+        for name, engine in self.engines.items():
+            if name != PRIMARY:
+                metadata.create_all(bind=engine, tables=[_USERS])
+
+
+def build_router(primary: Engine, echo: bool = False) -> Optional[ShardRouter]:
+    """ShardRouter from SHARD_MAP_FILE / DATABASE_SHARDS, None when sharding is off"""
+    if SHARD_MAP_FILE:
+        return ShardRouter.from_file(primary, SHARD_MAP_FILE, echo=echo)
+    if DATABASE_SHARDS:
+        return ShardRouter(primary, ShardMap.from_json(DATABASE_SHARDS), echo=echo)
+    return None
+
+
+def _write_map(path: str, shard_map: ShardMap):
+    # Atomic replace, readers never see a half-written file
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        f.write(shard_map.to_json())
+    os.replace(tmp, path)
+
+
+def _copy_range(source: Engine, target: Engine, low: int, high: Optional[int], batch_size: int) -> int:
+    """Make target's rows in [low, high) match source's; returns rows written or removed"""
+    changed = 0
+    cursor = low - 1
+    columns = list(_USERS.c)
+    while True:
+        conditions = [_USER_ID > cursor] + ([_USER_ID < high] if high is not None else [])
+        with source.connect() as conn:
+            rows = conn.execute(select(*columns).where(*conditions).order_by(_USER_ID).limit(batch_size)).all()
+        if not rows:
+            break
+        batch_high = rows[-1].user_id
+        with target.begin() as conn:
+            existing = {row.user_id: tuple(row) for row in conn.execute(
+                select(*columns).where(_USER_ID > cursor, _USER_ID <= batch_high))}
+            stale = [tuple(row) for row in rows if existing.get(row.user_id) != tuple(row)]
+            gone = set(existing) - {row.user_id for row in rows}
+            remove = [row[0] for row in stale] + list(gone)
+            if remove:
+                conn.execute(delete(_USERS).where(_USER_ID.in_(remove)))
+            if stale:
+                conn.execute(insert(_USERS), [dict(zip(_USERS.c.keys(), row)) for row in stale])
+            changed += len(stale) + len(gone)
+        cursor = batch_high
+    # Rows the target has beyond the source's last one were deleted at the source
+    with target.begin() as conn:
+        conditions = [_USER_ID > cursor] + ([_USER_ID < high] if high is not None else [])
+        changed += conn.execute(delete(_USERS).where(*conditions)).rowcount
+    return changed
+
+
+def split_shard(map_path: str, shard: str, at: int, new_name: str, new_url: str,
+                batch_size: int = 1000, settle_seconds: Optional[float] = None, echo: bool = False):
+    """Move user_ids >= `at` from `shard` to a new shard `new_name` at `new_url`, online"""
+    if settle_seconds is None:
+        # Long enough for every process to re-read the map and finish writes in flight
+        settle_seconds = SHARD_MAP_RELOAD_SECONDS * 2 + 1
+    with open(map_path) as f:
+        shard_map = ShardMap.from_json(f.read())
+    if any(s["name"] == new_name for s in shard_map.shards):
+        raise ValueError(f"Shard '{new_name}' already exists")
+    low, high = shard_map.bounds(shard)
+    if not (low < at and (high is None or at < high)):
+        raise ValueError(f"{at} is not inside shard '{shard}' ({low}-{high})")
+    source = make_engine(next(s["url"] for s in shard_map.shards if s["name"] == shard), echo)
+    target = make_engine(new_url, echo)
+    _USERS.create(bind=target, checkfirst=True)
+
+    # 1. Bulk copy while the source keeps serving reads and writes
+    copied = _copy_range(source, target, at, high, batch_size)
+    logger.info(f"Split {shard}: copied {copied} rows to {new_name}, freezing writes")
+
+    # 2. Freeze writes to the moving range, then sync what changed during the copy
+    frozen = ShardMap(shard_map.shards, shard_map.frozen + [(at, high)])
+    _write_map(map_path, frozen)
+    time.sleep(settle_seconds)
+    synced = _copy_range(source, target, at, high, batch_size)
+
+    # 3. Route the range to the new shard, still frozen until old copies are gone
+    moved = ShardMap(frozen.shards + [{"name": new_name, "url": new_url, "min_user_id": at}], frozen.frozen)
+    _write_map(map_path, moved)
+    time.sleep(settle_seconds)
+    conditions = [_USER_ID >= at] + ([_USER_ID < high] if high is not None else [])
+    with source.begin() as conn:
+        removed = conn.execute(delete(_USERS).where(*conditions)).rowcount
+
+    _write_map(map_path, ShardMap(moved.shards, [b for b in moved.frozen if b != (at, high)]))
+    logger.info(f"Split {shard} at {at}: {synced} rows synced after freeze, {removed} removed from {shard}")
+    source.dispose()
+    target.dispose()
+    return {"copied": copied, "synced": synced, "removed": removed}
@@ -0,0 +1,364 @@
+# docu_serve/tracing.py
+"""Lightweight distributed tracing shared by the API and the worker.
+
+Spans follow the W3C trace-context model: the API continues an incoming
+`traceparent` header (or starts a new trace), records spans for auth, SQL
+statements and publishing, and puts `traceparent` in the AMQP message
+headers so worker.py can continue the same trace through decode, DB write
+and ack.
+
+The sampling decision is made once at the root span (TRACE_SAMPLE_RATE) and
+inherited downstream through the traceparent flags. Unsampled requests get a
+single non-recording span; children reuse it without allocating. Finished
+spans are queued to a background thread that batches them to a JSON-lines
+file (TRACE_EXPORTER=file) or an OTLP/HTTP JSON collector (TRACE_EXPORTER=otlp).
+With TRACE_EXPORTER=none (the default) tracing is off.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "none").lower()
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+TRACE_OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.05"))
+TRACE_SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "admin-user-deletion")
+TRACE_QUEUE_SIZE = int(os.getenv("TRACE_QUEUE_SIZE", "10000"))
+TRACE_BATCH_SIZE = int(os.getenv("TRACE_BATCH_SIZE", "512"))
+TRACE_EXPORT_INTERVAL = float(os.getenv("TRACE_EXPORT_INTERVAL", "2.0"))
+
+
+class Span:
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "sampled", "start_ns", "end_ns",
+                 "attributes", "error", "remote")
+
+    def __init__(self, name: str, trace_id: int, parent_id: Optional[int], sampled: bool,
+                 span_id: Optional[int] = None, remote: bool = False):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = span_id if span_id is not None else random.getrandbits(64)
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = {}
+        self.error = None
+        self.remote = remote
+
+    def set_attribute(self, key: str, value):
+        if self.sampled:
+            self.attributes[key] = value
+
+    def record_error(self, exc: BaseException):
+        if self.sampled:
+            self.error = f"{type(exc).__name__}: {exc}"
+
+    @property
+    def trace_id_hex(self) -> str:
+        return f"{self.trace_id:032x}"
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id:032x}-{self.span_id:016x}-{'01' if self.sampled else '00'}"
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": f"{self.trace_id:032x}",
+            "span_id": f"{self.span_id:016x}",
+            "parent_span_id": f"{self.parent_id:016x}" if self.parent_id else None,
+            "name": self.name,
+            "service": TRACE_SERVICE_NAME,
+            "start_time_unix_nano": self.start_ns,
+            "end_time_unix_nano": self.end_ns,
+            "attributes": self.attributes,
+            "status": "error" if self.error else "ok",
+            "error": self.error,
+        }
+
+
+_current: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def parse_traceparent(header: Optional[str]) -> Optional[Span]:
+    """Turn a W3C traceparent header into a remote parent span, None if invalid"""
+    if not header:
+        return None
+    parts = header.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        trace_id, span_id, flags = int(parts[1], 16), int(parts[2], 16), int(parts[3], 16)
+    except ValueError:
+        return None
+    if not trace_id or not span_id:
+        return None
+    return Span("remote", trace_id, None, bool(flags & 1), span_id=span_id, remote=True)
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+def current_traceparent() -> Optional[str]:
+    span = _current.get()
+    return span.traceparent() if span is not None else None
+
+
+def _new_span(name: str, parent: Optional[Span]) -> Span:
+    if parent is None:
+        sampled = TRACE_SAMPLE_RATE >= 1.0 or random.random() < TRACE_SAMPLE_RATE
+        return Span(name, random.getrandbits(128), None, sampled)
+    return Span(name, parent.trace_id, parent.span_id, parent.sampled)
+
+
+@contextmanager
+def start_span(name: str, parent: Optional[Span] = None, **attributes):
+    """Record a child of the current span (or of `parent`) around the block"""
+    if not enabled():
+        yield None
+        return
+    parent = parent if parent is not None else _current.get()
+    if parent is not None and not parent.sampled and not parent.remote:
+        # Unsampled trace: keep propagating the same context without allocating
+        yield parent
+        return
+
+    span = _new_span(name, parent)
+    token = _current.set(span)
+    try:
+        if span.sampled:
+            span.attributes.update(attributes)
+        yield span
+    except BaseException as e:
+        span.record_error(e)
+        raise
+    finally:
+        _current.reset(token)
+        _finish(span)
+
+
+def continue_trace(name: str, traceparent: Optional[str], **attributes):
+    """Start a span continuing the trace from an incoming traceparent header"""
+    return start_span(name, parent=parse_traceparent(traceparent), **attributes)
+
+
+def _finish(span: Span):
+    span.end_ns = time.time_ns()
+    if span.sampled and _exporter is not None:
+        _exporter.submit(span)
+
+
+# --- SQL statement spans ------------------------------------------------------
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    parent = _current.get()
+    if parent is not None and parent.sampled:
+        span = Span("db.query", parent.trace_id, parent.span_id, True)
+        span.attributes["db.statement"] = statement[:200]
+        conn.info["trace_span"] = span
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    span = conn.info.pop("trace_span", None)
+    if span is not None:
+        _finish(span)
+
+
+@event.listens_for(Engine, "handle_error")
+def _handle_error(exception_context):
+    conn = exception_context.connection
+    span = conn.info.pop("trace_span", None) if conn is not None else None
+    if span is not None:
+        span.record_error(exception_context.original_exception)
+        _finish(span)
+
+
+# --- export -------------------------------------------------------------------
+
+class FileSink:
+    """Appends spans as JSON lines"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def write(self, spans):
+        with open(self.path, "a") as f:
+            f.write("".join(json.dumps(span.to_dict()) + "\n" for span in spans))
+
+
+class OTLPSink:
+    """POSTs spans in OTLP/HTTP JSON format"""
+
+    def __init__(self, endpoint: str):
+        import httpx
+        self.endpoint = endpoint
+        self.client = httpx.Client(timeout=5.0)
+
+    def write(self, spans):
+        self.client.post(self.endpoint, json=to_otlp(spans))
+
+
+def to_otlp(spans) -> dict:
+    def attrs(values):
+        return [{"key": k, "value": {"stringValue": str(v)}} for k, v in values.items()]
+
+    return {"resourceSpans": [{
+        "resource": {"attributes": attrs({"service.name": TRACE_SERVICE_NAME})},
+        "scopeSpans": [{
+            "scope": {"name": "docu_serve.tracing"},
+            "spans": [{
+                "traceId": f"{s.trace_id:032x}",
+                "spanId": f"{s.span_id:016x}",
+                "parentSpanId": f"{s.parent_id:016x}" if s.parent_id else "",
+                "name": s.name,
+                "startTimeUnixNano": str(s.start_ns),
+                "endTimeUnixNano": str(s.end_ns),
+                "attributes": attrs(s.attributes),
+                "status": {"code": 2, "message": s.error} if s.error else {"code": 1},
+            } for s in spans],
+        }],
+    }]}
+
+
+class BatchExporter:
+    """Collects finished spans on a bounded queue and writes them in batches off the request path"""
+
+    def __init__(self, sink, queue_size: int = TRACE_QUEUE_SIZE, batch_size: int = TRACE_BATCH_SIZE,
+                 interval: float = TRACE_EXPORT_INTERVAL):
+        self.sink = sink
+        self.batch_size = batch_size
+        self.interval = interval
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._flush_requested = threading.Event()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+        self._thread.start()
+
+    def submit(self, span: Span):
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            # Never block a request on tracing
+            self.dropped += 1
+
+    def _drain(self):
+        batch = []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _export(self):
+        with self._lock:
+            while True:
+                batch = self._drain()
+                if not batch:
+                    return
+                try:
+                    self.sink.write(batch)
+                except Exception as e:
+                    logger.warning(f"Failed to export {len(batch)} spans: {e}")
+
+    def _run(self):
+        while not self._closed:
+            self._flush_requested.wait(self.interval)
+            self._flush_requested.clear()
+            self._export()
+
+    def flush(self):
+        """Export everything queued so far, called on shutdown"""
+        self._export()
+
+    def close(self):
+        self._closed = True
+        self._flush_requested.set()
+        self._export()
+
+
+_exporter: Optional[BatchExporter] = None
+
+
+def enabled() -> bool:
+    return _exporter is not None
+
+
+def set_service_name(name: str):
+    global TRACE_SERVICE_NAME
+    TRACE_SERVICE_NAME = name
+
+
+def configure(exporter: str = TRACE_EXPORTER, sink=None):
+    """Set up the exporter; called at import with env settings, again by tests"""
+    global _exporter
+    if _exporter is not None:
+        _exporter.close()
+    if sink is None:
+        if exporter == "file":
+            sink = FileSink(TRACE_FILE)
+        elif exporter == "otlp":
+            sink = OTLPSink(TRACE_OTLP_ENDPOINT)
+    _exporter = BatchExporter(sink) if sink is not None else None
+    return _exporter
+
+
+def shutdown():
+    if _exporter is not None:
+        _exporter.flush()
+
+
+configure()
+atexit.register(shutdown)
+
+
+class TracingMiddleware:
+    """Pure ASGI middleware opening the root span of each request"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not enabled():
+            await self.app(scope, receive, send)
+            return
+
+        incoming = None
+        for name, value in scope["headers"]:
+            if name == b"traceparent":
+                incoming = value.decode("latin-1")
+                break
+
+        with continue_trace(f"{scope['method']} {scope['path']}", incoming) as span:
+            async def send_wrapper(message):
+                if message["type"] == "http.response.start":
+                    span.set_attribute("http.status_code", message["status"])
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"x-trace-id", span.trace_id_hex.encode())
+                    ]
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                route = scope.get("route")
+                if route is not None and span.sampled:
+                    span.name = f"{scope['method']} {route.path}"
+                span.set_attribute("http.method", scope["method"])
+                span.set_attribute("http.target", scope["path"])
@@ -0,0 +1,67 @@
+# docu_serve/users.py
+"""User write helpers shared by the single-user and bulk admin endpoints."""
+from typing import Optional
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.horizontal_shard import ShardedSession
+
+from docu_serve.models import User
+
+SNAPSHOT_COLUMNS = (User.user_id, User.name, User.email, User.age, User.role)
+
+
+def etag(version: int) -> str:
+    return f'"{version}"'
+
+
+def if_match_versions(header: str):
+    """Versions named by an If-Match header, None for "*"; weak and foreign tags can never match"""
+    versions = []
+    for tag in header.split(","):
+        tag = tag.strip()
+        if tag == "*":
+            return None
+        if len(tag) > 2 and tag[0] == tag[-1] == '"' and tag[1:-1].isdigit():
+            versions.append(int(tag[1:-1]))
+    return versions
+
+
+def update_statement(user_id: int, data: dict, versions: Optional[list] = None):
+    """Conditional UPDATE ... RETURNING; matches nothing if the user is gone or its version moved on"""
+    conditions = [User.user_id == user_id]
+    if versions is not None:
+        conditions.append(User.version.in_(versions))
+    return (
+        update(User)
+        .where(*conditions)
+        .values(**data, version=User.version + 1)
+        .returning(*SNAPSHOT_COLUMNS, User.version)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def snapshot(row) -> dict:
+    """user.updated payload / UserOut fields from a returned row"""
+    return {"user_id": row.user_id, "name": row.name, "email": row.email, "age": row.age, "role": row.role}
+
+
+def current_version(db, user_id: int) -> Optional[int]:
+    return db.query(User.version).filter(User.user_id == user_id).scalar()
+
+
+def email_taken(db, email: str, user_id: int) -> bool:
+    """Whether another user has the email on any shard.
+
+    Only sharded sessions ask: each shard's unique index sees its own rows,
+    while a single database enforces uniqueness itself. Check-then-write, so
+    two concurrent writes on different shards can still both pass.
+    """
+    if not isinstance(db, ShardedSession):
+        return False
+    statement = select(User.user_id).where(User.email == email, User.user_id != user_id).limit(1)
+    return next(iter(db.execute(statement).scalars()), None) is not None
+
+
+def is_unique_violation(error: Exception) -> bool:
+    message = str(error).lower()
+    return "duplicate key" in message or "unique constraint" in message
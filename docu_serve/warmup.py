@@ -0,0 +1,154 @@
+# docu_serve/warmup.py
+"""Connection warm-up at startup, and the readiness it gates.
+
+Right after a deploy, the first requests used to pay for DB connects, the
+broker's connection and channel setup and new TLS connections to the auth
+service, so p99 spiked. lifespan now starts a Warmup that runs these steps
+concurrently, each bounded by WARMUP_STEP_TIMEOUT:
+
+- database: check out WARMUP_DB_CONNECTIONS connections (default: the
+  pool's size) from each engine, primary, shards and replicas, and hand them
+  back, so the pool holds them open.
+- broker: open the publisher's connection and channel and declare
+  user_events. publish_event reuses them from then on.
+- auth_service: open WARMUP_AUTH_CONNECTIONS keep-alive connections in the
+  shared auth client, with concurrent GET /health.
+
+GET /health/ready answers 503 until warm-up has finished and the required
+steps (the database) succeeded, then 200, with each step's status and
+timing either way. Broker and auth failures are reported, but they don't
+hold back readiness, as in /health/detailed. A failed step is retried every
+WARMUP_RETRY_INTERVAL seconds: required ones until they succeed, then the
+optional ones in the background, so a broker that was down at boot still
+gets its shared publisher channel once it is back. Readiness is per worker
+process.
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Awaitable, Callable, Dict, Iterable, Optional
+
+import httpx
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+
+logger = logging.getLogger(__name__)
+
+WARMUP_DB_CONNECTIONS = int(os.getenv("WARMUP_DB_CONNECTIONS", "0"))  # 0 = each pool's size
+WARMUP_AUTH_CONNECTIONS = int(os.getenv("WARMUP_AUTH_CONNECTIONS", "4"))
+WARMUP_STEP_TIMEOUT = float(os.getenv("WARMUP_STEP_TIMEOUT", "10"))
+WARMUP_RETRY_INTERVAL = float(os.getenv("WARMUP_RETRY_INTERVAL", "5"))
+
+# A step returns an optional detail for the readiness report, or raises
+Step = Callable[[], Awaitable[Optional[dict]]]
+
+
+def fill_pool(engine: Engine, size: int = WARMUP_DB_CONNECTIONS) -> int:
+    """Open up to `size` pooled connections at once and return them to the pool"""
+    if not size:
+        size = engine.pool.size() if isinstance(engine.pool, QueuePool) else 1
+    connections = []
+    try:
+        for _ in range(size):
+            connection = engine.connect()
+            connections.append(connection)
+            connection.execute(text("SELECT 1"))
+    finally:
+        for connection in connections:
+            connection.close()
+    return len(connections)
+
+
+async def fill_pools(engines: Iterable[Engine], size: int = WARMUP_DB_CONNECTIONS) -> dict:
+    # Blocking driver calls, one thread per engine
+    unique = list({id(engine): engine for engine in engines}.values())
+    opened = await asyncio.gather(*(asyncio.to_thread(fill_pool, engine, size) for engine in unique))
+    return {"connections": sum(opened), "engines": len(unique)}
+
+
+async def open_keepalive(client: httpx.AsyncClient, url: str, count: int = WARMUP_AUTH_CONNECTIONS) -> dict:
+    """Open `count` keep-alive connections in the client's pool with concurrent health requests"""
+    responses = await asyncio.gather(*(client.get(f"{url}/health") for _ in range(count)))
+    failed = [response.status_code for response in responses if response.status_code >= 500]
+    if failed:
+        raise RuntimeError(f"auth service returned {failed[0]}")
+    return {"connections": count}
+
+
+class Warmup:
+    """Runs the warm-up steps once at startup and tracks readiness"""
+
+    def __init__(self, steps: Dict[str, Step], required: Iterable[str] = ("database",),
+                 timeout: float = WARMUP_STEP_TIMEOUT, retry_interval: float = WARMUP_RETRY_INTERVAL):
+        self.steps = steps
+        self.required = [name for name in required if name in steps]
+        self.timeout = timeout
+        self.retry_interval = retry_interval
+        self.results: Dict[str, dict] = {name: {"status": "pending"} for name in steps}
+        self.finished = False
+        self.started_at: Optional[float] = None
+        self.ready_after: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.finished and all(self.results[name]["status"] == "ok" for name in self.required)
+
+    async def _run_step(self, name: str):
+        start = time.perf_counter()
+        try:
+            detail = await asyncio.wait_for(self.steps[name](), self.timeout)
+            result = {"status": "ok", **(detail or {})}
+        except asyncio.TimeoutError:
+            result = {"status": f"failed: timed out after {self.timeout}s"}
+        except Exception as e:
+            result = {"status": f"failed: {str(e) or type(e).__name__}"}
+        result["seconds"] = round(time.perf_counter() - start, 3)
+        self.results[name] = result
+        logger.info(f"Warm-up step {name}: {result['status']}", extra={"seconds": result["seconds"]})
+
+    async def run(self):
+        self.started_at = time.monotonic()
+        await asyncio.gather(*(self._run_step(name) for name in self.steps))
+        self.finished = True
+        while not self.ready:
+            logger.warning("Warm-up incomplete, not ready; retrying required steps",
+                           extra={"retry_in_s": self.retry_interval})
+            await asyncio.sleep(self.retry_interval)
+            await asyncio.gather(*(self._run_step(name) for name in self.required
+                                   if self.results[name]["status"] != "ok"))
+        self.ready_after = round(time.monotonic() - self.started_at, 3)
+        logger.info("Warm-up complete, ready", extra={"seconds": self.ready_after})
+
+    async def retry_failed(self):
+        """Re-run failed optional steps until they succeed; readiness doesn't wait on them"""
+        while True:
+            failed = [name for name, result in self.results.items() if result["status"] != "ok"]
+            if not failed:
+                return
+            logger.warning("Optional warm-up steps failed, retrying",
+                           extra={"steps": failed, "retry_in_s": self.retry_interval})
+            await asyncio.sleep(self.retry_interval)
+            await asyncio.gather(*(self._run_step(name) for name in failed))
+
+    async def _run_and_retry(self):
+        await self.run()
+        await self.retry_failed()
+
+    def status(self) -> dict:
+        return {"ready": self.ready, "ready_after_seconds": self.ready_after, "steps": self.results}
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run_and_retry())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
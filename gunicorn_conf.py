@@ -0,0 +1,76 @@
+# gunicorn_conf.py
+"""Production launcher: gunicorn managing uvicorn workers.
+
+    gunicorn -c gunicorn_conf.py docu_serve.main:app
+
+Every setting can be overridden from the environment (see below). With
+GUNICORN_PRELOAD=true the app is imported once in the master and forked, which
+saves memory and startup time; post_fork then drops any DB connections the
+master opened, on the primary, shards and replicas, so each worker builds its
+own pools. The broker is connected per worker inside the app's lifespan, which
+always runs after fork. Tables are created once, by the master in on_starting,
+not by every worker's lifespan.
+"""
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+bind = os.getenv("GUNICORN_BIND", f"0.0.0.0:{os.getenv('PORT', '8000')}")
+# Async workers: one per core is usually enough, DB-bound endpoints may want a few more
+workers = int(os.getenv("GUNICORN_WORKERS", os.getenv("WEB_CONCURRENCY", str(multiprocessing.cpu_count()))))
+worker_class = "docu_serve.gunicorn_worker.TunedUvicornWorker"
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+backlog = int(os.getenv("GUNICORN_BACKLOG", "2048"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "30"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+# Recycle workers after N requests (0 = never); jitter stops them all restarting at once
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "0"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "0"))
+preload_app = os.getenv("GUNICORN_PRELOAD", "false").lower() == "true"
+loglevel = os.getenv("GUNICORN_LOGLEVEL", "info")
+accesslog = os.getenv("GUNICORN_ACCESSLOG") or None
+errorlog = "-"
+
+# Metrics must be aggregated across workers; prometheus_client reads this at import time,
+# so it has to be set here, before the app (and prometheus_client) is loaded
+if not os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = os.path.join(tempfile.gettempdir(), "docu_serve_metrics")
+
+# Circuit breakers trip and recover together across workers (docu_serve/breakers.py)
+if not os.getenv("BREAKER_STATE_FILE"):
+    os.environ["BREAKER_STATE_FILE"] = os.path.join(tempfile.gettempdir(), "docu_serve_breakers")
+# A breaker left open by the previous run shouldn't outlive it; removed before the app (preload) maps it
+try:
+    os.remove(os.environ["BREAKER_STATE_FILE"])
+except FileNotFoundError:
+    pass
+
+
+def on_starting(server):
+    # Stale files from a previous run would be summed into the new counters
+    path = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path, exist_ok=True)
+    # Create the schema once, before forking: N workers running CREATE TABLE at the same time
+    # can fail on Postgres with duplicate-object errors, and a worker failing to boot halts gunicorn
+    from docu_serve.database import create_tables
+    create_tables()
+    os.environ["DB_CREATE_TABLES"] = "false"
+
+
+def post_fork(server, worker):
+    # With preload the engines (and the connections their startup smoke tests opened) were created
+    # in the master; sockets must not be shared across processes
+    from docu_serve.database import engine, shard_router
+    from docu_serve.replicas import router as replica_router
+    engines = [engine] + [replica.engine for replica in replica_router.replicas]
+    if shard_router is not None:
+        engines.extend(shard_router.engines.values())
+    for pooled in {id(e): e for e in engines if e is not None}.values():
+        pooled.dispose(close=False)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
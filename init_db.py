@@ -1,6 +1,5 @@
-from docu_serve.database import engine
-from docu_serve.models import Base
+from docu_serve.database import create_tables
 
 # Create all tables
-Base.metadata.create_all(bind=engine)
+create_tables()
 print("Database tables created successfully!")
\ No newline at end of file
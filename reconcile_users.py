@@ -0,0 +1,58 @@
+# reconcile_users.py
+"""Reconcile users_admin with the auth service's users.
+
+Compares hash-range digests of both sides and repairs only the user_id
+buckets that differ (docu_serve/reconcile.py). The auth side is either the
+auth service's digest endpoints (--auth-url) or a database of its users
+(--auth-db). --serve-stub serves --auth-db over those endpoints, a local
+stand-in for the auth service.
+
+Usage: python reconcile_users.py --auth-url http://auth-api:8000 --dry-run
+       python reconcile_users.py --auth-db sqlite:///./auth.db --serve-stub 8100
+"""
+import argparse
+import json
+import logging
+import os
+
+import httpx
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from docu_serve.database import SessionLocal
+from docu_serve.reconcile import DatabaseDigestSource, HttpDigestSource, digest_app, reconcile
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    auth = parser.add_mutually_exclusive_group(required=True)
+    auth.add_argument("--auth-url", help="base URL of the auth service's digest endpoints")
+    auth.add_argument("--auth-db", help="database URL holding the auth side's users")
+    parser.add_argument("--token", default=os.getenv("RECONCILE_AUTH_TOKEN"),
+                        help="bearer token for --auth-url (default RECONCILE_AUTH_TOKEN)")
+    parser.add_argument("--dry-run", action="store_true", help="report differences without repairing")
+    parser.add_argument("--delete-extra", action="store_true",
+                        help="delete users the auth side no longer has (default: only report them)")
+    parser.add_argument("--serve-stub", type=int, metavar="PORT", help="serve --auth-db's digests instead")
+    args = parser.parse_args()
+    if args.serve_stub is not None and args.auth_db is None:
+        parser.error("--serve-stub needs --auth-db")
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    if args.auth_db is not None:
+        remote = DatabaseDigestSource(sessionmaker(bind=create_engine(args.auth_db)))
+        if args.serve_stub is not None:
+            import uvicorn
+            uvicorn.run(digest_app(remote), host="0.0.0.0", port=args.serve_stub)
+            return
+    else:
+        headers = {"Authorization": f"Bearer {args.token}"} if args.token else None
+        remote = HttpDigestSource(httpx.Client(timeout=30.0, headers=headers), args.auth_url)
+
+    report = reconcile(SessionLocal, DatabaseDigestSource(SessionLocal), remote,
+                       apply=not args.dry_run, delete_extra=args.delete_extra)
+    print(json.dumps(report))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+# split_shard.py
+"""Split a users_admin shard online.
+
+Moves user_ids >= --at from --shard to a new shard at --url and rewrites the
+shard map file that the API and worker processes reload (SHARD_MAP_FILE).
+Writes to the moving range get 503 Retry-After for a few seconds near the
+end, and everything else keeps being served.
+
+Usage: python split_shard.py --map shards.json --shard shard0 --at 500000 \
+           --name shard1 --url sqlite:///./shard1.db
+"""
+import argparse
+import json
+import logging
+
+from docu_serve.sharding import SHARD_MAP_RELOAD_SECONDS, split_shard
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--map", required=True, help="shard map JSON file (SHARD_MAP_FILE)")
+    parser.add_argument("--shard", required=True, help="shard to split")
+    parser.add_argument("--at", required=True, type=int, help="first user_id that moves to the new shard")
+    parser.add_argument("--name", required=True, help="name of the new shard")
+    parser.add_argument("--url", required=True, help="database URL of the new shard")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--settle-seconds", type=float, default=SHARD_MAP_RELOAD_SECONDS * 2 + 1,
+                        help="wait after each map change so every process has reloaded it")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    result = split_shard(args.map, args.shard, args.at, args.name, args.url,
+                         batch_size=args.batch_size, settle_seconds=args.settle_seconds)
+    print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
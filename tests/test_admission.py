@@ -0,0 +1,165 @@
+# tests/test_admission.py
+"""Tests for per-admin rate limiting and the admin concurrency limit"""
+
+from jose import jwt
+from datetime import datetime, timedelta, timezone
+from docu_serve import admission as admission_module
+from docu_serve import main
+from docu_serve.admission import AdmissionController, ConcurrencyLimiter, InMemoryTokenBuckets
+from docu_serve.main import SECRET_KEY, ALGORITHM
+import asyncio
+import pytest
+
+
+def _admin_headers(sub="admin@example.com"):
+    token = jwt.encode(
+        {
+            "sub": sub,
+            "role": "admin",
+            "aud": "delete-service",
+            "exp": datetime.now(timezone.utc) + timedelta(minutes=30)
+        },
+        SECRET_KEY,
+        algorithm=ALGORITHM
+    )
+    return {"Authorization": f"Bearer {token}"}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Freeze time.monotonic for the token buckets; advance with clock[0] += seconds"""
+    now = [1000.0]
+    monkeypatch.setattr(admission_module.time, "monotonic", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def install_admission(monkeypatch):
+    def install(**kwargs):
+        controller = AdmissionController(**kwargs)
+        monkeypatch.setattr(main, "admission", controller)
+        return controller
+    return install
+
+
+def test_token_bucket_allows_burst_then_refills(clock):
+    """Test a bucket admits `burst` calls, then reports the wait until the next token"""
+    async def test_async():
+        buckets = InMemoryTokenBuckets(rate=2, burst=3)
+        assert [await buckets.acquire("a") for _ in range(3)] == [0, 0, 0]
+        assert await buckets.acquire("a") == pytest.approx(0.5)
+
+        clock[0] += 0.5
+        assert await buckets.acquire("a") == 0
+
+    asyncio.run(test_async())
+
+
+def test_token_buckets_are_per_key_and_bounded(clock):
+    """Test admins don't share tokens and old keys are evicted past max_keys"""
+    async def test_async():
+        buckets = InMemoryTokenBuckets(rate=1, burst=1, max_keys=2)
+        assert await buckets.acquire("a") == 0
+        assert await buckets.acquire("b") == 0
+        assert await buckets.acquire("a") > 0
+
+        await buckets.acquire("c")
+        assert list(buckets._buckets) == ["a", "c"]
+
+    asyncio.run(test_async())
+
+
+def test_concurrency_limiter_never_waits():
+    """Test try_acquire fails immediately at the limit and a limit of 0 is unlimited"""
+    limiter = ConcurrencyLimiter(2)
+    assert limiter.try_acquire() and limiter.try_acquire()
+    assert not limiter.try_acquire()
+    limiter.release()
+    assert limiter.try_acquire()
+
+    unlimited = ConcurrencyLimiter(0)
+    assert all(unlimited.try_acquire() for _ in range(100))
+
+
+def test_rate_limit_disabled_with_zero_rate():
+    """Test ADMIN_RATE_LIMIT=0 admits everything without tracking buckets"""
+    controller = AdmissionController(rate=0, burst=1, max_concurrency=0)
+    assert controller.buckets is None
+    assert asyncio.run(controller.rate_limit("admin@example.com")) == 0
+
+
+def test_redis_outage_fails_open():
+    """Test Redis errors admit the request and are counted instead of raising"""
+    buckets = admission_module.RedisTokenBuckets.__new__(admission_module.RedisTokenBuckets)
+    buckets.rate, buckets.burst, buckets.prefix, buckets.errors = 1.0, 1, "admission:", 0
+    buckets._error_types = (ConnectionError,)
+
+    async def unreachable(**kwargs):
+        raise ConnectionError("Connection refused")
+    buckets._script = unreachable
+
+    controller = AdmissionController(rate=0, burst=1, max_concurrency=0)
+    controller.buckets = buckets
+    assert asyncio.run(controller.rate_limit("admin@example.com")) == 0
+    assert asyncio.run(controller.rate_limit("admin@example.com")) == 0
+    assert buckets.errors == 2
+
+
+def test_admin_over_rate_limit_gets_429(client, clock, install_admission):
+    """Test the second request in a 1-token bucket is rejected with Retry-After"""
+    install_admission(rate=0.5, burst=1, max_concurrency=0)
+
+    first = client.delete("/api/admin/delete/999999", headers=_admin_headers())
+    second = client.delete("/api/admin/delete/999999", headers=_admin_headers())
+
+    assert first.status_code == 404
+    assert second.status_code == 429
+    assert second.headers["retry-after"] == "2"
+
+
+def test_rate_limit_is_keyed_on_sub(client, clock, install_admission):
+    """Test one admin exhausting their bucket does not throttle another"""
+    install_admission(rate=1, burst=1, max_concurrency=0)
+
+    assert client.delete("/api/admin/delete/999999", headers=_admin_headers("a@example.com")).status_code == 404
+    assert client.delete("/api/admin/delete/999999", headers=_admin_headers("a@example.com")).status_code == 429
+    assert client.delete("/api/admin/delete/999999", headers=_admin_headers("b@example.com")).status_code == 404
+
+
+def test_concurrency_limit_sheds_with_503(client, install_admission):
+    """Test requests beyond the in-flight cap are rejected instead of queued"""
+    controller = install_admission(rate=0, burst=1, max_concurrency=1)
+    controller.limiter.in_flight = 1
+
+    response = client.patch("/api/admin/users/999999", json={"name": "x"}, headers=_admin_headers())
+
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+
+
+def test_concurrency_slot_released_after_request(client, install_admission):
+    """Test a finished (or failed) request gives its slot back"""
+    controller = install_admission(rate=0, burst=1, max_concurrency=1)
+
+    for _ in range(3):
+        assert client.delete("/api/admin/delete/999999", headers=_admin_headers()).status_code == 404
+    assert controller.limiter.in_flight == 0
+
+
+def test_rejected_before_database(client, clock, install_admission, monkeypatch):
+    """Test a throttled request never opens a DB session"""
+    install_admission(rate=1, burst=1, max_concurrency=0)
+    client.delete("/api/admin/delete/999999", headers=_admin_headers())
+
+    opened = []
+    original = main.app.dependency_overrides[main.get_db]
+
+    def tracking_get_db():
+        opened.append(True)
+        yield from original()
+
+    monkeypatch.setitem(main.app.dependency_overrides, main.get_db, tracking_get_db)
+    response = client.delete("/api/admin/delete/999999", headers=_admin_headers())
+
+    assert response.status_code == 429
+    assert opened == []
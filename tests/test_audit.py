@@ -0,0 +1,150 @@
+# tests/test_audit.py
+"""Tests for the buffered admin audit log"""
+
+from jose import jwt
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import delete, select, update
+from sqlalchemy.exc import DatabaseError
+from sqlalchemy.orm import sessionmaker
+from docu_serve import audit
+from docu_serve.audit import AuditLog, make_record
+from docu_serve.main import SECRET_KEY, ALGORITHM, audit_log
+from docu_serve.models import AuditRecord, User
+import asyncio
+import json
+import os
+import pytest
+
+
+def _admin_headers():
+    token = jwt.encode(
+        {
+            "sub": "auditor@example.com",
+            "role": "admin",
+            "aud": "delete-service",
+            "exp": datetime.now(timezone.utc) + timedelta(minutes=30)
+        },
+        SECRET_KEY,
+        algorithm=ALGORITHM
+    )
+    return {"Authorization": f"Bearer {token}"}
+
+
+def _make_user(db_session, name):
+    user = User(name=name, email=f"{name}@example.com", age=30, hashed_password="hash", role="user")
+    db_session.add(user)
+    db_session.commit()
+    return user.user_id
+
+
+def _records(db_session, **filters):
+    return db_session.execute(audit.query(**filters)).scalars().all()
+
+
+@pytest.fixture
+def factory(db_session):
+    return sessionmaker(bind=db_session.get_bind())
+
+
+def test_delete_and_patch_are_audited_after_flush(client, db_session):
+    """Test admin actions are buffered, not written, until the flush"""
+    deleted, patched = _make_user(db_session, "audited1"), _make_user(db_session, "audited2")
+    buffered = audit_log.buffered
+
+    assert client.delete(f"/api/admin/delete/{deleted}", headers=_admin_headers()).status_code == 200
+    assert client.patch(f"/api/admin/users/{patched}", json={"age": 44}, headers=_admin_headers()).status_code == 200
+
+    assert audit_log.buffered == buffered + 2
+    assert _records(db_session, actor="auditor@example.com") == []
+    assert asyncio.run(audit_log.flush())
+
+    records = _records(db_session, actor="auditor@example.com")
+    assert [(r.action, r.user_id, r.source, json.loads(r.changes)) for r in records] == [
+        ("user.deleted", deleted, "api", {"email": "audited1@example.com"}),
+        ("user.updated", patched, "api", {"age": 44}),
+    ]
+
+
+def test_audit_table_is_append_only(db_session, factory):
+    """Test the table refuses updates and deletes"""
+    asyncio.run(_flushed(AuditLog(factory), [make_record("a@example.com", "user.deleted", 1)]))
+
+    with pytest.raises(DatabaseError):
+        db_session.execute(update(AuditRecord).values(actor="someone-else"))
+    db_session.rollback()
+    with pytest.raises(DatabaseError):
+        db_session.execute(delete(AuditRecord))
+    db_session.rollback()
+
+
+async def _flushed(log, records):
+    await log.record_many(records)
+    await log.flush()
+
+
+def test_full_buffer_flushes_inline_and_drops_when_the_db_fails(factory):
+    """Test the buffer stays bounded: a full buffer flushes, a failing flush drops"""
+    log = AuditLog(factory, max_buffer=2)
+
+    async def test_async():
+        await log.record_many([make_record("a@example.com", "user.updated", i) for i in range(2)])
+        await log.record("a@example.com", "user.updated", 3)
+        assert log.flushed == 2 and log.buffered == 1
+
+        def broken():
+            raise RuntimeError("database down")
+        log.session_factory = broken
+        await log.record("a@example.com", "user.updated", 4)
+        await log.record("a@example.com", "user.updated", 5)
+
+    asyncio.run(test_async())
+    assert log.buffered == 2
+    assert log.dropped == 1
+
+
+def test_spool_of_a_crashed_process_is_replayed_once(db_session, factory, tmp_path):
+    """Test records that never reached the table are recovered from the spool"""
+    crashed = AuditLog(factory, spool_dir=str(tmp_path))
+    user_id = 990001
+    asyncio.run(crashed.record("crash@example.com", "user.deleted", user_id, {"email": "x@example.com"}))
+    spool = crashed._spool
+    # The process dies with the record still buffered; its flock goes with it
+    os.close(spool.fd)
+    with open(spool.path, "a") as f:
+        f.write('{"record_id": "cut-sho')
+
+    restarted = AuditLog(factory, spool_dir=str(tmp_path))
+    assert restarted.replay_orphans() == 1
+    assert restarted.replay_orphans() == 0
+    assert [r.actor for r in _records(db_session, user_id=user_id)] == ["crash@example.com"]
+    assert os.listdir(tmp_path) == []
+
+
+def test_spool_is_deleted_once_committed_and_kept_by_live_writer(factory, tmp_path):
+    """Test a flushed spool is removed and a live process's spool is left alone"""
+    writer = AuditLog(factory, spool_dir=str(tmp_path))
+    other = AuditLog(factory, spool_dir=str(tmp_path))
+
+    async def test_async():
+        await writer.record("live@example.com", "user.updated", 990002, {"age": 1})
+        assert other.replay_orphans() == 0
+        assert len(os.listdir(tmp_path)) == 1
+        await writer.flush()
+
+    asyncio.run(test_async())
+    assert os.listdir(tmp_path) == []
+
+
+def test_query_filters_by_time_and_action(db_session, factory):
+    """Test the export query's filters"""
+    old = make_record("q@example.com", "user.deleted", 990003)
+    old["at"] = datetime(2020, 1, 1, tzinfo=timezone.utc).timestamp()
+    new = make_record("q@example.com", "user.updated", 990003, {"name": "n"})
+    asyncio.run(_flushed(AuditLog(factory), [old, new]))
+
+    since = datetime(2021, 1, 1, tzinfo=timezone.utc)
+    assert [r.action for r in _records(db_session, user_id=990003, since=since)] == ["user.updated"]
+    assert [r.action for r in _records(db_session, user_id=990003, action="user.deleted")] == ["user.deleted"]
+    exported = list(audit.export_rows(_records(db_session, user_id=990003)))
+    assert exported[0]["at"] == "2020-01-01T00:00:00+00:00"
+    assert exported[1]["changes"] == {"name": "n"}
@@ -0,0 +1,133 @@
+# tests/test_breakers.py
+"""Tests for the asyncio circuit breaker"""
+
+from datetime import datetime, timedelta
+from docu_serve.breakers import (_SEQ, AsyncCircuitBreaker, BreakerStateFile, SharedMemoryStorage, breaker_status,
+                                 breaker_storage)
+from pybreaker import CircuitBreakerError
+import asyncio
+import multiprocessing
+import pytest
+
+
+def test_call_async_returns_result():
+    """Test a successful coroutine passes its result through"""
+    breaker = AsyncCircuitBreaker(fail_max=2, reset_timeout=30)
+
+    async def ok(value):
+        return value
+
+    assert asyncio.run(breaker.call_async(ok, 5)) == 5
+    assert breaker.current_state == "closed"
+
+
+def test_call_async_trips_after_fail_max():
+    """Test failures are counted and the breaker opens without tornado"""
+    breaker = AsyncCircuitBreaker(fail_max=2, reset_timeout=30)
+
+    async def boom():
+        raise RuntimeError("down")
+
+    async def test_async():
+        with pytest.raises(RuntimeError):
+            await breaker.call_async(boom)
+        with pytest.raises(CircuitBreakerError):
+            await breaker.call_async(boom)
+        # Open now: rejected without calling through
+        with pytest.raises(CircuitBreakerError):
+            await breaker.call_async(boom)
+
+    asyncio.run(test_async())
+    assert breaker.current_state == "open"
+
+
+def _shared_breaker(path, name="auth"):
+    # A separate BreakerStateFile per breaker stands in for a separate worker process
+    return AsyncCircuitBreaker(fail_max=2, reset_timeout=30, name=name,
+                               state_storage=SharedMemoryStorage(BreakerStateFile(str(path)), name))
+
+
+async def _boom():
+    raise RuntimeError("down")
+
+
+async def _ok():
+    return "ok"
+
+
+def test_shared_breakers_trip_and_recover_together(tmp_path):
+    """Test failures from every worker count towards one host-wide state"""
+    path = tmp_path / "breakers"
+    first, second = _shared_breaker(path), _shared_breaker(path)
+
+    async def test_async():
+        with pytest.raises(RuntimeError):
+            await first.call_async(_boom)
+        assert second.fail_counter == 1
+        with pytest.raises(CircuitBreakerError):
+            await second.call_async(_boom)
+        # Tripped by the second worker, so the first one stops calling too
+        with pytest.raises(CircuitBreakerError):
+            await first.call_async(_ok)
+
+        # Once the reset timeout has passed, one trial call closes it everywhere
+        first._state_storage.opened_at = datetime.utcnow() - timedelta(seconds=31)
+        assert await second.call_async(_ok) == "ok"
+
+    asyncio.run(test_async())
+    assert first.current_state == "closed"
+    assert first.fail_counter == 0
+
+
+def test_shared_breakers_are_kept_apart_by_name(tmp_path):
+    """Test each breaker name gets its own slot in the file"""
+    path = tmp_path / "breakers"
+    auth, rabbit = _shared_breaker(path, "auth"), _shared_breaker(path, "rabbit")
+
+    async def test_async():
+        with pytest.raises(RuntimeError):
+            await auth.call_async(_boom)
+
+    asyncio.run(test_async())
+    assert auth.fail_counter == 1
+    assert rabbit.fail_counter == 0
+
+
+def _increment(path, times):
+    storage = SharedMemoryStorage(BreakerStateFile(path), "auth")
+    for _ in range(times):
+        storage.increment_counter()
+
+
+def test_shared_counter_updates_are_atomic_across_processes(tmp_path):
+    """Test concurrent increments from several processes are never lost"""
+    path = str(tmp_path / "breakers")
+    context = multiprocessing.get_context("fork")
+    workers = [context.Process(target=_increment, args=(path, 200)) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(timeout=30)
+
+    assert SharedMemoryStorage(BreakerStateFile(path), "auth").counter == 800
+
+
+def test_slot_left_mid_update_is_repaired(tmp_path):
+    """Test a writer that died mid-update doesn't wedge readers"""
+    storage = SharedMemoryStorage(BreakerStateFile(str(tmp_path / "breakers")), "auth")
+    storage.increment_counter()
+    _SEQ.pack_into(storage.state_file._map, storage._offset, 7)
+
+    assert storage.counter == 1
+    storage.increment_counter()
+    assert storage.counter == 2
+
+
+def test_breaker_status_reports_scope(tmp_path):
+    """Test the health view says whether the state is per process or host-wide"""
+    local = AsyncCircuitBreaker(state_storage=breaker_storage("local", path=None))
+    shared = _shared_breaker(tmp_path / "breakers")
+
+    assert breaker_status(local)["scope"] == "process"
+    status = breaker_status(shared)
+    assert status == {"state": "closed", "failures": 0, "fail_max": 2, "opened_at": None, "scope": "host"}
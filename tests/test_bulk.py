@@ -0,0 +1,151 @@
+# tests/test_bulk.py
+"""Tests for streamed NDJSON bulk delete/patch commands"""
+
+from unittest.mock import AsyncMock, patch
+from jose import jwt
+from datetime import datetime, timedelta, timezone
+from sqlalchemy.orm import sessionmaker
+from docu_serve import bulk, main
+from docu_serve.main import SECRET_KEY, ALGORITHM
+from docu_serve.models import User
+import asyncio
+import json
+import pytest
+
+
+def _admin_headers():
+    token = jwt.encode(
+        {
+            "sub": "admin@example.com",
+            "role": "admin",
+            "aud": "delete-service",
+            "exp": datetime.now(timezone.utc) + timedelta(minutes=30)
+        },
+        SECRET_KEY,
+        algorithm=ALGORITHM
+    )
+    return {"Authorization": f"Bearer {token}", "Content-Type": bulk.MEDIA_TYPE}
+
+
+def _make_users(db_session, prefix, count):
+    users = [User(name=f"{prefix}{i}", email=f"{prefix}{i}@bulk-example.com", age=30, hashed_password="hash",
+                  role="user") for i in range(count)]
+    db_session.add_all(users)
+    db_session.commit()
+    return [user.user_id for user in users]
+
+
+def _ndjson(*commands):
+    return "".join((c if isinstance(c, str) else json.dumps(c)) + "\n" for c in commands).encode()
+
+
+@pytest.fixture
+def publish():
+    with patch("docu_serve.main.publish_events", new_callable=AsyncMock) as mock:
+        yield mock
+
+
+def test_bulk_streams_a_result_per_line(client, db_session, publish):
+    """Test deletes, patches and bad lines each get a result, in order, then a summary"""
+    a, b, c = _make_users(db_session, "mixed", 3)
+
+    response = client.post("/api/admin/users/bulk", headers=_admin_headers(), content=_ndjson(
+        {"op": "delete", "user_id": a},
+        {"op": "delete", "user_id": 999999},
+        {"op": "patch", "user_id": b, "changes": {"age": 41}, "if_match": '"1"'},
+        "",
+        "not json",
+        {"op": "patch", "user_id": c, "changes": {"age": 42}, "if_match": '"7"'},
+        {"op": "patch", "user_id": c, "changes": {}},
+    ))
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith(bulk.MEDIA_TYPE)
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [(line["line"], line["status"]) for line in lines[:-1]] == [
+        (1, 200), (2, 404), (3, 200), (5, 400), (6, 412), (7, 400)]
+    assert lines[2]["etag"] == '"2"'
+    assert lines[4]["etag"] == '"1"'
+    assert lines[-1] == {"summary": {"lines": 6, "succeeded": 2, "failed": 4}}
+
+    db_session.expire_all()
+    assert db_session.get(User, a) is None
+    assert db_session.get(User, b).age == 41
+    assert db_session.get(User, c).age == 30
+    assert [call.args[0] for call in publish.await_args_list] == ["user.deleted", "user.updated"]
+
+
+def test_bulk_failed_chunk_only_fails_offending_lines(client, db_session, publish):
+    """Test a duplicate email rolls back the chunk and replays it line by line"""
+    a, b, c = _make_users(db_session, "dupe", 3)
+
+    response = client.post("/api/admin/users/bulk", headers=_admin_headers(), content=_ndjson(
+        {"op": "delete", "user_id": a},
+        {"op": "patch", "user_id": b, "changes": {"email": "dupe2@bulk-example.com"}},
+        {"op": "patch", "user_id": c, "changes": {"name": "renamed"}},
+    ))
+
+    statuses = [json.loads(line).get("status") for line in response.text.splitlines()]
+    assert statuses == [200, 409, 200, None]
+    db_session.expire_all()
+    assert db_session.get(User, a) is None
+    assert db_session.get(User, c).name == "renamed"
+    assert [call.args[0] for call in publish.await_args_list] == ["user.deleted", "user.updated"]
+
+
+def test_bulk_holds_a_concurrency_slot_for_the_whole_stream(client, db_session, publish):
+    """Test the admission slot is held while chunks are applied and released after the stream"""
+    (a,) = _make_users(db_session, "slot", 1)
+    in_flight = []
+    publish.side_effect = lambda *args: in_flight.append(main.admission.limiter.in_flight)
+    before = main.admission.limiter.in_flight
+
+    response = client.post("/api/admin/users/bulk", headers=_admin_headers(),
+                           content=_ndjson({"op": "delete", "user_id": a}))
+
+    assert response.status_code == 200
+    assert in_flight == [before + 1]
+    assert main.admission.limiter.in_flight == before
+
+
+def test_bulk_requires_admin(client):
+    """Test the stream is refused without an admin token"""
+    response = client.post("/api/admin/users/bulk", content=_ndjson({"op": "delete", "user_id": 1}))
+    assert response.status_code == 401
+
+
+def test_read_lines_skips_overlong_lines():
+    """Test lines split across pieces are rejoined and over-long ones come out as None"""
+    async def body():
+        for piece in (b'{"a"', b':1}\n' + b"x" * 10, b"y" * 10, b"z\n{}\n", b"tail"):
+            yield piece
+
+    async def collect():
+        return [line async for line in bulk.read_lines(body(), max_line=8)]
+
+    assert asyncio.run(collect()) == [b'{"a":1}', None, b"{}", b"tail"]
+
+
+def test_stream_reads_body_at_the_consumers_pace(db_session):
+    """Test the body is not read far ahead of the results the client has taken"""
+    consumed = 0
+
+    async def body():
+        nonlocal consumed
+        for _ in range(1000):
+            consumed += 1
+            yield _ndjson({"op": "delete", "user_id": 999999})
+
+    async def first_result():
+        stream = bulk.stream_commands(body(), sessionmaker(bind=db_session.get_bind()), AsyncMock(),
+                                      chunk_size=10, depth=2)
+        first = await stream.__anext__()
+        await asyncio.sleep(0.05)
+        await stream.aclose()
+        return first
+
+    first = asyncio.run(first_result())
+
+    assert len(first.splitlines()) == 10
+    # The chunk in hand, the queued ones and the one the reader is filling
+    assert consumed <= 10 * (2 + 2)
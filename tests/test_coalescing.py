@@ -0,0 +1,82 @@
+# tests/test_coalescing.py
+"""Tests for user.updated event coalescing"""
+
+from unittest.mock import AsyncMock, patch
+from docu_serve import main
+from docu_serve.coalescing import EventCoalescer
+from docu_serve.main import publish_event
+import asyncio
+
+
+def _snapshot(user_id, name):
+    return {"user_id": user_id, "name": name, "email": f"u{user_id}@test.com", "age": 30, "role": "user"}
+
+
+def test_latest_snapshot_per_user_is_published_after_window():
+    """Test repeated updates to one user collapse to the last one, in one batch"""
+    publish = AsyncMock()
+
+    async def test_async():
+        coalescer = EventCoalescer(publish, window=0.05)
+        coalescer.add(_snapshot(1, "a"))
+        coalescer.add(_snapshot(2, "b"))
+        coalescer.add(_snapshot(1, "c"))
+        assert publish.await_count == 0
+        await asyncio.sleep(0.1)
+        return coalescer
+
+    coalescer = asyncio.run(test_async())
+    publish.assert_awaited_once_with("user.updated", [_snapshot(2, "b"), _snapshot(1, "c")])
+    assert coalescer.coalesced == 1
+
+
+def test_max_pending_flushes_early():
+    """Test going over max_pending publishes without waiting out the window"""
+    publish = AsyncMock()
+
+    async def test_async():
+        coalescer = EventCoalescer(publish, window=60, max_pending=2)
+        for user_id in range(3):
+            coalescer.add(_snapshot(user_id, "x"))
+        await asyncio.sleep(0.01)
+
+    asyncio.run(test_async())
+    assert len(publish.await_args.args[1]) == 3
+
+
+def test_close_flushes_pending():
+    """Test shutdown publishes what is still waiting"""
+    publish = AsyncMock()
+
+    async def test_async():
+        coalescer = EventCoalescer(publish, window=60)
+        coalescer.add(_snapshot(1, "a"))
+        await coalescer.close()
+
+    asyncio.run(test_async())
+    publish.assert_awaited_once_with("user.updated", [_snapshot(1, "a")])
+
+
+def test_delete_is_published_after_pending_updates():
+    """Test a user.deleted flushes pending updates first instead of overtaking them"""
+    sent = []
+
+    async def call_async(func, event_type, *payloads):
+        sent.extend((event_type, payload["user_id"]) for payload in payloads)
+
+    async def test_async():
+        coalescer = EventCoalescer(main._send_events, window=60)
+        with patch("docu_serve.main.event_coalescer", coalescer), \
+                patch("docu_serve.main.rabbitmq_breaker.call_async", new=call_async):
+            await publish_event("user.updated", _snapshot(1, "a"))
+            await publish_event("user.updated", _snapshot(2, "b"))
+            await publish_event("user.deleted", {"user_id": 1, "email": "u1@test.com"})
+
+    asyncio.run(test_async())
+    assert sent == [("user.updated", 1), ("user.updated", 2), ("user.deleted", 1)]
+
+
+def test_disabled_by_default():
+    """Test a zero window publishes every update straight away"""
+    assert not EventCoalescer(AsyncMock(), window=0).enabled
+    assert not main.event_coalescer.enabled
@@ -6,6 +6,7 @@ from fastapi import HTTPException
 from unittest.mock import patch, AsyncMock, MagicMock
 from jose import jwt
 from datetime import datetime, timedelta, timezone
+from docu_serve import jsonlog
 from docu_serve.main import SECRET_KEY, ALGORITHM, get_rabbitmq_connection, _log_failed_event
 from docu_serve.models import User
 from pybreaker import CircuitBreakerError
@@ -74,6 +75,8 @@ def test_log_failed_event():
         os.remove("failed_events.log")
     
     _log_failed_event(event_type, payload)
+    # Written by a background thread; flush instead of waiting for the next batch
+    jsonlog.flush()
     
     # Verify file was created and contains data
     assert os.path.exists("failed_events.log")
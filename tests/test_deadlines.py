@@ -0,0 +1,180 @@
+# tests/test_deadlines.py
+"""Tests for per-request deadlines and their propagation to DB, broker and auth calls"""
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from unittest.mock import patch
+from sqlalchemy import create_engine, text
+from docu_serve import deadlines, main
+from docu_serve.deadlines import DeadlineExceeded, DeadlineMiddleware, deadline, parse_timeout
+from docu_serve.main import ALGORITHM, SECRET_KEY, publish_event
+from docu_serve.models import User
+from datetime import datetime, timedelta, timezone
+from jose import jwt
+import asyncio
+import pytest
+
+
+def _slow_app():
+    app = FastAPI()
+    app.add_middleware(DeadlineMiddleware)
+
+    @app.get("/slow")
+    async def slow(seconds: float):
+        await asyncio.sleep(seconds)
+        return {"remaining": deadlines.remaining()}
+
+    @app.get("/committed")
+    async def committed(seconds: float):
+        deadlines.release()
+        await asyncio.sleep(seconds)
+        return {"remaining": deadlines.remaining()}
+
+    return app
+
+
+def test_parse_timeout_clamps_and_falls_back():
+    """Test the client header can shorten or extend the budget up to the max"""
+    assert parse_timeout(None) == deadlines.REQUEST_TIMEOUT
+    assert parse_timeout("0.5") == 0.5
+    assert parse_timeout("99999") == deadlines.REQUEST_TIMEOUT_MAX
+    assert parse_timeout("-1") == deadlines.REQUEST_TIMEOUT
+    assert parse_timeout("soon") == deadlines.REQUEST_TIMEOUT
+
+
+def test_timeout_is_capped_by_remaining_budget():
+    """Test downstream timeouts shrink to the budget and fail once it is spent"""
+    assert deadlines.timeout(10.0) == 10.0
+    with deadline(1.0):
+        assert deadlines.timeout(10.0) <= 1.0
+        assert deadlines.timeout(0.1) == 0.1
+    with deadline(-1):
+        with pytest.raises(DeadlineExceeded):
+            deadlines.timeout(10.0)
+
+
+def test_bounded_cancels_at_deadline():
+    """Test awaited work is cancelled when the budget runs out"""
+    async def test_async():
+        with deadline(0.05):
+            async with deadlines.bounded():
+                await asyncio.sleep(5)
+
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(test_async())
+
+
+def test_middleware_returns_504_when_budget_spent():
+    """Test a handler outliving X-Request-Timeout gets a 504 instead of hanging"""
+    client = TestClient(_slow_app())
+
+    slow = client.get("/slow", params={"seconds": 2}, headers={"X-Request-Timeout": "0.05"})
+    fast = client.get("/slow", params={"seconds": 0}, headers={"X-Request-Timeout": "5"})
+
+    assert slow.status_code == 504
+    assert slow.json() == {"detail": "Request deadline exceeded"}
+    assert fast.status_code == 200
+    assert 0 < fast.json()["remaining"] <= 5
+
+
+def test_released_request_outlives_its_deadline():
+    """Test a handler that released its deadline (committed) gets its response out after it passes"""
+    client = TestClient(_slow_app())
+
+    response = client.get("/committed", params={"seconds": 0.3}, headers={"X-Request-Timeout": "0.05"})
+
+    assert response.status_code == 200
+    assert response.json() == {"remaining": None}
+
+
+def test_delete_committed_before_deadline_is_reported_and_published(client, db_session, mock_publish_event):
+    """Test a deadline passing after the commit doesn't turn a done delete into a 504 or drop its event"""
+    user = User(name="Late", email="late@example.com", age=30, hashed_password="hash", role="user")
+    db_session.add(user)
+    db_session.commit()
+    token = jwt.encode({"sub": "admin@example.com", "role": "admin", "aud": "delete-service",
+                        "exp": datetime.now(timezone.utc) + timedelta(minutes=5)}, SECRET_KEY, algorithm=ALGORITHM)
+
+    async def slow_publish(*args):
+        await asyncio.sleep(0.3)
+
+    mock_publish_event.side_effect = slow_publish
+    response = client.delete(f"/api/admin/delete/{user.user_id}",
+                             headers={"Authorization": f"Bearer {token}", "X-Request-Timeout": "0.1"})
+
+    assert response.status_code == 200
+    mock_publish_event.assert_awaited_once_with("user.deleted", {"user_id": user.user_id, "email": "late@example.com"})
+
+
+def test_sql_refused_after_deadline():
+    """Test no statement is sent once the budget is spent"""
+    engine = create_engine("sqlite:///:memory:")
+    with engine.connect() as conn:
+        with deadline(-1):
+            with pytest.raises(DeadlineExceeded):
+                conn.execute(text("SELECT 1"))
+        assert conn.execute(text("SELECT 1")).scalar() == 1
+
+
+def test_running_sqlite_statement_interrupted_at_deadline():
+    """Test a long statement is aborted by the progress handler when the deadline passes"""
+    engine = create_engine("sqlite:///:memory:")
+    endless = text(
+        "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n) SELECT count(*) FROM n"
+    )
+    with engine.connect() as conn:
+        with deadline(0.05):
+            with pytest.raises(DeadlineExceeded):
+                conn.execute(endless)
+
+
+def test_login_times_out_without_tripping_breaker(client):
+    """Test a slow auth service is cut off at the client's budget and not counted as a failure"""
+    async def slow_post(*args, **kwargs):
+        await asyncio.sleep(2)
+
+    main.auth_breaker.close()
+    with patch("httpx.AsyncClient.post", side_effect=slow_post):
+        response = client.post(
+            "/api/users/login",
+            data={"username": "admin@example.com", "password": "pw"},
+            headers={"X-Request-Timeout": "0.05"}
+        )
+
+    assert response.status_code == 504
+    assert main.auth_breaker.fail_counter == 0
+
+
+def test_auth_call_receives_remaining_budget():
+    """Test the auth service is told how much time is left"""
+    seen = {}
+
+    async def fake_post(self, url, data=None, headers=None, **kwargs):
+        seen.update(headers)
+        return type("Resp", (), {"status_code": 202})()
+
+    async def test_async():
+        with deadline(3):
+            with patch("httpx.AsyncClient.post", fake_post):
+                await main.call_auth_service("admin@example.com", "pw")
+
+    asyncio.run(test_async())
+    assert 0 < float(seen["X-Request-Timeout"]) <= 3
+
+
+def test_publish_past_deadline_logs_event_for_replay():
+    """Test a publish cut off by the deadline keeps the event instead of failing the request"""
+    async def slow_connection():
+        await asyncio.sleep(5)
+
+    async def test_async():
+        with deadline(0.05):
+            await publish_event("user.deleted", {"user_id": 1, "email": "a@test.com"})
+
+    main.rabbitmq_breaker.close()
+    with patch("docu_serve.main.get_rabbitmq_connection", side_effect=slow_connection), \
+            patch("docu_serve.main._log_failed_event") as log_failed:
+        asyncio.run(test_async())
+
+    log_failed.assert_called_once_with("user.deleted", {"user_id": 1, "email": "a@test.com"})
+    assert main.rabbitmq_breaker.fail_counter == 0
@@ -0,0 +1,79 @@
+# tests/test_events.py
+"""Tests for the shared event codec"""
+
+from docu_serve.events import (
+    EventDecodeError, JSON_CONTENT_TYPE, MSGPACK_CONTENT_TYPE,
+    UserCreatedEvent, UserDeletedEvent, decode_event, encode_event
+)
+import pytest
+
+CREATED = {
+    "user_id": 7,
+    "name": "Event User",
+    "email": "event@test.com",
+    "age": 30,
+    "hashed_password": "hash",
+    "role": "user"
+}
+
+
+def test_json_round_trip():
+    """Test encoding then decoding a user.created event gives the typed model"""
+    body, content_type = encode_event("user.created", CREATED)
+    assert content_type == JSON_CONTENT_TYPE
+
+    event = decode_event("user.created", body, content_type)
+    assert isinstance(event, UserCreatedEvent)
+    assert event.user_id == 7
+    assert event.email == "event@test.com"
+
+
+def test_msgpack_round_trip():
+    """Test msgpack content type is negotiated through content_type"""
+    pytest.importorskip("msgpack")
+    body, content_type = encode_event("user.deleted", {"user_id": 1, "email": "a@test.com"},
+                                      MSGPACK_CONTENT_TYPE)
+    assert content_type == MSGPACK_CONTENT_TYPE
+
+    event = decode_event("user.deleted", body, content_type)
+    assert event == UserDeletedEvent(user_id=1, email="a@test.com")
+
+
+def test_missing_content_type_defaults_to_json():
+    """Test messages from older publishers without content_type still decode"""
+    event = decode_event("user.deleted", b'{"user_id": 3, "email": "x@test.com"}', None)
+    assert event.user_id == 3
+
+
+def test_content_type_parameters_are_ignored():
+    """Test a charset parameter or different case doesn't make a JSON event undecodable"""
+    body = b'{"user_id": 3, "email": "x@test.com"}'
+    assert decode_event("user.deleted", body, "application/json; charset=utf-8").user_id == 3
+    assert decode_event("user.deleted", body, "Application/JSON").user_id == 3
+
+
+def test_unknown_fields_are_ignored():
+    """Test extra keys from newer producers don't break validation"""
+    event = decode_event("user.deleted", b'{"user_id": 3, "email": "x@test.com", "extra": 1}')
+    assert not hasattr(event, "extra")
+
+
+def test_invalid_payload_rejected_on_encode():
+    """Test publishing a payload that doesn't match the model fails loudly"""
+    with pytest.raises(EventDecodeError):
+        encode_event("user.deleted", {"user_id": "not-a-number"})
+
+
+@pytest.mark.parametrize("body", [b"{not json", b'{"user_id": 1}', b"[]"])
+def test_invalid_body_rejected_on_decode(body):
+    """Test malformed or incomplete bodies raise EventDecodeError"""
+    with pytest.raises(EventDecodeError):
+        decode_event("user.created", body)
+
+
+def test_unknown_event_type_and_content_type():
+    """Test unsupported routing keys and content types are rejected"""
+    with pytest.raises(EventDecodeError):
+        decode_event("user.exploded", b"{}")
+    with pytest.raises(EventDecodeError):
+        decode_event("user.deleted", b"<xml/>", "application/xml")
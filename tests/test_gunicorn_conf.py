@@ -0,0 +1,77 @@
+# tests/test_gunicorn_conf.py
+"""Tests for the gunicorn production launcher config"""
+
+from unittest.mock import MagicMock, patch
+import importlib
+import pytest
+
+
+@pytest.fixture
+def gunicorn_conf(tmp_path, monkeypatch):
+    """Import the config with its metrics dir pointed at a temp path so env doesn't leak"""
+    monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(tmp_path / "metrics"))
+    import gunicorn_conf
+    return importlib.reload(gunicorn_conf)
+
+
+def test_settings_from_environment(gunicorn_conf, monkeypatch):
+    """Test worker count, keep-alive, recycling and preload come from env"""
+    monkeypatch.setenv("GUNICORN_WORKERS", "3")
+    monkeypatch.setenv("GUNICORN_KEEPALIVE", "15")
+    monkeypatch.setenv("GUNICORN_MAX_REQUESTS", "1000")
+    monkeypatch.setenv("GUNICORN_MAX_REQUESTS_JITTER", "100")
+    monkeypatch.setenv("GUNICORN_PRELOAD", "true")
+    conf = importlib.reload(gunicorn_conf)
+
+    assert conf.workers == 3
+    assert conf.keepalive == 15
+    assert conf.max_requests == 1000
+    assert conf.max_requests_jitter == 100
+    assert conf.preload_app is True
+    assert conf.worker_class == "docu_serve.gunicorn_worker.TunedUvicornWorker"
+
+
+def test_post_fork_discards_inherited_connections(gunicorn_conf):
+    """Test each worker drops the pool inherited from a preloaded master"""
+    with patch("docu_serve.database.engine") as engine:
+        gunicorn_conf.post_fork(MagicMock(), MagicMock())
+    engine.dispose.assert_called_once_with(close=False)
+
+
+def test_post_fork_discards_shard_and_replica_pools(gunicorn_conf):
+    """Test shard and replica engines opened in the master are dropped too"""
+    primary, shard, replica = MagicMock(), MagicMock(), MagicMock()
+    router = MagicMock(engines={"primary": primary, "s1": shard})
+    replicas = MagicMock(replicas=[MagicMock(engine=replica)])
+    with patch("docu_serve.database.engine", primary), patch("docu_serve.database.shard_router", router), \
+            patch("docu_serve.replicas.router", replicas):
+        gunicorn_conf.post_fork(MagicMock(), MagicMock())
+    for engine in (primary, shard, replica):
+        engine.dispose.assert_called_once_with(close=False)
+
+
+def test_on_starting_resets_metrics_dir(gunicorn_conf, tmp_path, monkeypatch):
+    """Test stale multiprocess metric files are removed on master start"""
+    metrics_dir = tmp_path / "metrics"
+    metrics_dir.mkdir()
+    (metrics_dir / "counter_123.db").write_bytes(b"stale")
+    monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(metrics_dir))
+    monkeypatch.setenv("DB_CREATE_TABLES", "true")
+
+    with patch("docu_serve.database.create_tables"):
+        gunicorn_conf.on_starting(MagicMock())
+
+    assert metrics_dir.exists()
+    assert list(metrics_dir.iterdir()) == []
+
+
+def test_schema_is_created_once_in_the_master(gunicorn_conf, monkeypatch):
+    """Test on_starting creates the tables and tells the forked workers' lifespan to skip it"""
+    from docu_serve import database
+    monkeypatch.setenv("DB_CREATE_TABLES", "true")
+
+    with patch("docu_serve.database.create_tables") as create_tables:
+        gunicorn_conf.on_starting(MagicMock())
+
+    create_tables.assert_called_once_with()
+    assert database.tables_created_by_launcher()
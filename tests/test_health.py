@@ -103,4 +103,66 @@ def test_failed_event_logging(client, db_session):
             assert "user. deleted" in content
             assert user.email in content
         # Clean up
-        os.remove("failed_events.log")
\ No newline at end of file
+        os.remove("failed_events.log")
+
+def test_detailed_health_serves_cached_snapshot(client):
+    """Test repeated calls reuse the snapshot instead of probing again"""
+    from unittest.mock import AsyncMock
+    from docu_serve.main import health_monitor
+
+    client.get("/health/detailed", params={"fresh": 1})
+    with patch.object(health_monitor, "_probe_all", new_callable=AsyncMock) as mock_probe:
+        response = client.get("/health/detailed")
+
+    mock_probe.assert_not_called()
+    data = response.json()
+    assert data["snapshot_age_seconds"] is not None
+    assert data["checked_at"] is not None
+    assert set(data["latency_ms"]) == {"database", "broker", "auth_service"}
+
+
+def test_detailed_health_fresh_forces_probe(client):
+    """Test ?fresh=1 runs the probes before answering"""
+    from docu_serve.main import health_monitor
+
+    client.get("/health/detailed", params={"fresh": 1})
+    first = health_monitor.checked_at
+    response = client.get("/health/detailed", params={"fresh": 1})
+
+    assert response.status_code == 200
+    assert health_monitor.checked_at > first
+
+
+def test_broker_outage_degrades_but_stays_healthy(client):
+    """Test an unreachable broker is reported without failing the health check"""
+    response = client.get("/health/detailed", params={"fresh": 1})
+
+    data = response.json()
+    assert data["status"] == "healthy"
+    assert data["checks"]["broker"].startswith("unhealthy")
+    assert "broker" in data["degraded"]
+
+
+def test_health_monitor_single_flights_probes():
+    """Test concurrent forced probes share one run and slow probes time out"""
+    import asyncio
+    from docu_serve.health import HealthMonitor
+
+    calls = 0
+
+    async def slow_probe():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+
+    async def hanging_probe():
+        await asyncio.sleep(10)
+
+    async def test_async():
+        monitor = HealthMonitor({"slow": slow_probe, "hang": hanging_probe}, interval=60, timeout=0.1)
+        results = await asyncio.gather(*(monitor.snapshot(fresh=True) for _ in range(5)))
+        assert calls == 1
+        assert results[0]["slow"]["status"] == "healthy"
+        assert results[0]["hang"]["status"].startswith("unhealthy: timed out")
+
+    asyncio.run(test_async())
@@ -0,0 +1,207 @@
+# tests/test_idempotency.py
+"""Tests for Idempotency-Key handling on admin mutations"""
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+from jose import jwt
+from datetime import datetime, timedelta, timezone
+from docu_serve import main
+from docu_serve.idempotency import (
+    DatabaseStore, IdempotencyCache, MemoryStore, StoredResponse, TieredStore, create_cache
+)
+from docu_serve.main import SECRET_KEY, ALGORITHM
+from docu_serve.models import User
+from sqlalchemy.orm import sessionmaker
+from unittest.mock import patch
+import asyncio
+import uuid
+import pytest
+
+
+def _admin_headers(key=None, sub="admin@example.com"):
+    token = jwt.encode(
+        {
+            "sub": sub,
+            "role": "admin",
+            "aud": "delete-service",
+            "exp": datetime.now(timezone.utc) + timedelta(minutes=30)
+        },
+        SECRET_KEY,
+        algorithm=ALGORITHM
+    )
+    headers = {"Authorization": f"Bearer {token}"}
+    if key is not None:
+        headers["Idempotency-Key"] = key
+    return headers
+
+
+def _make_user(db_session, email):
+    user = User(name="Idem", email=email, age=30, hashed_password="hash", role="user")
+    db_session.add(user)
+    db_session.commit()
+    db_session.refresh(user)
+    return user
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch):
+    monkeypatch.setattr(main, "idempotency_cache", create_cache("memory"))
+
+
+def test_retried_delete_replays_first_response(client, db_session, mock_publish_event):
+    """Test a retry gets the original 200 instead of a 404, with one publish"""
+    user = _make_user(db_session, "idem-delete@test.com")
+    headers = _admin_headers(str(uuid.uuid4()))
+
+    first = client.delete(f"/api/admin/delete/{user.user_id}", headers=headers)
+    retry = client.delete(f"/api/admin/delete/{user.user_id}", headers=headers)
+
+    assert first.status_code == 200
+    assert retry.status_code == 200
+    assert retry.json() == first.json()
+    assert retry.headers["idempotent-replayed"] == "true"
+    assert "idempotent-replayed" not in first.headers
+    assert mock_publish_event.await_count == 1
+
+
+def test_retried_delete_replays_with_fast_responses_off(client, db_session, mock_publish_event):
+    """Test a bare model from the handler (FAST_RESPONSES=false) is rendered and stored, not a 500"""
+    user = _make_user(db_session, "idem-slow@example.com")
+    headers = _admin_headers(str(uuid.uuid4()))
+
+    with patch("docu_serve.responses.FAST_RESPONSES", False):
+        first = client.delete(f"/api/admin/delete/{user.user_id}", headers=headers)
+        retry = client.delete(f"/api/admin/delete/{user.user_id}", headers=headers)
+
+    assert first.status_code == 200
+    assert retry.status_code == 200
+    assert retry.json() == first.json()
+    assert retry.headers["idempotent-replayed"] == "true"
+    assert mock_publish_event.await_count == 1
+
+
+def test_retried_patch_does_not_commit_or_publish_again(client, db_session, mock_publish_event):
+    """Test a replayed PATCH skips the handler entirely"""
+    user = _make_user(db_session, "idem-patch@test.com")
+    headers = _admin_headers(str(uuid.uuid4()))
+
+    first = client.patch(f"/api/admin/users/{user.user_id}", json={"age": 31}, headers=headers)
+    retry = client.patch(f"/api/admin/users/{user.user_id}", json={"age": 31}, headers=headers)
+
+    assert first.status_code == retry.status_code == 200
+    assert retry.json() == first.json()
+    assert mock_publish_event.await_count == 1
+
+
+def test_key_reused_for_different_request_is_rejected(client, db_session):
+    """Test the same key with a different body is a 422, not a replay"""
+    user = _make_user(db_session, "idem-reuse@test.com")
+    headers = _admin_headers(str(uuid.uuid4()))
+
+    client.patch(f"/api/admin/users/{user.user_id}", json={"age": 40}, headers=headers)
+    response = client.patch(f"/api/admin/users/{user.user_id}", json={"age": 41}, headers=headers)
+
+    assert response.status_code == 422
+
+
+def test_keys_are_scoped_per_admin(client, db_session, mock_publish_event):
+    """Test another admin's identical key does not see the first admin's result"""
+    user = _make_user(db_session, "idem-scope@test.com")
+    key = str(uuid.uuid4())
+
+    client.patch(f"/api/admin/users/{user.user_id}", json={"age": 50}, headers=_admin_headers(key, "a@example.com"))
+    response = client.patch(f"/api/admin/users/{user.user_id}", json={"age": 50},
+                            headers=_admin_headers(key, "b@example.com"))
+
+    assert "idempotent-replayed" not in response.headers
+    assert mock_publish_event.await_count == 2
+
+
+def test_requests_without_key_are_not_cached(client, db_session):
+    """Test the plain retry behaviour is unchanged without the header"""
+    user = _make_user(db_session, "idem-none@test.com")
+
+    assert client.delete(f"/api/admin/delete/{user.user_id}", headers=_admin_headers()).status_code == 200
+    assert client.delete(f"/api/admin/delete/{user.user_id}", headers=_admin_headers()).status_code == 404
+
+
+def test_concurrent_duplicates_are_single_flighted():
+    """Test duplicates arriving mid-flight share the first execution"""
+    cache = IdempotencyCache(MemoryStore())
+    calls = []
+
+    async def handler():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return JSONResponse({"ok": True})
+
+    async def test_async():
+        return await asyncio.gather(*(cache.execute("k", "fp", handler) for _ in range(5)))
+
+    responses = asyncio.run(test_async())
+    assert len(calls) == 1
+    assert all(r.status_code == 200 and r.body == b'{"ok":true}' for r in responses)
+
+
+def test_transient_failures_are_not_cached():
+    """Test a 5xx outcome lets the retry run again while a 404 is replayed"""
+    cache = IdempotencyCache(MemoryStore())
+    outcomes = [HTTPException(status_code=503, detail="busy"), HTTPException(status_code=404, detail="gone")]
+    calls = []
+
+    async def handler():
+        calls.append(1)
+        raise outcomes[len(calls) - 1]
+
+    async def test_async():
+        return [(await cache.execute("k", "fp", handler)).status_code for _ in range(3)]
+
+    assert asyncio.run(test_async()) == [503, 404, 404]
+    assert len(calls) == 2
+
+
+def test_memory_store_expires_and_evicts():
+    """Test entries disappear after the TTL and the oldest go past max_keys"""
+    async def test_async():
+        store = MemoryStore(ttl=-1, max_keys=2)
+        await store.put("a", StoredResponse(200, [], b"", "fp"))
+        assert await store.get("a") is None
+
+        store.ttl = 60
+        for key in ("a", "b", "c"):
+            await store.put(key, StoredResponse(200, [], b"", "fp"))
+        assert await store.get("a") is None
+        assert await store.get("c") is not None
+
+    asyncio.run(test_async())
+
+
+def test_database_store_shares_results_and_pending_claims(db_session):
+    """Test a second worker sees the stored result and gets 409 while the first is pending"""
+    session_factory = sessionmaker(bind=db_session.get_bind())
+
+    async def test_async():
+        worker_a = IdempotencyCache(TieredStore(MemoryStore(), DatabaseStore(session_factory)))
+        worker_b = IdempotencyCache(TieredStore(MemoryStore(), DatabaseStore(session_factory)))
+        started = asyncio.Event()
+        release = asyncio.Event()
+
+        async def slow_handler():
+            started.set()
+            await release.wait()
+            return JSONResponse({"done": 1}, status_code=201)
+
+        first = asyncio.create_task(worker_a.execute("db-key", "fp", slow_handler))
+        await started.wait()
+        in_progress = await worker_b.execute("db-key", "fp", slow_handler)
+        release.set()
+        original = await first
+        replayed = await worker_b.execute("db-key", "fp", slow_handler)
+        return in_progress, original, replayed
+
+    in_progress, original, replayed = asyncio.run(test_async())
+    assert in_progress.status_code == 409
+    assert original.status_code == 201
+    assert replayed.status_code == 201
+    assert replayed.body == original.body
+    assert replayed.headers["idempotent-replayed"] == "true"
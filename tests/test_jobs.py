@@ -0,0 +1,207 @@
+# tests/test_jobs.py
+"""Tests for bulk deletion jobs"""
+
+from unittest.mock import AsyncMock
+from jose import jwt
+from datetime import datetime, timedelta, timezone
+from sqlalchemy.orm import sessionmaker
+from docu_serve import jobs
+from docu_serve.main import SECRET_KEY, ALGORITHM
+from docu_serve.models import DeletionJob, User
+import asyncio
+import time
+import pytest
+
+
+def _admin_headers():
+    token = jwt.encode(
+        {
+            "sub": "admin@example.com",
+            "role": "admin",
+            "aud": "delete-service",
+            "exp": datetime.now(timezone.utc) + timedelta(minutes=30)
+        },
+        SECRET_KEY,
+        algorithm=ALGORITHM
+    )
+    return {"Authorization": f"Bearer {token}"}
+
+
+def _make_users(db_session, prefix, count, role="user", domain="jobs.test"):
+    users = [User(name=f"{prefix}{i}", email=f"{prefix}{i}@{domain}", age=30, hashed_password="hash", role=role)
+             for i in range(count)]
+    db_session.add_all(users)
+    db_session.commit()
+    return [user.user_id for user in users]
+
+
+@pytest.fixture(autouse=True)
+def no_leftover_jobs(db_session):
+    # The runner claims any queued job, including ones other tests left behind
+    db_session.query(DeletionJob).delete()
+    db_session.commit()
+
+
+@pytest.fixture
+def runner(db_session):
+    publish = AsyncMock()
+    return jobs.JobRunner(sessionmaker(bind=db_session.get_bind()), publish, chunk_size=2)
+
+
+def _drain(runner):
+    async def test_async():
+        while await runner.run_once():
+            pass
+    asyncio.run(test_async())
+
+
+def _job(db_session, job_id):
+    db_session.expire_all()
+    return db_session.get(DeletionJob, job_id)
+
+
+def test_create_job_returns_202_with_location(client, db_session):
+    """Test POST queues the job and points at it"""
+    user_ids = _make_users(db_session, "create", 3)
+
+    response = client.post("/api/admin/jobs/deletions", json={"user_ids": user_ids + user_ids},
+                           headers=_admin_headers())
+
+    assert response.status_code == 202
+    data = response.json()
+    assert data["status"] == "queued"
+    assert data["total"] == 3
+    assert response.headers["location"] == f"/api/admin/jobs/{data['job_id']}"
+
+
+def test_create_job_needs_exactly_one_target(client):
+    """Test ids and filter together, or neither, or an empty filter, are rejected"""
+    headers = _admin_headers()
+
+    assert client.post("/api/admin/jobs/deletions", json={}, headers=headers).status_code == 422
+    assert client.post("/api/admin/jobs/deletions", json={"user_ids": [1], "filter": {"role": "user"}},
+                       headers=headers).status_code == 422
+    assert client.post("/api/admin/jobs/deletions", json={"filter": {}}, headers=headers).status_code == 422
+
+
+def test_runner_deletes_ids_in_chunks_and_publishes(client, db_session, runner):
+    """Test the runner deletes every listed user, counts missing ones and publishes user.deleted"""
+    user_ids = _make_users(db_session, "chunk", 3)
+    job_id = client.post("/api/admin/jobs/deletions", json={"user_ids": user_ids + [999999]},
+                         headers=_admin_headers()).json()["job_id"]
+
+    _drain(runner)
+
+    data = client.get(f"/api/admin/jobs/{job_id}", headers=_admin_headers()).json()
+    assert data["status"] == "completed"
+    assert (data["processed"], data["deleted"], data["not_found"]) == (4, 3, 1)
+    assert data["progress"] == 1.0
+    assert db_session.query(User).filter(User.user_id.in_(user_ids)).count() == 0
+    published = [payload["user_id"] for call in runner.publish_many.await_args_list for payload in call.args[1]]
+    assert sorted(published) == user_ids
+    assert all(call.args[0] == "user.deleted" for call in runner.publish_many.await_args_list)
+
+
+def test_runner_deletes_by_filter(client, db_session, runner):
+    """Test a filter job only deletes matching users"""
+    doomed = _make_users(db_session, "doomed", 3, domain="purge.test")
+    kept = _make_users(db_session, "kept", 2, domain="keep.test")
+    job_id = client.post("/api/admin/jobs/deletions", json={"filter": {"email_domain": "purge.test"}},
+                         headers=_admin_headers()).json()["job_id"]
+
+    _drain(runner)
+
+    assert _job(db_session, job_id).deleted == 3
+    assert db_session.query(User).filter(User.user_id.in_(doomed)).count() == 0
+    assert db_session.query(User).filter(User.user_id.in_(kept)).count() == 2
+
+
+def test_cancel_stops_job_and_rolls_back_in_flight_chunk(client, db_session, runner):
+    """Test a job cancelled mid-run deletes nothing more"""
+    user_ids = _make_users(db_session, "cancel", 4)
+    job_id = client.post("/api/admin/jobs/deletions", json={"user_ids": user_ids},
+                         headers=_admin_headers()).json()["job_id"]
+
+    async def test_async():
+        await runner.run_once()  # claims and deletes the first chunk of two
+        client.post(f"/api/admin/jobs/{job_id}/cancel", headers=_admin_headers())
+        await runner.run_once()  # its chunk update matches nothing, so it rolls back
+        return await runner.run_once()
+
+    assert asyncio.run(test_async()) is False
+    job = _job(db_session, job_id)
+    assert job.status == "cancelled"
+    assert job.deleted == 2
+    assert db_session.query(User).filter(User.user_id.in_(user_ids)).count() == 2
+
+
+def test_cancel_finished_job_conflicts(client, db_session, runner):
+    """Test cancelling a completed job is a 409 and an unknown job a 404"""
+    job_id = client.post("/api/admin/jobs/deletions", json={"user_ids": _make_users(db_session, "done", 1)},
+                         headers=_admin_headers()).json()["job_id"]
+    _drain(runner)
+
+    assert client.post(f"/api/admin/jobs/{job_id}/cancel", headers=_admin_headers()).status_code == 409
+    assert client.post("/api/admin/jobs/nope/cancel", headers=_admin_headers()).status_code == 404
+
+
+def test_resume_continues_from_cursor(client, db_session, runner):
+    """Test a resumed job carries on after the last chunk it committed"""
+    user_ids = _make_users(db_session, "resume", 4)
+    job_id = client.post("/api/admin/jobs/deletions", json={"user_ids": user_ids},
+                         headers=_admin_headers()).json()["job_id"]
+    asyncio.run(runner.run_once())
+    client.post(f"/api/admin/jobs/{job_id}/cancel", headers=_admin_headers())
+
+    response = client.post(f"/api/admin/jobs/{job_id}/resume", headers=_admin_headers())
+    runner._job = None  # the runner noticed the cancel on its next chunk
+    _drain(runner)
+
+    assert response.json()["status"] == "queued"
+    job = _job(db_session, job_id)
+    assert job.status == "completed"
+    assert (job.processed, job.deleted) == (4, 4)
+    assert runner.publish_many.await_count == 2
+
+
+def test_expired_lease_is_taken_over(db_session, runner):
+    """Test a job left running by a dead process is resumed by another runner"""
+    user_ids = _make_users(db_session, "orphan", 3)
+    job = DeletionJob(job_id="orphaned", status="running", requested_by="admin@example.com",
+                      user_ids=str(user_ids), total=3, processed=1, deleted=1, cursor=user_ids[0],
+                      created_at=time.time(), locked_by="dead-host:1:abc", lease_expires_at=time.time() - 1)
+    db_session.add(job)
+    db_session.commit()
+
+    _drain(runner)
+
+    job = _job(db_session, "orphaned")
+    assert job.status == "completed"
+    assert job.processed == 3
+    assert db_session.get(User, user_ids[0]) is not None  # before the cursor, never touched again
+    assert db_session.query(User).filter(User.user_id.in_(user_ids[1:])).count() == 0
+
+
+def test_live_lease_is_not_taken_over(db_session, runner):
+    """Test a job another runner still holds is left alone"""
+    job = DeletionJob(job_id="held", status="running", requested_by="admin@example.com", user_ids="[1]",
+                      total=1, created_at=time.time(), locked_by="other", lease_expires_at=time.time() + 60)
+    db_session.add(job)
+    db_session.commit()
+
+    assert asyncio.run(runner.run_once()) is False
+    db_session.delete(job)
+    db_session.commit()
+
+
+def test_publish_events_logs_whole_batch_on_failure():
+    """Test a failed batch publish keeps every event for replay instead of raising"""
+    from unittest.mock import patch
+    from docu_serve import main
+
+    payloads = [{"user_id": 1, "email": "a@test.com"}, {"user_id": 2, "email": "b@test.com"}]
+    with patch("docu_serve.main.rabbitmq_breaker.call_async", new=AsyncMock(side_effect=ConnectionError("down"))), \
+            patch("docu_serve.main._log_failed_event") as log_failed:
+        asyncio.run(main.publish_events("user.deleted", payloads))
+
+    assert [call.args for call in log_failed.call_args_list] == [("user.deleted", p) for p in payloads]
@@ -0,0 +1,156 @@
+# tests/test_jsonlog.py
+"""Tests for the queued JSON logging pipeline"""
+
+from docu_serve import jsonlog
+from docu_serve.jsonlog import LogWriter, QueueingHandler, RotatingFileSink, format_record
+import gzip
+import json
+import logging
+import threading
+import pytest
+
+
+class ListSink:
+    def __init__(self):
+        self.lines = []
+
+    def write(self, lines):
+        self.lines.extend(json.loads(line) for line in lines)
+
+
+class BlockingSink(ListSink):
+    """Holds the writer thread inside write() until released"""
+
+    def __init__(self):
+        super().__init__()
+        self.entered = threading.Event()
+        self.release = threading.Event()
+
+    def write(self, lines):
+        self.entered.set()
+        self.release.wait(5)
+        super().write(lines)
+
+
+def _logger(name, writer):
+    logger = logging.getLogger(name)
+    logger.handlers = [QueueingHandler(writer)]
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+    return logger
+
+
+def _record(level=logging.INFO, msg="hello"):
+    record = logging.LogRecord("test", level, __file__, 1, msg, None, None)
+    record.message = record.getMessage()
+    return record
+
+
+def test_format_record_includes_extra_fields():
+    """Test extra={...} keys and static fields become top-level JSON keys"""
+    record = _record()
+    record.user_id = 7
+
+    entry = json.loads(format_record(record, {"service": "api"}))
+
+    assert entry["message"] == "hello"
+    assert entry["level"] == "INFO"
+    assert entry["service"] == "api"
+    assert entry["user_id"] == 7
+    assert entry["timestamp"].endswith("+00:00")
+
+
+def test_handler_resolves_message_and_exception_on_caller_thread():
+    """Test args and tracebacks are captured at log time, not when the writer gets to them"""
+    sink = ListSink()
+    writer = LogWriter([sink])
+    logger = _logger("test.jsonlog.handler", writer)
+    values = ["before"]
+
+    logger.info("value=%s", values)
+    values[0] = "after"
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        logger.exception("failed", extra={"event_type": "user.deleted"})
+    writer.close()
+
+    assert sink.lines[0]["message"] == "value=['before']"
+    assert sink.lines[1]["event_type"] == "user.deleted"
+    assert "ValueError: boom" in sink.lines[1]["exception"]
+
+
+def test_writer_sheds_low_levels_first_and_reports_drops():
+    """Test a full queue drops INFO above the high-water mark, then everything, and logs the count"""
+    sink = BlockingSink()
+    writer = LogWriter([sink], queue_size=5, interval=0.01)
+    writer.submit(_record(msg="first"))
+    assert sink.entered.wait(5)
+
+    for i in range(5):
+        writer.submit(_record(msg=f"info {i}"))
+    writer.submit(_record(logging.ERROR, msg="error"))
+    writer.submit(_record(logging.ERROR, msg="error dropped"))
+
+    assert writer.dropped == {"INFO": 1, "ERROR": 1}
+    sink.release.set()
+    writer.close()
+
+    messages = [line["message"] for line in sink.lines]
+    assert messages[:6] == ["first", "info 0", "info 1", "info 2", "info 3", "error"]
+    assert sink.lines[-1]["dropped"] == {"INFO": 1, "ERROR": 1}
+
+
+def test_sync_overflow_never_drops():
+    """Test the failed-events policy writes inline instead of dropping when the queue is full"""
+    sink = BlockingSink()
+    writer = LogWriter([sink], queue_size=1, interval=0.01, overflow="sync")
+    writer.submit(_record(msg="first"))
+    assert sink.entered.wait(5)
+    writer.submit(_record(msg="queued"))
+
+    done = threading.Event()
+    threading.Thread(target=lambda: (writer.submit(_record(msg="inline")), done.set())).start()
+    sink.release.set()
+    assert done.wait(5)
+    writer.close()
+
+    assert writer.dropped == {}
+    assert sorted(line["message"] for line in sink.lines) == ["first", "inline", "queued"]
+
+
+def test_rotation_by_size_compresses_and_prunes(tmp_path):
+    """Test the file rotates once over max_bytes into .gz backups, keeping backup_count"""
+    path = tmp_path / "app.log"
+    sink = RotatingFileSink(str(path), max_bytes=50, interval=0, backup_count=2)
+
+    for i in range(5):
+        sink.write([json.dumps({"n": i, "pad": "x" * 40}) + "\n"])
+
+    backups = sink.backups()
+    assert len(backups) == 2
+    assert all(name.endswith(".gz") for name in backups)
+    with gzip.open(backups[-1], "rt") as f:
+        assert json.loads(f.read())["n"] == 4
+
+
+def test_rotation_by_age(tmp_path, monkeypatch):
+    """Test the file rotates once the interval has passed even if it is small"""
+    path = tmp_path / "app.log"
+    now = [1000.0]
+    monkeypatch.setattr(jsonlog.time, "time", lambda: now[0])
+    sink = RotatingFileSink(str(path), max_bytes=0, interval=60, backup_count=3)
+
+    sink.write(["a\n"])
+    assert sink.backups() == []
+    now[0] += 61
+    sink.write(["b\n"])
+
+    assert len(sink.backups()) == 1
+    assert not path.exists()
+
+
+def test_failed_events_log_is_never_rotated_or_pruned():
+    """Test the replay record keeps every event in one plain file"""
+    sink = jsonlog.failed_event_logger().handlers[0].writer.sinks[0]
+    assert (sink.max_bytes, sink.interval, sink.backup_count, sink.compress) == (0, 0, 0, False)
@@ -0,0 +1,82 @@
+# tests/test_metrics.py
+"""Tests for the Prometheus metrics middleware and /metrics endpoint"""
+
+from jose import jwt
+from datetime import datetime, timedelta, timezone
+from prometheus_client import REGISTRY
+from docu_serve.main import SECRET_KEY, ALGORITHM
+from docu_serve.models import User
+
+
+def _sample(name, labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def _admin_token():
+    return jwt.encode(
+        {
+            "sub": "admin@example.com",
+            "role": "admin",
+            "aud": "delete-service",
+            "exp": datetime.now(timezone.utc) + timedelta(minutes=30)
+        },
+        SECRET_KEY,
+        algorithm=ALGORITHM
+    )
+
+
+def test_metrics_endpoint_exposes_prometheus_text(client):
+    """Test /metrics returns the Prometheus exposition format"""
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "http_requests_total" in response.text
+    assert "http_requests_in_flight" in response.text
+
+
+def test_requests_counted_by_route_template(client):
+    """Test counts use the route template, not the raw path"""
+    labels = {"method": "DELETE", "route": "/api/admin/delete/{user_id}", "status": "404"}
+    before = _sample("http_requests_total", labels)
+
+    client.delete("/api/admin/delete/424242", headers={"Authorization": f"Bearer {_admin_token()}"})
+
+    assert _sample("http_requests_total", labels) == before + 1
+    assert _sample("http_request_duration_seconds_count", labels) >= 1
+    assert REGISTRY.get_sample_value(
+        "http_requests_total", {"method": "DELETE", "route": "/api/admin/delete/424242", "status": "404"}
+    ) is None
+
+
+def test_phase_timings_recorded(client, db_session):
+    """Test JWT, DB and publish time are observed for a patch request"""
+    user = User(name="Metrics", email="metrics@test.com", age=30, hashed_password="hash", role="user")
+    db_session.add(user)
+    db_session.commit()
+    db_session.refresh(user)
+
+    route = "/api/admin/users/{user_id}"
+    before = {phase: _sample("http_request_phase_seconds_count", {"route": route, "phase": phase})
+              for phase in ("jwt", "db")}
+
+    response = client.patch(
+        f"/api/admin/users/{user.user_id}",
+        json={"name": "Measured"},
+        headers={"Authorization": f"Bearer {_admin_token()}"}
+    )
+
+    assert response.status_code == 200
+    for phase in ("jwt", "db"):
+        assert _sample("http_request_phase_seconds_count", {"route": route, "phase": phase}) == before[phase] + 1
+
+
+def test_unmatched_routes_share_one_label(client):
+    """Test unknown paths don't create a label set per path"""
+    labels = {"method": "GET", "route": "unmatched", "status": "404"}
+    before = _sample("http_requests_total", labels)
+
+    client.get("/no/such/path/1")
+    client.get("/no/such/path/2")
+
+    assert _sample("http_requests_total", labels) == before + 2
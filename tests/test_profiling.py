@@ -0,0 +1,118 @@
+# tests/test_profiling.py
+"""Tests for the opt-in per-request profiling middleware"""
+
+from fastapi.testclient import TestClient
+from jose import jwt
+from datetime import datetime, timedelta, timezone
+from docu_serve import profiling
+from docu_serve.main import app, SECRET_KEY, ALGORITHM
+from docu_serve.profiling import ProfileWriter, ProfilingMiddleware, sign_profile_token, verify_profile_token
+import cProfile
+import os
+import pstats
+import pytest
+import threading
+import time
+
+PROFILE_SECRET = "profile-secret"
+
+
+@pytest.fixture
+def profiled_client(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_DIR", str(tmp_path))
+    return TestClient(ProfilingMiddleware(app, secret=PROFILE_SECRET, sample_rate=0.0, directory=str(tmp_path)))
+
+
+def _admin_headers():
+    token = jwt.encode(
+        {
+            "sub": "admin@example.com",
+            "role": "admin",
+            "aud": "delete-service",
+            "exp": datetime.now(timezone.utc) + timedelta(minutes=30)
+        },
+        SECRET_KEY,
+        algorithm=ALGORITHM
+    )
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_profiling_off_by_default():
+    """Test the middleware isn't installed without PROFILE_SECRET or a sample rate"""
+    assert not profiling.profiling_enabled()
+    assert not any(m.cls is ProfilingMiddleware for m in app.user_middleware)
+
+
+def test_token_verification():
+    """Test signed tokens verify and tampered or expired ones don't"""
+    token = sign_profile_token(PROFILE_SECRET)
+    assert verify_profile_token(PROFILE_SECRET, token)
+    assert not verify_profile_token("other-secret", token)
+    tampered = token[:-1] + ("1" if token[-1] == "0" else "0")
+    assert not verify_profile_token(PROFILE_SECRET, tampered)
+    assert not verify_profile_token(PROFILE_SECRET, sign_profile_token(PROFILE_SECRET, timestamp=1))
+    assert not verify_profile_token(PROFILE_SECRET, "garbage")
+
+
+def test_unsigned_request_not_profiled(profiled_client, tmp_path):
+    """Test requests without a valid header pass through untouched"""
+    response = profiled_client.get("/health", headers={"X-Profile": "1.bad"})
+
+    assert response.status_code == 200
+    assert "x-profile-id" not in response.headers
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_signed_request_profiled_and_downloadable(profiled_client, tmp_path):
+    """Test a signed request writes a profile that an admin can download"""
+    response = profiled_client.get("/health", headers={"X-Profile": sign_profile_token(PROFILE_SECRET)})
+
+    assert response.status_code == 200
+    profile_id = response.headers["x-profile-id"]
+    profiling.flush()
+    saved = tmp_path / f"{profile_id}.prof"
+    assert saved.exists()
+    assert pstats.Stats(str(saved)).total_calls > 0
+
+    download = profiled_client.get(f"/api/admin/profiles/{profile_id}", headers=_admin_headers())
+    assert download.status_code == 200
+    assert download.content == saved.read_bytes()
+
+
+def test_download_rejects_bad_ids(profiled_client):
+    """Test path traversal and unknown ids return 404"""
+    for profile_id in ("..%2F..%2Fetc%2Fpasswd", "1-get-health-000000000000"):
+        response = profiled_client.get(f"/api/admin/profiles/{profile_id}", headers=_admin_headers())
+        assert response.status_code == 404
+
+
+def test_prune_keeps_newest_within_limits(tmp_path):
+    """Test expired profiles go first, then the oldest beyond max_files"""
+    now = time.time()
+    for i, age in enumerate([100000, 50, 40, 30, 20]):
+        path = tmp_path / f"{i}.prof"
+        path.write_bytes(b"x")
+        os.utime(path, (now - age, now - age))
+
+    assert profiling.prune_profiles(str(tmp_path), max_files=3, max_age=3600) == 2
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["2.prof", "3.prof", "4.prof"]
+
+
+def test_writer_writes_and_prunes_on_one_thread(tmp_path, monkeypatch):
+    """Test the background writer both dumps and prunes, serially and off the caller's thread"""
+    calls = []
+    monkeypatch.setattr(profiling, "prune_profiles",
+                        lambda directory: calls.append(("prune", threading.current_thread().name)))
+    writer = ProfileWriter()
+    try:
+        for i in range(3):
+            profiler = cProfile.Profile()
+            profiler.enable()
+            profiler.disable()
+            writer.submit(profiler, str(tmp_path), f"1-get-health-{i:012x}")
+        writer.flush()
+    finally:
+        writer.close()
+
+    assert len(list(tmp_path.glob("*.prof"))) == 3
+    assert calls == [("prune", "profile-writer")] * 3
@@ -0,0 +1,107 @@
+# tests/test_reconcile.py
+"""Tests for digest-based reconciliation of users_admin with the auth side"""
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+from docu_serve.models import Base, User
+from docu_serve.reconcile import DatabaseDigestSource, DigestTree, HttpDigestSource, digest_app, reconcile
+import pytest
+
+PARAMS = {"width": 10, "fanout": 4, "max_user_id": 10000}
+
+
+def _factory(path):
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine, expire_on_commit=False)
+
+
+def _user(user_id, **changes):
+    fields = dict(user_id=user_id, name=f"u{user_id}", email=f"u{user_id}@example.com", age=30,
+                  hashed_password="hash", role="user")
+    fields.update(changes)
+    return User(**fields)
+
+
+@pytest.fixture
+def sides(tmp_path):
+    admin, auth = _factory(tmp_path / "admin.db"), _factory(tmp_path / "auth.db")
+    for factory in (admin, auth):
+        with factory() as db:
+            db.add_all([_user(user_id) for user_id in range(1, 500)])
+            db.commit()
+    return admin, auth
+
+
+def _users(factory):
+    with factory() as db:
+        return {user.user_id: (user.name, user.email) for user in db.execute(select(User)).scalars()}
+
+
+def test_tree_digest_ignores_row_order():
+    """Test leaf sums and node hashes are the same however rows arrive"""
+    rows = [{"user_id": i, "name": "n", "email": f"{i}@x", "age": 1, "role": "user", "hashed_password": "h"}
+            for i in range(100)]
+    forwards, backwards = DigestTree(rows, **PARAMS), DigestTree(reversed(rows), **PARAMS)
+    assert forwards.levels == backwards.levels
+    assert forwards.height == 5  # 10 * 4 ** 5 >= 10000
+
+
+def test_identical_sides_transfer_only_the_root(sides):
+    """Test no drift costs one digest and no rows"""
+    admin, auth = sides
+    report = reconcile(admin, DatabaseDigestSource(admin, **PARAMS), DatabaseDigestSource(auth, **PARAMS))
+    assert report["digests_fetched"] == 1
+    assert report["mismatched_leaves"] == 0
+    assert report["rows_fetched"] == 0
+
+
+def test_drift_is_repaired_by_fetching_only_changed_buckets(sides):
+    """Test missing, changed and extra users are found and only their buckets are fetched"""
+    admin, auth = sides
+    with admin() as db:
+        db.delete(db.get(User, 42))
+        db.get(User, 300).name = "stale"
+        db.add(_user(777))
+        db.commit()
+
+    local = DatabaseDigestSource(admin, **PARAMS)
+    remote = HttpDigestSource(TestClient(digest_app(DatabaseDigestSource(auth, **PARAMS))))
+    report = reconcile(admin, local, remote)
+
+    assert report["mismatched_leaves"] == 3
+    assert report["rows_fetched"] == 20  # buckets 40-49 and 300-309; 770-779 is empty on the auth side
+    assert (report["inserted"], report["updated"], report["extra"], report["deleted"]) == (1, 1, [777], 0)
+    # Far fewer digests than the ~50 leaves plus their parents a full comparison would need
+    assert report["digests_fetched"] < 30
+    users = _users(admin)
+    assert users[42] == ("u42", "u42@example.com")
+    assert users[300][0] == "u300"
+    with admin() as db:
+        assert db.get(User, 300).version == 2
+    assert 777 in users
+
+
+def test_dry_run_and_delete_extra(sides):
+    """Test a dry run changes nothing and delete_extra removes users the auth side lacks"""
+    admin, auth = sides
+    with admin() as db:
+        db.add(_user(900))
+        db.commit()
+
+    report = reconcile(admin, DatabaseDigestSource(admin, **PARAMS), DatabaseDigestSource(auth, **PARAMS),
+                       apply=False, delete_extra=True)
+    assert report["deleted"] == 1
+    assert 900 in _users(admin)
+
+    reconcile(admin, DatabaseDigestSource(admin, **PARAMS), DatabaseDigestSource(auth, **PARAMS), delete_extra=True)
+    assert 900 not in _users(admin)
+
+
+def test_mismatched_parameters_are_refused(sides):
+    """Test both sides must build the same tree shape"""
+    admin, auth = sides
+    with pytest.raises(ValueError):
+        reconcile(admin, DatabaseDigestSource(admin, **PARAMS),
+                  DatabaseDigestSource(auth, width=20, fanout=4, max_user_id=10000))
@@ -0,0 +1,95 @@
+# tests/test_replicas.py
+"""Tests for read-replica routing, using two SQLite files as primary and replica"""
+
+from sqlalchemy import create_engine, select, update
+from docu_serve.models import Base, User
+from docu_serve.replicas import Replica, ReplicaRouter
+from docu_serve.health import probe_replicas
+import asyncio
+import pytest
+
+
+def _database(path, name):
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(User.__table__.insert().values(user_id=1, name=name, email="r@test.com", age=30,
+                                                    hashed_password="hash", role="user"))
+    return engine
+
+
+@pytest.fixture
+def primary(tmp_path):
+    return _database(tmp_path / "primary.db", "primary")
+
+
+@pytest.fixture
+def replicas(tmp_path):
+    return [Replica(_database(tmp_path / f"replica{i}.db", f"replica{i}"), f"replica{i}") for i in range(2)]
+
+
+def _read_name(router, primary, sticky_key=None):
+    with router.session(sticky_key, bind=primary) as db:
+        return db.get(User, 1).name
+
+
+def test_reads_round_robin_across_replicas(primary, replicas):
+    """Test each new session reads from the next replica"""
+    router = ReplicaRouter(replicas)
+
+    assert [_read_name(router, primary) for _ in range(3)] == ["replica0", "replica1", "replica0"]
+
+
+def test_no_replicas_reads_primary(primary):
+    """Test routing is a no-op without replicas"""
+    assert _read_name(ReplicaRouter([]), primary) == "primary"
+
+
+def test_writes_go_to_primary_and_session_stays_there(primary, replicas):
+    """Test DML runs on the primary and later reads in the session see it"""
+    router = ReplicaRouter(replicas[:1])
+
+    with router.session(bind=primary) as db:
+        assert db.get(User, 1).name == "replica0"
+        db.execute(update(User).where(User.user_id == 1).values(name="written"))
+        db.commit()
+        assert db.execute(select(User.name).where(User.user_id == 1)).scalar() == "written"
+
+    with replicas[0].engine.connect() as conn:
+        assert conn.execute(select(User.name)).scalar() == "replica0"
+
+
+def test_recent_writer_reads_from_primary(primary, replicas):
+    """Test read-your-writes stickiness applies to the writer only, and expires"""
+    router = ReplicaRouter(replicas, sticky_seconds=60)
+    router.mark_write("admin@example.com")
+
+    assert _read_name(router, primary, "admin@example.com") == "primary"
+    assert _read_name(router, primary, "other@example.com").startswith("replica")
+
+    router.sticky_seconds = 0
+    router.mark_write("admin@example.com")
+    assert _read_name(router, primary, "admin@example.com").startswith("replica")
+
+
+def test_lagging_replica_is_skipped(primary, replicas):
+    """Test the lag guard routes around a replica that is too far behind"""
+    lags = {replicas[0].engine: 30.0, replicas[1].engine: 0.5}
+    router = ReplicaRouter(replicas, max_lag=5, lag_probe=lambda engine: lags[engine])
+    router.refresh()
+
+    assert {_read_name(router, primary) for _ in range(4)} == {"replica1"}
+
+    lags[replicas[1].engine] = 30.0
+    with pytest.raises(RuntimeError):
+        asyncio.run(probe_replicas(router))
+    assert _read_name(router, primary) == "primary"
+
+
+def test_failed_replica_falls_back_to_primary(primary, tmp_path):
+    """Test a read that fails on a replica is retried on the primary and the replica is skipped"""
+    broken = Replica(create_engine(f"sqlite:///{tmp_path}/missing/dir/replica.db"), "broken")
+    router = ReplicaRouter([broken], retry_seconds=60)
+
+    assert _read_name(router, primary) == "primary"
+    assert router.choose() is None
@@ -0,0 +1,43 @@
+# tests/test_responses.py
+"""Tests for the trusted fast response path"""
+
+from unittest.mock import patch
+from docu_serve.responses import FastJSONResponse, fast_response
+from docu_serve.schemas import DeleteResponse, DeletedUserSummary, UserOut
+import json
+
+
+def test_fast_json_response_renders_constructed_model():
+    """Test model_construct output serializes without validation"""
+    model = DeleteResponse.model_construct(
+        message="done",
+        deleted=DeletedUserSummary.model_construct(user_id=1, email="a@test.com")
+    )
+    response = FastJSONResponse(model)
+
+    assert response.media_type == "application/json"
+    assert json.loads(response.body) == {"message": "done", "deleted": {"user_id": 1, "email": "a@test.com"}}
+
+
+def test_fast_json_response_renders_plain_data():
+    """Test dicts and lists render too"""
+    assert json.loads(FastJSONResponse({"a": [1, 2]}).body) == {"a": [1, 2]}
+
+
+def test_fast_response_can_be_disabled():
+    """Test FAST_RESPONSES=false hands the model back for FastAPI to validate"""
+    model = UserOut.model_construct(user_id=1, name="A", email="a@test.com", age=20, role="user")
+    with patch("docu_serve.responses.FAST_RESPONSES", False):
+        assert fast_response(model) is model
+    assert isinstance(fast_response(model), FastJSONResponse)
+
+
+def test_disabled_fast_response_keeps_headers():
+    """Test a response with headers is validated here and keeps them when FAST_RESPONSES=false"""
+    model = UserOut.model_construct(user_id=1, name="A", email="a@test.com", age=20, role="user")
+    with patch("docu_serve.responses.FAST_RESPONSES", False):
+        response = fast_response(model, headers={"ETag": '"2"'})
+
+    assert not isinstance(response, FastJSONResponse)
+    assert response.headers["etag"] == '"2"'
+    assert json.loads(response.body)["email"] == "a@test.com"
@@ -0,0 +1,146 @@
+# tests/test_sharding.py
+"""Tests for range sharding of users_admin, with SQLite files as shards"""
+
+from sqlalchemy import create_engine, delete, func, select, update
+from docu_serve import users
+from docu_serve.models import Base, DeletionJob, User
+from docu_serve.sharding import ShardFrozen, ShardMap, ShardRouter, split_shard
+import json
+import os
+import pytest
+
+
+def _user(user_id):
+    return User(user_id=user_id, name=f"u{user_id}", email=f"u{user_id}@test.com", age=30,
+                hashed_password="hash", role="user")
+
+
+@pytest.fixture
+def router(tmp_path):
+    primary = create_engine(f"sqlite:///{tmp_path}/primary.db")
+    Base.metadata.create_all(bind=primary)
+    shard_map = {"shards": [{"name": "low", "url": f"sqlite:///{tmp_path}/low.db", "min_user_id": 0},
+                            {"name": "high", "url": f"sqlite:///{tmp_path}/high.db", "min_user_id": 100}]}
+    path = tmp_path / "shards.json"
+    path.write_text(json.dumps(shard_map))
+    router = ShardRouter.from_file(primary, str(path), reload_seconds=0)
+    router.create_all(Base.metadata)
+    with router.session() as db:
+        db.add_all([_user(1), _user(2), _user(150)])
+        db.commit()
+    return router
+
+
+def _ids_on(router, shard):
+    with router.engines[shard].connect() as conn:
+        return sorted(conn.execute(select(User.user_id)).scalars())
+
+
+def test_inserts_land_on_owning_shard(router):
+    """Test each user row is stored on the shard owning its id range"""
+    assert _ids_on(router, "low") == [1, 2]
+    assert _ids_on(router, "high") == [150]
+
+
+def test_lookups_updates_and_deletes_route_by_id(router):
+    """Test single-user statements reach the right shard"""
+    with router.session() as db:
+        assert db.get(User, 150).name == "u150"
+        row = db.execute(update(User).where(User.user_id == 150).values(age=31)
+                         .returning(User.age).execution_options(synchronize_session=False)).first()
+        assert row.age == 31
+        db.delete(db.query(User).filter(User.user_id == 2).first())
+        db.commit()
+
+    assert _ids_on(router, "low") == [1]
+
+
+def test_scatter_gather_for_cross_shard_queries(router):
+    """Test statements without user_id criteria run on every shard"""
+    with router.session() as db:
+        assert sum(db.execute(select(func.count()).select_from(User)).scalars()) == 3
+        assert sorted(db.execute(select(User.user_id).where(User.age == 30)).scalars()) == [1, 2, 150]
+        db.execute(delete(User).where(User.user_id.in_([1, 150])).execution_options(synchronize_session=False))
+        db.commit()
+
+    assert _ids_on(router, "low") + _ids_on(router, "high") == [2]
+
+
+def test_other_tables_stay_on_primary(router):
+    """Test non-user tables are not sharded"""
+    with router.session() as db:
+        db.add(DeletionJob(job_id="j", status="queued", requested_by="a", total=0, processed=0, deleted=0,
+                           not_found=0, elapsed_seconds=0.0, created_at=0.0))
+        db.commit()
+
+    with router.primary.connect() as conn:
+        assert conn.execute(select(DeletionJob.job_id)).scalar() == "j"
+
+
+def test_frozen_range_rejects_writes_but_serves_reads(router):
+    """Test writes into a range being moved raise ShardFrozen"""
+    shard_map = ShardMap(router.map.shards, [(100, None)])
+    with open(router.path, "w") as f:
+        f.write(shard_map.to_json())
+    os.utime(router.path, (0, 0))
+
+    with router.session() as db:
+        assert db.get(User, 150) is not None
+        with pytest.raises(ShardFrozen):
+            db.execute(update(User).where(User.user_id == 150).values(age=1))
+        db.execute(update(User).where(User.user_id == 1).values(age=1))
+        db.rollback()
+
+
+def test_frozen_range_rejects_orm_delete_and_update(router):
+    """Test flushing a loaded user in a frozen range raises ShardFrozen and leaves the row"""
+    shard_map = ShardMap(router.map.shards, [(100, None)])
+    with open(router.path, "w") as f:
+        f.write(shard_map.to_json())
+    os.utime(router.path, (0, 0))
+
+    with router.session() as db:
+        db.delete(db.get(User, 150))
+        with pytest.raises(ShardFrozen):
+            db.commit()
+        db.rollback()
+        db.get(User, 150).age = 1
+        with pytest.raises(ShardFrozen):
+            db.commit()
+        db.rollback()
+        db.get(User, 1).age = 1
+        db.commit()
+    with router.session() as db:
+        assert db.get(User, 150).age != 1
+
+
+def test_split_moves_range_to_new_shard(router, tmp_path):
+    """Test splitting copies the upper range, reroutes it and cleans the old shard"""
+    with router.session() as db:
+        db.add_all([_user(120), _user(180)])
+        db.commit()
+
+    result = split_shard(router.path, "high", 170, "top", f"sqlite:///{tmp_path}/top.db", settle_seconds=0)
+
+    assert result["copied"] == 1
+    assert _ids_on(router, "high") == [120, 150]
+    router.current()
+    assert _ids_on(router, "top") == [180]
+    assert router.map.frozen == []
+    with router.session() as db:
+        assert db.get(User, 180).name == "u180"
+        assert sum(db.execute(select(func.count()).select_from(User)).scalars()) == 5
+
+
+def test_split_rejects_boundary_outside_shard(router, tmp_path):
+    """Test the split point must fall inside the shard's range"""
+    with pytest.raises(ValueError):
+        split_shard(router.path, "low", 150, "x", f"sqlite:///{tmp_path}/x.db", settle_seconds=0)
+
+
+def test_email_uniqueness_is_checked_across_shards(router):
+    """Test a write can see an email held on another shard, which its own unique index can't"""
+    with router.session() as db:
+        assert users.email_taken(db, "u150@test.com", 1)
+        assert not users.email_taken(db, "u150@test.com", 150)
+        assert not users.email_taken(db, "free@test.com", 1)
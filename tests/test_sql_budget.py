@@ -0,0 +1,84 @@
+# tests/test_sql_budget.py
+"""Tests for per-request SQL statement counting, Server-Timing and query budgets"""
+
+from fastapi.testclient import TestClient
+from jose import jwt
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import text
+from docu_serve.database import track_queries
+from docu_serve.main import app, SECRET_KEY, ALGORITHM
+from docu_serve.metrics import MetricsMiddleware, QueryBudgetExceeded
+from docu_serve.models import User
+from tests.conftest import engine
+import logging
+import pytest
+
+
+def _admin_headers():
+    token = jwt.encode(
+        {
+            "sub": "admin@example.com",
+            "role": "admin",
+            "aud": "delete-service",
+            "exp": datetime.now(timezone.utc) + timedelta(minutes=30)
+        },
+        SECRET_KEY,
+        algorithm=ALGORITHM
+    )
+    return {"Authorization": f"Bearer {token}"}
+
+
+def _make_user(db_session, email):
+    user = User(name="Budget", email=email, age=30, hashed_password="hash", role="user")
+    db_session.add(user)
+    db_session.commit()
+    db_session.refresh(user)
+    return user
+
+
+def test_track_queries_counts_statements():
+    """Test statements on any engine are counted inside the block only"""
+    with engine.connect() as conn:
+        with track_queries() as stats:
+            conn.execute(text("SELECT 1"))
+            conn.execute(text("SELECT 2"))
+        conn.execute(text("SELECT 3"))
+
+    assert stats.count == 2
+    assert stats.seconds > 0
+
+
+def test_server_timing_header(client, db_session):
+    """Test the response reports DB statement count and phase durations"""
+    user = _make_user(db_session, "timing@test.com")
+
+    response = client.patch(f"/api/admin/users/{user.user_id}", json={"age": 31}, headers=_admin_headers())
+
+    assert response.status_code == 200
+    timing = response.headers["server-timing"]
+    assert 'desc="1 queries"' in timing
+    assert "jwt;dur=" in timing
+    assert "publish;dur=" in timing
+
+
+def test_budget_exceeded_raises_in_raise_mode(db_session):
+    """Test a route over budget fails loudly so CI catches N+1 regressions"""
+    user = _make_user(db_session, "overbudget@test.com")
+    strict = TestClient(MetricsMiddleware(app, query_budgets={"DELETE /api/admin/delete/{user_id}": 1},
+                                          budget_mode="raise"))
+
+    with pytest.raises(QueryBudgetExceeded, match="issued 2 SQL statements, budget is 1"):
+        strict.delete(f"/api/admin/delete/{user.user_id}", headers=_admin_headers())
+
+
+def test_budget_exceeded_logs_in_log_mode(db_session, caplog):
+    """Test log mode only warns and the request still succeeds"""
+    user = _make_user(db_session, "logbudget@test.com")
+    lenient = TestClient(MetricsMiddleware(app, query_budgets={"DELETE /api/admin/delete/{user_id}": 1},
+                                           budget_mode="log"))
+
+    with caplog.at_level(logging.WARNING, logger="docu_serve.metrics"):
+        response = lenient.delete(f"/api/admin/delete/{user.user_id}", headers=_admin_headers())
+
+    assert response.status_code == 200
+    assert "budget is 1" in caplog.text
@@ -0,0 +1,147 @@
+# tests/test_tracing.py
+"""Tests for request -> publish -> worker trace propagation"""
+
+from unittest.mock import AsyncMock, MagicMock, patch
+from jose import jwt
+from datetime import datetime, timedelta, timezone
+from docu_serve import tracing
+from docu_serve.main import SECRET_KEY, ALGORITHM, _publish_to_rabbitmq
+from docu_serve.models import User
+import asyncio
+import json
+import pytest
+
+import worker
+
+
+class ListSink:
+    def __init__(self):
+        self.spans = []
+
+    def write(self, spans):
+        self.spans.extend(span.to_dict() for span in spans)
+
+
+@pytest.fixture
+def sink(monkeypatch):
+    """Enable tracing with every trace sampled and spans kept in memory"""
+    monkeypatch.setattr(tracing, "TRACE_SAMPLE_RATE", 1.0)
+    sink = ListSink()
+    tracing.configure(sink=sink)
+    yield sink
+    tracing.configure(exporter="none")
+
+
+def _admin_token():
+    return jwt.encode(
+        {
+            "sub": "admin@example.com",
+            "role": "admin",
+            "aud": "delete-service",
+            "exp": datetime.now(timezone.utc) + timedelta(minutes=30)
+        },
+        SECRET_KEY,
+        algorithm=ALGORITHM
+    )
+
+
+def test_traceparent_round_trip():
+    """Test W3C traceparent parsing and formatting"""
+    header = "00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01"
+    span = tracing.parse_traceparent(header)
+    assert span.traceparent() == header
+    assert span.sampled is True
+    for bad in (None, "", "00-xyz-00f067aa0ba902b7-01", "00-" + "0" * 32 + "-00f067aa0ba902b7-01"):
+        assert tracing.parse_traceparent(bad) is None
+
+
+def test_disabled_tracing_is_noop():
+    """Test spans cost nothing and propagate nothing when no exporter is configured"""
+    with tracing.start_span("anything") as span:
+        assert span is None
+        assert tracing.current_traceparent() is None
+
+
+def test_unsampled_trace_records_nothing(sink, monkeypatch):
+    """Test unsampled roots propagate context but children reuse the root span"""
+    monkeypatch.setattr(tracing, "TRACE_SAMPLE_RATE", 0.0)
+    with tracing.start_span("root") as root:
+        with tracing.start_span("child") as child:
+            assert child is root
+            assert tracing.current_traceparent().endswith("-00")
+    tracing.shutdown()
+    assert sink.spans == []
+
+
+def test_request_spans_continue_incoming_trace(client, db_session, sink):
+    """Test the API continues a client trace with auth and DB child spans"""
+    user = User(name="Traced", email="traced@test.com", age=30, hashed_password="hash", role="user")
+    db_session.add(user)
+    db_session.commit()
+    db_session.refresh(user)
+
+    trace_id = "4bf92f3577b34da6a3ce929d0e0e4736"
+    response = client.patch(
+        f"/api/admin/users/{user.user_id}",
+        json={"name": "Traced Again"},
+        headers={"Authorization": f"Bearer {_admin_token()}",
+                 "traceparent": f"00-{trace_id}-00f067aa0ba902b7-01"}
+    )
+    tracing.shutdown()
+
+    assert response.status_code == 200
+    assert response.headers["x-trace-id"] == trace_id
+    names = {span["name"] for span in sink.spans if span["trace_id"] == trace_id}
+    assert "PATCH /api/admin/users/{user_id}" in names
+    assert "auth.jwt" in names
+    assert "db.query" in names
+
+
+def test_publish_injects_traceparent(sink):
+    """Test the AMQP message carries the current trace context"""
+    exchange = MagicMock()
+    exchange.publish = AsyncMock()
+    channel = MagicMock()
+    channel.declare_exchange = AsyncMock(return_value=exchange)
+    connection = MagicMock()
+    connection.channel = AsyncMock(return_value=channel)
+    connection.close = AsyncMock()
+
+    async def test_async():
+        with patch("docu_serve.main.get_rabbitmq_connection", AsyncMock(return_value=connection)):
+            with tracing.start_span("request") as span:
+                await _publish_to_rabbitmq("user.deleted", {"user_id": 1, "email": "a@test.com"})
+                return span
+
+    span = asyncio.run(test_async())
+    message = exchange.publish.call_args[0][0]
+    assert tracing.parse_traceparent(message.headers["traceparent"]).trace_id == span.trace_id
+    # An id per event for the worker's redelivery dedup
+    assert len(message.message_id) == 32
+
+
+def test_worker_continues_trace(sink):
+    """Test the worker records decode, DB write and ack under the publisher's trace"""
+    trace_id = "0af7651916cd43dd8448eb211c80319c"
+    message = MagicMock()
+    message.routing_key = "user.created"
+    message.content_type = "application/json"
+    message.headers = {"traceparent": f"00-{trace_id}-b7ad6b7169203331-01"}
+    message.body = json.dumps({"user_id": 5, "name": "W", "email": "w@test.com",
+                               "age": 20, "hashed_password": "x"}).encode()
+    message.ack = AsyncMock()
+    process = MagicMock()
+    process.__aenter__ = AsyncMock(return_value=message)
+    process.__aexit__ = AsyncMock(return_value=False)
+    message.process = MagicMock(return_value=process)
+
+    with patch("worker.sync_user"):
+        asyncio.run(worker.on_message(message))
+    tracing.shutdown()
+
+    spans = [span for span in sink.spans if span["trace_id"] == trace_id]
+    by_name = {span["name"]: span for span in spans}
+    assert {"worker.process", "event.decode", "db.write", "amqp.ack"} <= set(by_name)
+    assert by_name["worker.process"]["parent_span_id"] == "b7ad6b7169203331"
+    assert by_name["amqp.ack"]["parent_span_id"] == by_name["worker.process"]["span_id"]
+    message.ack.assert_awaited_once()
@@ -211,4 +211,98 @@ def test_patch_duplicate_email(client, db_session):
     )
     
     assert response.status_code == 409
-    assert "already exists" in response.json()["detail"].lower()
\ No newline at end of file
+    assert "already exists" in response.json()["detail"].lower()
+
+def _admin_token():
+    return jwt.encode(
+        {
+            "sub": "admin@example.com",
+            "role": "admin",
+            "aud": "delete-service",
+            "exp": datetime.now(timezone.utc) + timedelta(minutes=30)
+        },
+        SECRET_KEY,
+        algorithm=ALGORITHM
+    )
+
+
+def test_patch_returns_etag_and_bumps_version(client, db_session):
+    """Test each update returns the new version as the ETag"""
+    user = User(name="Etag", email="etag@test.com", age=30, hashed_password="hash", role="user")
+    db_session.add(user)
+    db_session.commit()
+    db_session.refresh(user)
+    headers = {"Authorization": f"Bearer {_admin_token()}"}
+
+    first = client.patch(f"/api/admin/users/{user.user_id}", json={"age": 31}, headers=headers)
+    second = client.patch(f"/api/admin/users/{user.user_id}", json={"age": 32}, headers=headers)
+
+    assert first.headers["etag"] == '"2"'
+    assert second.headers["etag"] == '"3"'
+
+
+def test_patch_if_match_current_version_succeeds(client, db_session):
+    """Test If-Match with the current ETag applies the update"""
+    user = User(name="Match", email="match@test.com", age=30, hashed_password="hash", role="user")
+    db_session.add(user)
+    db_session.commit()
+    db_session.refresh(user)
+
+    response = client.patch(
+        f"/api/admin/users/{user.user_id}",
+        json={"name": "Matched"},
+        headers={"Authorization": f"Bearer {_admin_token()}", "If-Match": '"1"'}
+    )
+
+    assert response.status_code == 200
+    assert response.json()["name"] == "Matched"
+    assert response.headers["etag"] == '"2"'
+
+
+def test_patch_if_match_stale_version_is_rejected(client, db_session, mock_publish_event):
+    """Test a stale If-Match gets 412 with the current ETag and changes nothing"""
+    user = User(name="Stale", email="stale@test.com", age=30, hashed_password="hash", role="user")
+    db_session.add(user)
+    db_session.commit()
+    db_session.refresh(user)
+    headers = {"Authorization": f"Bearer {_admin_token()}"}
+
+    client.patch(f"/api/admin/users/{user.user_id}", json={"age": 40}, headers=headers)
+    response = client.patch(
+        f"/api/admin/users/{user.user_id}",
+        json={"age": 50},
+        headers={**headers, "If-Match": '"1"'}
+    )
+
+    assert response.status_code == 412
+    assert response.headers["etag"] == '"2"'
+    assert mock_publish_event.await_count == 1
+    db_session.expire_all()
+    assert db_session.get(User, user.user_id).age == 40
+
+
+def test_patch_if_match_weak_etag_never_matches(client, db_session):
+    """Test If-Match uses strong comparison, so a weak tag is a 412"""
+    user = User(name="Weak", email="weak@test.com", age=30, hashed_password="hash", role="user")
+    db_session.add(user)
+    db_session.commit()
+    db_session.refresh(user)
+
+    response = client.patch(
+        f"/api/admin/users/{user.user_id}",
+        json={"age": 31},
+        headers={"Authorization": f"Bearer {_admin_token()}", "If-Match": 'W/"1"'}
+    )
+
+    assert response.status_code == 412
+
+
+def test_patch_if_match_nonexistent_user(client):
+    """Test If-Match on a missing user is still a 404"""
+    response = client.patch(
+        "/api/admin/users/99999",
+        json={"age": 31},
+        headers={"Authorization": f"Bearer {_admin_token()}", "If-Match": '"1"'}
+    )
+
+    assert response.status_code == 404
@@ -0,0 +1,113 @@
+# tests/test_warmup.py
+"""Tests for startup warm-up and readiness gating"""
+
+from unittest.mock import AsyncMock, MagicMock, patch
+from sqlalchemy import create_engine
+from docu_serve import main
+from docu_serve.warmup import Warmup, fill_pool
+import asyncio
+
+
+async def _ok():
+    await asyncio.sleep(0.01)
+    return {"connections": 2}
+
+
+async def _broken():
+    raise RuntimeError("connection refused")
+
+
+def test_ready_only_after_warmup(client, monkeypatch):
+    """Test /health/ready is 503 while warming up, then 200 with per-step timing"""
+    warmup = Warmup({"database": _ok, "broker": _ok})
+    monkeypatch.setattr(main, "warmup", warmup)
+
+    response = client.get("/health/ready")
+    assert response.status_code == 503
+    assert response.json()["status"] == "warming_up"
+    assert response.json()["steps"]["database"] == {"status": "pending"}
+
+    asyncio.run(warmup.run())
+    response = client.get("/health/ready")
+    data = response.json()
+    assert response.status_code == 200
+    assert data["status"] == "ready"
+    assert data["steps"]["database"]["connections"] == 2
+    assert data["steps"]["broker"]["seconds"] >= 0.01
+    assert data["ready_after_seconds"] is not None
+
+
+def test_optional_step_failure_is_reported_but_not_gating():
+    """Test a broker outage at startup doesn't hold back readiness"""
+    warmup = Warmup({"database": _ok, "broker": _broken})
+    asyncio.run(warmup.run())
+
+    assert warmup.ready
+    assert warmup.results["broker"]["status"] == "failed: connection refused"
+
+
+def test_failed_optional_step_is_retried_after_ready():
+    """Test a broker that was down at boot still gets its warm channel once it's back"""
+    attempts = 0
+
+    async def broker():
+        nonlocal attempts
+        attempts += 1
+        if attempts < 3:
+            raise RuntimeError("connection refused")
+
+    async def start_and_wait():
+        warmup.start()
+        while warmup.results["broker"]["status"] != "ok":
+            await asyncio.sleep(0.01)
+        await warmup.stop()
+
+    warmup = Warmup({"database": _ok, "broker": broker}, retry_interval=0.01)
+    asyncio.run(asyncio.wait_for(start_and_wait(), 5))
+
+    assert warmup.ready
+    assert attempts == 3
+
+
+def test_required_step_is_retried_until_it_succeeds():
+    """Test a failed database warm-up keeps the worker unready and is retried"""
+    attempts = 0
+
+    async def flaky():
+        nonlocal attempts
+        attempts += 1
+        if attempts < 3:
+            raise RuntimeError("database starting up")
+
+    async def hanging():
+        await asyncio.sleep(10)
+
+    warmup = Warmup({"database": flaky, "auth_service": hanging}, timeout=0.05, retry_interval=0.01)
+    asyncio.run(warmup.run())
+
+    assert warmup.ready
+    assert attempts == 3
+    assert warmup.results["auth_service"]["status"] == "failed: timed out after 0.05s"
+
+
+def test_fill_pool_leaves_connections_open(tmp_path):
+    """Test the pool keeps the warmed connections checked in"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'warm.db'}", pool_size=3)
+    assert fill_pool(engine, 0) == 3
+    assert engine.pool.checkedin() == 3
+
+
+def test_publish_reuses_warm_channel(monkeypatch):
+    """Test events go out on the publisher channel opened at startup, without a new connection"""
+    exchange = MagicMock()
+    exchange.publish = AsyncMock()
+    monkeypatch.setattr(main, "publisher_connection", MagicMock(is_closed=False))
+    monkeypatch.setattr(main, "publisher_exchange", exchange)
+
+    with patch("docu_serve.main.get_rabbitmq_connection", AsyncMock()) as connect:
+        asyncio.run(main._publish_to_rabbitmq("user.deleted", *[{"user_id": 1, "email": "a@example.com"}] * 2))
+
+    connect.assert_not_called()
+    # Equal bodies are still separate events to a consumer deduplicating on message_id
+    ids = {call.args[0].message_id for call in exchange.publish.await_args_list}
+    assert len(ids) == 2
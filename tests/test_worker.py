@@ -0,0 +1,204 @@
+# tests/test_worker.py
+"""Tests for the RabbitMQ sync worker"""
+
+from unittest.mock import AsyncMock, MagicMock, patch
+from sqlalchemy.orm import sessionmaker
+from docu_serve.dedup import ProcessedMessages
+from docu_serve.models import ProcessedMessage, User
+import asyncio
+import json
+import pytest
+
+import worker
+
+USER = {"user_id": 1, "name": "A", "email": "a@example.com", "age": 20, "hashed_password": "x"}
+
+
+@pytest.fixture(autouse=True)
+def processed(monkeypatch):
+    """A fresh dedup cache per test, so one test's messages aren't duplicates in the next"""
+    cache = ProcessedMessages(durable=False)
+    monkeypatch.setattr(worker, "processed", cache)
+    return cache
+
+
+class FakeMessage:
+    """Minimal stand-in for aio_pika.IncomingMessage"""
+
+    def __init__(self, body: dict, routing_key: str = "user.created", message_id=None):
+        self.body = json.dumps(body).encode()
+        self.routing_key = routing_key
+        self.content_type = "application/json"
+        self.acked = False
+        self.requeued = False
+        self.message_id = message_id
+
+        self.headers = {}
+
+    async def ack(self):
+        self.acked = True
+
+    async def nack(self, requeue=True):
+        self.requeued = requeue
+
+    def process(self, ignore_processed=False):
+        message = self
+
+        class _Ctx:
+            async def __aenter__(self):
+                return message
+
+            async def __aexit__(self, exc_type, exc, tb):
+                if exc_type is None and not (ignore_processed and (message.acked or message.requeued)):
+                    message.acked = True
+                return False
+
+        return _Ctx()
+
+
+def test_in_flight_tracker_idle_by_default():
+    """Test tracker reports idle when nothing is processing"""
+    async def test_async():
+        tracker = worker.InFlightTracker()
+        assert await tracker.wait_idle(0.01) is True
+
+    asyncio.run(test_async())
+
+
+def test_drain_waits_for_in_flight_message():
+    """Test drain cancels the consumer and waits for the in-flight message to finish"""
+    async def test_async():
+        tracker = worker.InFlightTracker()
+        queue = MagicMock()
+        queue.cancel = AsyncMock()
+
+        async def slow_handler():
+            with tracker:
+                await asyncio.sleep(0.05)
+
+        task = asyncio.create_task(slow_handler())
+        await asyncio.sleep(0)
+        assert tracker.count == 1
+
+        drained = await worker.drain(queue, "ctag", tracker, timeout=1.0)
+
+        assert drained is True
+        assert task.done()
+        queue.cancel.assert_awaited_once_with("ctag")
+
+    asyncio.run(test_async())
+
+
+def test_drain_times_out():
+    """Test drain gives up after the deadline and reports it"""
+    async def test_async():
+        tracker = worker.InFlightTracker()
+        queue = MagicMock()
+        queue.cancel = AsyncMock()
+
+        with tracker:
+            drained = await worker.drain(queue, "ctag", tracker, timeout=0.01)
+
+        assert drained is False
+
+    asyncio.run(test_async())
+
+
+def test_on_message_syncs_and_acks():
+    """Test on_message runs the DB sync and acks the message"""
+    async def test_async():
+        message = FakeMessage({"user_id": 1, "name": "A", "email": "a@test.com",
+                               "age": 20, "hashed_password": "x"})
+        with patch("worker.sync_user") as mock_sync:
+            await worker.on_message(message)
+
+        mock_sync.assert_called_once()
+        assert message.acked is True
+        assert worker.in_flight.count == 0
+
+    asyncio.run(test_async())
+
+
+def test_on_message_skips_invalid_event():
+    """Test an event missing required fields is acked without touching the DB"""
+    async def test_async():
+        message = FakeMessage({"user_id": 1})
+        with patch("worker.sync_user") as mock_sync:
+            await worker.on_message(message)
+
+        mock_sync.assert_not_called()
+        assert message.acked is True
+
+    asyncio.run(test_async())
+
+
+def test_redelivered_message_is_acked_without_db_work(processed):
+    """Test a second delivery of a processed message skips decode and sync"""
+    async def test_async():
+        with patch("worker.sync_user", return_value=True) as mock_sync:
+            first, again = FakeMessage(USER), FakeMessage(USER)
+            await worker.on_message(first)
+            await worker.on_message(again)
+
+        mock_sync.assert_called_once()
+        assert first.acked and again.acked
+        assert processed.duplicates == 1
+
+    asyncio.run(test_async())
+
+
+def test_failed_sync_is_not_remembered(processed):
+    """Test a message whose DB write failed is processed again when redelivered"""
+    async def test_async():
+        with patch("worker.sync_user", return_value=False) as mock_sync:
+            await worker.on_message(FakeMessage(USER, message_id="m-1"))
+            await worker.on_message(FakeMessage(USER, message_id="m-1"))
+
+        assert mock_sync.call_count == 2
+        assert processed.duplicates == 0
+
+    asyncio.run(test_async())
+
+
+def test_lru_is_bounded_and_expires():
+    """Test the oldest ids are evicted and expired ids count as unseen"""
+    cache = ProcessedMessages(max_ids=2, durable=False)
+    for msg_id in ("a", "b", "c"):
+        cache.add(msg_id)
+    assert [cache.seen(msg_id) for msg_id in ("a", "b", "c")] == [False, True, True]
+
+    expired = ProcessedMessages(ttl=-1, durable=False)
+    expired.add("a")
+    assert expired.seen("a") is False
+
+
+def test_durable_ids_survive_a_restart(db_session, monkeypatch):
+    """Test the table catches a redelivery the new process's LRU hasn't seen"""
+    monkeypatch.setattr(worker, "SessionLocal", sessionmaker(bind=db_session.get_bind()))
+    monkeypatch.setattr(worker, "processed", ProcessedMessages(durable=True))
+    event = worker.UserCreatedEvent(**{**USER, "user_id": 880001, "email": "dedup@example.com"})
+    assert worker.sync_user(event, "durable-1") is True
+    assert db_session.get(ProcessedMessage, "durable-1") is not None
+
+    # Restarted: empty LRU, and the user is gone, so only the table can stop a re-insert
+    monkeypatch.setattr(worker, "processed", ProcessedMessages(durable=True))
+    db_session.delete(db_session.get(User, 880001))
+    db_session.commit()
+    assert worker.sync_user(event, "durable-1") is True
+    assert db_session.get(User, 880001) is None
+
+
+def test_transient_db_failure_requeues_instead_of_acking(processed, monkeypatch):
+    """Test a write blocked by a shard split's freeze goes back to the queue, not lost"""
+    monkeypatch.setattr(worker, "REQUEUE_DELAY", 0)
+
+    async def test_async():
+        message = FakeMessage(USER)
+        with patch("worker.sync_user", side_effect=worker.ShardFrozen("user_id 1 is being moved")):
+            await worker.on_message(message)
+
+        assert message.requeued is True
+        assert message.acked is False
+        assert not processed.seen(worker.fallback_message_id("user.created", message.body))
+
+    asyncio.run(test_async())
@@ -0,0 +1,80 @@
+# trace_collector.py
+"""Minimal OTLP/HTTP (JSON) collector stand-in for local tracing.
+
+Accepts POST /v1/traces from docu_serve.tracing's OTLP exporter and appends
+every span as one JSON line to --output, so traces from the API and the
+worker can be joined on trace_id without running a real collector.
+
+Usage: python trace_collector.py --port 4318 --output collected_traces.jsonl
+Then run the API/worker with TRACE_EXPORTER=otlp TRACE_OTLP_ENDPOINT=http://localhost:4318/v1/traces
+"""
+import argparse
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def flatten(payload: dict):
+    """Yield one flat dict per span from an OTLP resourceSpans payload"""
+    for resource_spans in payload.get("resourceSpans", []):
+        resource = {a["key"]: a["value"].get("stringValue")
+                    for a in resource_spans.get("resource", {}).get("attributes", [])}
+        for scope_spans in resource_spans.get("scopeSpans", []):
+            for span in scope_spans.get("spans", []):
+                yield {
+                    "service": resource.get("service.name"),
+                    "trace_id": span.get("traceId"),
+                    "span_id": span.get("spanId"),
+                    "parent_span_id": span.get("parentSpanId") or None,
+                    "name": span.get("name"),
+                    "start_time_unix_nano": int(span.get("startTimeUnixNano", 0)),
+                    "end_time_unix_nano": int(span.get("endTimeUnixNano", 0)),
+                    "attributes": {a["key"]: a["value"].get("stringValue") for a in span.get("attributes", [])},
+                    "status": span.get("status", {}),
+                }
+
+
+def make_handler(output: str):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if self.path != "/v1/traces":
+                self.send_response(404)
+                self.end_headers()
+                return
+            length = int(self.headers.get("Content-Length", 0))
+            try:
+                payload = json.loads(self.rfile.read(length))
+            except ValueError:
+                self.send_response(400)
+                self.end_headers()
+                return
+            with open(output, "a") as f:
+                for span in flatten(payload):
+                    f.write(json.dumps(span) + "\n")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.end_headers()
+            self.wfile.write(b"{}")
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=4318)
+    parser.add_argument("--output", default="collected_traces.jsonl")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(args.output))
+    print(f"Trace collector listening on {args.host}:{args.port}, writing to {args.output}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()